@@ -2,78 +2,176 @@ import json
 from pathlib import Path
 from openai import OpenAI
 import os
+import sys
+
+# 将项目根目录添加到Python路径
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from game_prompt.http_transport import get_default_transport
+from game_prompt.mood_scorer import MoodScorer
+from game_prompt.mood_estimator import LocalMoodEstimator, MoodClassifier, TrainingLog
+
+# 心情评分失败时使用的默认变化值
+DEFAULT_SCORE_CHANGE = -1
+# 评分模型的结果记录在这里，用于训练本地分类器
+TRAINING_LOG_PATH = os.path.join("logs", "mood_training.jsonl")
+# 记录达到这个数量后才训练本地分类器
+MIN_TRAINING_SAMPLES = 50
+
+
+def _parse_score(content):
+    """解析一条评分结果，缺少 score_change 时返回 None"""
+    try:
+        result = json.loads(content) if isinstance(content, str) else content
+    except json.JSONDecodeError:
+        return None
+    if not isinstance(result, dict) or not isinstance(result.get("score_change"), (int, float)):
+        return None
+    return result
+
 
 class DualAPISimulator:
-    def __init__(self):
-        # 初始化两个独立的API客户端
-        self.main_client = OpenAI( base_url="https://api.deepseek.com")
-        self.mood_client = OpenAI(base_url="https://api.deepseek.com")
-        
+    def __init__(self, transport=None, scorer=None, batch_size=1, estimator=None, training_log=None):
+        # 初始化两个API客户端，共用同一个连接池以复用到api.deepseek.com的长连接
+        http_client = (transport or get_default_transport()).openai_http_client()
+        self.main_client = OpenAI(base_url="https://api.deepseek.com", http_client=http_client)
+        self.mood_client = OpenAI(base_url="https://api.deepseek.com", http_client=http_client)
+
         # 从本地加载prompt
         self.main_prompt = Path("F:\Agent\InnoTech\\api_test\mainprompt.txt").read_text(encoding='utf-8')
         self.mood_prompt = Path("F:\Agent\InnoTech\\api_test\moodprompt.txt").read_text(encoding='utf-8')
-        
+
         # 初始化状态
         self.conversation = [{"role": "system", "content": self.main_prompt}]
         self.mood_score = 50
+        # 告诉主模型当前心情值的系统消息，心情值变化时原地更新，不在历史中重复追加
+        self._mood_message = None
 
-    def run(self):
-        print(f"初始心情值: {self.mood_score}")
-        
-        while True:
-            # 获取用户输入
-            user_input = input("\n警方指令: ").strip()
-            if user_input.lower() == "quit":
-                break
-            
-            # 1. 主API生成回复
-            self.conversation.append({"role": "user", "content": user_input})
-            main_response = self.main_client.chat.completions.create(
-                model="deepseek-chat",
-                messages=self.conversation,
-                response_format={"type": "json_object"}
-            )
-            doctor_reply = json.loads(main_response.choices[0].message.content)
-            self.conversation.append({"role": "assistant", "content": main_response.choices[0].message.content})
-            
-            print(f"\n[医生行动] {json.dumps(doctor_reply, indent=2, ensure_ascii=False)}")
-            
-            # 2. 心情API评分
-            mood_input = {
-                "user_input": user_input,
-                "llm_response": doctor_reply["speak"],
-                "current_mood": self.mood_score
-            }
-            
+        # 心情评分在后台进行，结果在下一轮请求前应用，玩家不需要等待评分模型；
+        # 多个会话可以共用一个 scorer，batch_size 大于 1 时合并多个会话的评分请求
+        # 共用的 scorer 由创建者关闭，只有自己创建的才在结束时关闭
+        self._owns_scorer = scorer is None
+        self.scorer = scorer or MoodScorer(self.score_batch, batch_size=batch_size)
+        self.session_id = id(self)
+
+        # 大部分轮次由本地按评分规则和分类器给出结果，只有不确定的轮次请求评分模型；
+        # 评分模型的结果记录下来，积累足够后用于训练分类器
+        self.training_log = training_log or TrainingLog(TRAINING_LOG_PATH)
+        if estimator is None:
+            samples = self.training_log.load()
+            classifier = MoodClassifier().fit(samples) if len(samples) >= MIN_TRAINING_SAMPLES else None
+            estimator = LocalMoodEstimator(classifier=classifier)
+        self.estimator = estimator
+        self._local_results = []
+
+    def score_batch(self, mood_inputs):
+        """
+        请求心情评分，多条输入合并为一次请求
+
+        Args:
+            mood_inputs: 评分输入列表
+
+        Returns:
+            与输入一一对应的评分结果，无法解析的位置为 None
+        """
+        if len(mood_inputs) == 1:
             # 确保心情prompt明确要求score_change字段
-            mood_prompt_with_format = (
-                self.mood_prompt + 
-                "\n请务必包含'score_change'字段在你的JSON响应中。"
+            system = self.mood_prompt + "\n请务必包含'score_change'字段在你的JSON响应中。"
+            content = json.dumps(mood_inputs[0], ensure_ascii=False)
+        else:
+            system = (
+                self.mood_prompt +
+                "\n本次输入的 items 中有多条互相独立的记录，请逐条评分，"
+                "返回 {\"results\": [...]}，results 按输入顺序每条包含'score_change'和'reason'字段。"
             )
-            
-            mood_response = self.mood_client.chat.completions.create(
-                model="deepseek-chat",
-                messages=[
-                    {"role": "system", "content": mood_prompt_with_format},
-                    {"role": "user", "content": json.dumps(mood_input)}
-                ],
-                response_format={"type": "json_object"}
-            )
-            
+            content = json.dumps({"items": mood_inputs}, ensure_ascii=False)
+
+        mood_response = self.mood_client.chat.completions.create(
+            model="deepseek-chat",
+            messages=[
+                {"role": "system", "content": system},
+                {"role": "user", "content": content}
+            ],
+            response_format={"type": "json_object"}
+        )
+        content = mood_response.choices[0].message.content
+
+        if len(mood_inputs) == 1:
+            results = [_parse_score(content)]
+        else:
             try:
-                mood_result = json.loads(mood_response.choices[0].message.content)
-                if "score_change" not in mood_result:
-                    raise ValueError("心情API响应缺少score_change字段")
-                
-                self.mood_score += mood_result["score_change"]
-                print(f"\n[心情系统] 变化: {mood_result['score_change']:+} (原因: {mood_result.get('reason', '无说明')})")
-                print(f"当前心情值: {self.mood_score}")
-                
-            except (KeyError, json.JSONDecodeError) as e:
-                print(f"\n[错误] 心情评分失败: {e}")
-                print("使用默认变化值: -1")
-                self.mood_score -= 1  # 默认变化
+                results = [_parse_score(result) for result in json.loads(content).get("results", [])[:len(mood_inputs)]]
+            except (AttributeError, json.JSONDecodeError):
+                results = []
+        for mood_input, result in zip(mood_inputs, results):
+            if result is not None:
+                self.training_log.append(mood_input, result)
+        return results
+
+    def apply_mood_results(self):
+        """应用本地和后台已完成的评分，心情值变化时告诉主模型，在下一轮回复中体现"""
+        old_score = self.mood_score
+        results, self._local_results = self._local_results + self.scorer.collect(self.session_id), []
+        for mood_result in results:
+            if mood_result is None:
+                print("\n[错误] 心情评分失败")
+                print(f"使用默认变化值: {DEFAULT_SCORE_CHANGE}")
+                self.mood_score += DEFAULT_SCORE_CHANGE  # 默认变化
+                continue
+            self.mood_score += mood_result["score_change"]
+            print(f"\n[心情系统] 变化: {mood_result['score_change']:+} (原因: {mood_result.get('reason', '无说明')})")
+
+        if self.mood_score != old_score:
+            print(f"当前心情值: {self.mood_score}")
+            content = f"你当前的心情值为: {self.mood_score}"
+            if self._mood_message is None:
+                self._mood_message = {"role": "system", "content": content}
+                self.conversation.append(self._mood_message)
+            else:
+                self._mood_message["content"] = content
+
+    def run(self):
+        print(f"初始心情值: {self.mood_score}")
+
+        try:
+            while True:
+                # 获取用户输入
+                user_input = input("\n警方指令: ").strip()
+                if user_input.lower() == "quit":
+                    break
+
+                # 应用上一轮在后台完成的心情评分
+                self.apply_mood_results()
+
+                # 1. 主API生成回复
+                self.conversation.append({"role": "user", "content": user_input})
+                main_response = self.main_client.chat.completions.create(
+                    model="deepseek-chat",
+                    messages=self.conversation,
+                    response_format={"type": "json_object"}
+                )
+                doctor_reply = json.loads(main_response.choices[0].message.content)
+                self.conversation.append({"role": "assistant", "content": main_response.choices[0].message.content})
+
+                print(f"\n[医生行动] {json.dumps(doctor_reply, indent=2, ensure_ascii=False)}")
+
+                # 2. 心情评分：本地能确定时直接得到结果；否则提交给心情API后立即返回，
+                #    与播放回复和等待下一条指令同时进行
+                mood_input = {
+                    "user_input": user_input,
+                    "llm_response": doctor_reply["speak"],
+                    "current_mood": self.mood_score
+                }
+                mood_result, _ = self.estimator.estimate(mood_input)
+                if mood_result is not None:
+                    self._local_results.append(mood_result)
+                else:
+                    self.scorer.submit(self.session_id, mood_input)
+        finally:
+            if self._owns_scorer:
+                self.scorer.close()
+            print(f"心情评分统计: {self.scorer.stats()}")
+            print(f"本地评分统计: {self.estimator.stats()}")
 
 if __name__ == "__main__":
     simulator = DualAPISimulator()
-    simulator.run()
\ No newline at end of file
+    simulator.run()
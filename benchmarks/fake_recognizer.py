@@ -0,0 +1,158 @@
+import os
+import random
+import struct
+import sys
+import threading
+import time
+import wave
+from typing import Callable, List, Optional, Sequence, Tuple, Union
+
+# 将项目根目录添加到Python路径
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from voice2text.vad import EnergyVAD
+
+# 与 voice2text.audio_recorder 的录音参数一致（不导入该模块，评测时不需要安装 dashscope 和 pyaudio）
+sample_rate = 16000
+block_size = 3200
+
+
+def load_pcm(path: str) -> bytes:
+    """
+    读取 16kHz 16 位单声道音频，支持原始 PCM 和 WAV 文件
+
+    Args:
+        path: 文件路径
+
+    Returns:
+        PCM 数据
+    """
+    if path.lower().endswith(".wav"):
+        with wave.open(path, "rb") as f:
+            return f.readframes(f.getnframes())
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def synthetic_utterance(seconds: float, lead_silence: float = 0.4, tail_silence: float = 1.2, seed: int = 0) -> bytes:
+    """
+    生成一段类似说话的音频：前后为低电平噪声，中间为高电平噪声，用于没有录音文件时的评测
+
+    Args:
+        seconds: 说话部分的时长
+        lead_silence: 说话前的静音时长
+        tail_silence: 说话后的静音时长
+        seed: 随机数种子
+
+    Returns:
+        16kHz 16 位单声道 PCM 数据
+    """
+    rng = random.Random(seed)
+
+    def noise(duration, amplitude):
+        count = int(duration * sample_rate)
+        return struct.pack(f"<{count}h", *(int(rng.gauss(0, amplitude)) for _ in range(count)))
+
+    return noise(lead_silence, 40) + noise(seconds, 3000) + noise(tail_silence, 40)
+
+
+class PlaybackRecognizer:
+    """
+    模拟的语音识别会话，接口与 VoiceSession 相同：按实时速度回放音频，经过本地语音活动检测，
+    说话过程中按进度回调脚本文本的前缀作为中间结果，说话结束后回调完整文本
+    """
+
+    def __init__(
+        self,
+        utterances: Sequence[Tuple[Union[str, bytes], str]],
+        on_sentence_end_callback: Optional[Callable[[str], None]] = None,
+        on_partial_callback: Optional[Callable[[str], None]] = None,
+        speed: float = 1.0,
+        final_latency: float = 0.2,
+        partial_every: int = 2,
+    ):
+        """
+        Args:
+            utterances: (音频, 识别文本) 列表，音频为 PCM/WAV 文件路径或 PCM 数据
+            on_sentence_end_callback: 句子结束时的回调，参数为完整文本
+            on_partial_callback: 中间结果的回调，参数为当前的文本前缀
+            speed: 回放速度，1.0 为实时
+            final_latency: 说话结束到回调完整文本的延迟（模拟识别服务判断句尾的耗时）
+            partial_every: 每发送多少个音频块回调一次中间结果
+        """
+        self.utterances: List[Tuple[bytes, str]] = [
+            (load_pcm(audio) if isinstance(audio, str) else audio, text) for audio, text in utterances
+        ]
+        self.on_sentence_end_callback = on_sentence_end_callback
+        self.on_partial_callback = on_partial_callback
+        self.speed = speed
+        self.final_latency = final_latency
+        self.partial_every = partial_every
+        self.vad = EnergyVAD()
+        self.sentence_end_times: List[float] = []  # 每句话最后一个语音块的回放时刻，用于计算端到端延迟
+        self._listening = threading.Event()
+        self._running = False
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        self._running = True
+        self._listening.set()
+        self._thread = threading.Thread(target=self._playback_loop, daemon=True)
+        self._thread.start()
+
+    def pause(self):
+        self._listening.clear()
+
+    def resume(self):
+        self.vad.reset()
+        self._listening.set()
+
+    def stop(self):
+        self._running = False
+        self._listening.set()
+        if self._thread is not None:
+            self._thread.join(timeout=1.0)
+
+    def stats(self):
+        return {"sent_blocks": self.vad.sent_blocks, "dropped_blocks": self.vad.dropped_blocks}
+
+    def wait(self, timeout: Optional[float] = None):
+        """等待所有音频回放完毕"""
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _playback_loop(self):
+        block_bytes = block_size * 2
+        block_seconds = block_size / sample_rate / self.speed
+        for pcm, text in self.utterances:
+            # 上一句的回应结束（恢复识别）后才开始播放下一句
+            self._listening.wait()
+            if not self._running:
+                return
+            blocks = [pcm[i:i + block_bytes] for i in range(0, len(pcm), block_bytes)]
+            speech_blocks = sum(1 for block in blocks if self.vad.is_speech(block)) or 1
+            self.vad.reset()
+            sent = 0
+            spoken = False
+            next_time = time.perf_counter()
+            for block in blocks:
+                next_time += block_seconds
+                time.sleep(max(0.0, next_time - time.perf_counter()))
+                if not self._running:
+                    return
+                if not self._listening.is_set():
+                    continue
+                was_speaking = self.vad.speaking
+                frames = self.vad.process(block)
+                if self.vad.speaking and not was_speaking:
+                    spoken = True
+                if frames and self.vad.speaking:
+                    sent += 1
+                    if self.on_partial_callback and sent % self.partial_every == 0:
+                        progress = min(1.0, sent / speech_blocks)
+                        self.on_partial_callback(text[:max(1, int(len(text) * progress))])
+                if spoken and not self.vad.speaking:
+                    break
+            self.sentence_end_times.append(time.perf_counter())
+            time.sleep(self.final_latency)
+            if self.on_sentence_end_callback:
+                self.on_sentence_end_callback(text)
@@ -0,0 +1,282 @@
+import hashlib
+import io
+import json
+import math
+import random
+import struct
+import threading
+import time
+import wave
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional
+
+# 模拟对话服务返回的台词，按用户输入的哈希选择，保证同一输入得到同一响应
+DEFAULT_LINES = [
+    "谁...谁在那里？你能听到我说话吗？",
+    "我现在很害怕，门外好像有什么东西。",
+    "好的，我听你的，我先去看看那张桌子。",
+    "等一下...我好像听到了脚步声，我们得快点。",
+]
+
+
+class MockBehavior:
+    """模拟服务的行为配置：首字节延迟、生成速率和故障注入，随机数使用固定种子，结果可复现"""
+
+    def __init__(
+        self,
+        latency: float = 0.2,
+        jitter: float = 0.0,
+        tokens_per_second: float = 50.0,
+        failure_rate: float = 0.0,
+        stall_rate: float = 0.0,
+        stall_seconds: float = 2.0,
+        seed: int = 0,
+    ):
+        """
+        Args:
+            latency: 收到请求到返回第一个字节的秒数
+            jitter: 延迟的随机抖动上限（秒）
+            tokens_per_second: 对话服务每秒生成的令牌数；语音服务为相对实时的倍速（如 4.0 表示 4 倍于播放速度）
+            failure_rate: 返回 500 错误的概率
+            stall_rate: 额外停顿 stall_seconds 的概率，用于模拟服务商的长尾延迟
+            stall_seconds: 停顿的秒数
+            seed: 随机数种子
+        """
+        self.latency = latency
+        self.jitter = jitter
+        self.tokens_per_second = tokens_per_second
+        self.failure_rate = failure_rate
+        self.stall_rate = stall_rate
+        self.stall_seconds = stall_seconds
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def draw(self):
+        """
+        为一次请求抽取行为
+
+        Returns:
+            (是否失败, 首字节延迟秒数)
+        """
+        with self._lock:
+            failed = self._random.random() < self.failure_rate
+            delay = self.latency + self._random.uniform(0, self.jitter)
+            if self._random.random() < self.stall_rate:
+                delay += self.stall_seconds
+        return failed, delay
+
+
+class MockServer:
+    """
+    本地模拟服务，提供 OpenAI 兼容的 /v1/chat/completions（含 SSE 流式）和 /v1/audio/speech 接口，
+    用于在没有 API 密钥和网络时测试和评测对话流程
+    """
+
+    def __init__(
+        self,
+        chat: Optional[MockBehavior] = None,
+        tts: Optional[MockBehavior] = None,
+        lines: Optional[List[str]] = None,
+        host: str = "127.0.0.1",
+        port: int = 0,
+    ):
+        """
+        Args:
+            chat: 对话接口的行为配置
+            tts: 语音合成接口的行为配置（tokens_per_second 表示相对实时的倍速）
+            lines: 对话接口返回的台词
+            host: 监听地址
+            port: 监听端口，为 0 时自动分配
+        """
+        self.chat = chat or MockBehavior()
+        self.tts = tts or MockBehavior(latency=0.15, tokens_per_second=4.0)
+        self.lines = lines or DEFAULT_LINES
+        self.requests = {"chat": 0, "tts": 0}
+        self._server = ThreadingHTTPServer((host, port), self._make_handler())
+        self._server.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def base_url(self) -> str:
+        """服务地址，可设置为 SILICONFLOW_BASE_URL 或 DEEPSEEK_BASE_URL"""
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self) -> "MockServer":
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self) -> "MockServer":
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+
+    def reply_for(self, messages: List[Dict[str, Any]]) -> str:
+        """
+        根据最后一条用户消息生成游戏响应（JSON 字符串）
+
+        Args:
+            messages: 请求中的消息列表
+
+        Returns:
+            与 GameAgent 期望格式一致的响应
+        """
+        user = next((m.get("content", "") for m in reversed(messages) if m.get("role") == "user"), "")
+        index = int(hashlib.md5(user.encode("utf-8")).hexdigest(), 16) % len(self.lines)
+        return json.dumps(
+            {"action": "none", "target": "none", "speak": self.lines[index], "mood": "轻微紧张"},
+            ensure_ascii=False,
+        )
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                pass
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                body = json.loads(self.rfile.read(length) or b"{}")
+                if self.path.endswith("/chat/completions"):
+                    server.requests["chat"] += 1
+                    self._chat(body)
+                elif self.path.endswith("/audio/speech"):
+                    server.requests["tts"] += 1
+                    self._speech(body)
+                else:
+                    self._send_json(404, {"error": {"message": f"unknown path {self.path}"}})
+
+            def _chat(self, body):
+                failed, delay = server.chat.draw()
+                time.sleep(delay)
+                if failed:
+                    self._send_json(500, {"error": {"message": "injected failure"}})
+                    return
+
+                content = server.reply_for(body.get("messages", []))
+                tokens = _split_tokens(content)
+                usage = {
+                    "prompt_tokens": sum(len(str(m.get("content", ""))) for m in body.get("messages", [])),
+                    "completion_tokens": len(tokens),
+                }
+                usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+                interval = 1.0 / server.chat.tokens_per_second
+                model = body.get("model", "mock")
+
+                if not body.get("stream"):
+                    time.sleep(interval * len(tokens))
+                    self._send_json(200, {
+                        "id": "mock",
+                        "object": "chat.completion",
+                        "model": model,
+                        "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+                        "usage": usage,
+                    })
+                    return
+
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                for i, token in enumerate(tokens):
+                    if i:
+                        time.sleep(interval)
+                    self._send_event({
+                        "id": "mock",
+                        "object": "chat.completion.chunk",
+                        "model": model,
+                        "choices": [{"index": 0, "delta": {"content": token}, "finish_reason": None}],
+                    })
+                self._send_event({
+                    "id": "mock",
+                    "object": "chat.completion.chunk",
+                    "model": model,
+                    "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}],
+                    "usage": usage,
+                })
+                self._send_chunk(b"data: [DONE]\n\n")
+                self._send_chunk(b"")
+
+            def _speech(self, body):
+                failed, delay = server.tts.draw()
+                time.sleep(delay)
+                if failed:
+                    self._send_json(500, {"error": {"message": "injected failure"}})
+                    return
+
+                sample_rate = body.get("sample_rate") or 44100
+                pcm = synthetic_pcm(body.get("input", ""), sample_rate)
+                if body.get("response_format") != "pcm":
+                    # 不做真实编码，mp3/opus/wav 请求都返回 WAV 数据
+                    pcm = _wav_bytes(pcm, sample_rate)
+                self.send_response(200)
+                self.send_header("Content-Type", "application/octet-stream")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                # 按 tokens_per_second 倍于实时的速度分块返回
+                chunk_bytes = sample_rate // 10 * 2
+                interval = 0.1 / server.tts.tokens_per_second
+                for offset in range(0, len(pcm), chunk_bytes):
+                    if offset:
+                        time.sleep(interval)
+                    self._send_chunk(pcm[offset:offset + chunk_bytes])
+                self._send_chunk(b"")
+
+            def _send_event(self, data):
+                self._send_chunk(f"data: {json.dumps(data, ensure_ascii=False)}\n\n".encode("utf-8"))
+
+            def _send_chunk(self, data: bytes):
+                self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+                self.wfile.flush()
+
+            def _send_json(self, status, data):
+                encoded = json.dumps(data, ensure_ascii=False).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(encoded)))
+                self.end_headers()
+                self.wfile.write(encoded)
+
+        return Handler
+
+
+def synthetic_pcm(text: str, sample_rate: int, chars_per_second: float = 5.0) -> bytes:
+    """
+    生成与文本长度相称的合成音频（16 位单声道 PCM 正弦音）
+
+    Args:
+        text: 文本
+        sample_rate: 采样率
+        chars_per_second: 每秒朗读的字符数
+
+    Returns:
+        PCM 数据
+    """
+    samples = max(1, int(len(text) / chars_per_second * sample_rate))
+    frequency = 220 + int(hashlib.md5(text.encode("utf-8")).hexdigest(), 16) % 220
+    step = 2 * math.pi * frequency / sample_rate
+    return struct.pack(f"<{samples}h", *(int(8000 * math.sin(step * i)) for i in range(samples)))
+
+
+def _wav_bytes(pcm: bytes, sample_rate: int) -> bytes:
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(sample_rate)
+        f.writeframes(pcm)
+    return buffer.getvalue()
+
+
+def _split_tokens(content: str, size: int = 2) -> List[str]:
+    """把响应切成固定长度的片段，模拟逐个令牌生成"""
+    return [content[i:i + size] for i in range(0, len(content), size)]
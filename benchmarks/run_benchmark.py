@@ -0,0 +1,257 @@
+"""
+对话流程的离线评测：启动本地模拟服务，分别评测对话（GameAgent）、语音合成（generate_voice）
+和完整的语音对话循环，输出首个令牌时间（TTFT）、首段音频时间（TTFA）和整轮延迟的百分位数。
+
+用法:
+    python -m benchmarks.run_benchmark --turns 20
+    python -m benchmarks.run_benchmark --chat-latency 0.5 --stall-rate 0.05 --json results.json
+"""
+import os
+import sys
+
+# 将项目根目录添加到Python路径
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import argparse
+import json
+import time
+from typing import Any, Dict, List
+
+from benchmarks.fake_recognizer import PlaybackRecognizer, synthetic_utterance
+from benchmarks.mock_servers import MockBehavior, MockServer
+from game_prompt.context_window import ContextWindow
+from game_prompt.game_prompts import system_prompt_env_update1, system_prompt_init
+from game_prompt.http_transport import HTTPTransport
+from game_prompt.siliconflow_api import GameAgent
+from game_prompt.speculative import SpeculativeTurns
+from text2voice.generate_voice import generate_voice, generate_voice_stream
+from text2voice.tts_pipeline import make_stream_synthesizer
+from turn_pipeline import (
+    STAGE_FIRST_DELTA,
+    STAGE_PLAYBACK_DONE,
+    STAGE_PLAYBACK_START,
+    TurnPipeline,
+)
+
+# 评测使用的玩家输入
+USER_INPUTS = [
+    "有人吗？",
+    "你现在在哪里？",
+    "看看桌子上有什么",
+    "试着打开那扇门",
+    "别害怕，我会帮你的",
+    "窗户外面能看到什么？",
+]
+
+MOCK_API_KEY = "mock"
+
+
+def summarize(samples: List[float]) -> Dict[str, Any]:
+    """
+    计算延迟样本的统计
+
+    Args:
+        samples: 延迟秒数
+
+    Returns:
+        样本数和 p50/p95/p99/平均值（毫秒）
+    """
+    if not samples:
+        return {"count": 0}
+    ordered = sorted(samples)
+
+    def percentile(p):
+        return ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))] * 1000
+
+    return {
+        "count": len(ordered),
+        "p50": percentile(50),
+        "p95": percentile(95),
+        "p99": percentile(99),
+        "mean": sum(ordered) / len(ordered) * 1000,
+    }
+
+
+def new_agent(transport: HTTPTransport) -> GameAgent:
+    agent = GameAgent(
+        api_key=MOCK_API_KEY,
+        transport=transport,
+        context_window=ContextWindow(),
+        layout="prefix_cache",
+    )
+    agent.initialize_game(system_prompt_init)
+    agent.update_environment(system_prompt_env_update1)
+    return agent
+
+
+def bench_agent(transport: HTTPTransport, turns: int) -> Dict[str, Any]:
+    """流式对话：首个 speak 增量的时间和完整响应的时间"""
+    agent = new_agent(transport)
+    ttft, total = [], []
+    for i in range(turns):
+        start = time.perf_counter()
+        first = []
+
+        def on_speak_delta(text):
+            if not first:
+                first.append(time.perf_counter() - start)
+
+        agent.process_user_input_stream(USER_INPUTS[i % len(USER_INPUTS)], on_speak_delta=on_speak_delta)
+        total.append(time.perf_counter() - start)
+        ttft.extend(first)
+    return {"ttft": summarize(ttft), "turn": summarize(total)}
+
+
+def bench_tts(transport: HTTPTransport, turns: int) -> Dict[str, Any]:
+    """语音合成：流式请求的首个音频块时间、完整时间，以及非流式请求的完整时间"""
+    ttfa, stream_total, file_total = [], [], []
+    for i in range(turns):
+        text = f"{USER_INPUTS[i % len(USER_INPUTS)]}{i}"
+        start = time.perf_counter()
+        for chunk in generate_voice_stream(
+            text, sample_rate=24000, api_key=MOCK_API_KEY, transport=transport
+        ):
+            if len(ttfa) <= i:
+                ttfa.append(time.perf_counter() - start)
+        stream_total.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        generate_voice(text, api_key=MOCK_API_KEY, transport=transport)
+        file_total.append(time.perf_counter() - start)
+    return {"ttfa": summarize(ttfa), "stream": summarize(stream_total), "file": summarize(file_total)}
+
+
+def bench_voice_loop(
+    transport: HTTPTransport,
+    turns: int,
+    speculative: bool,
+    playback_speed: float,
+    recognizer_speed: float,
+) -> Dict[str, Any]:
+    """
+    完整的语音对话循环：模拟识别 → TurnPipeline（流式对话、按句合成）→ 模拟播放。
+    各项延迟从识别结果送达（句子结束）开始计时
+    """
+    agent = new_agent(transport)
+    speculator = SpeculativeTurns(agent) if speculative else None
+    samples = {STAGE_FIRST_DELTA: [], STAGE_PLAYBACK_START: [], STAGE_PLAYBACK_DONE: []}
+
+    def play(chunks):
+        # 按 playback_speed 倍速模拟播放耗时（24kHz 16 位单声道）
+        for chunk in chunks:
+            time.sleep(len(chunk) / 48000 / playback_speed)
+
+    def on_stage(stage, turn, elapsed):
+        if stage in samples:
+            samples[stage].append(elapsed)
+        if stage == STAGE_PLAYBACK_DONE:
+            recognizer.resume()
+
+    pipeline = TurnPipeline(
+        agent,
+        make_stream_synthesizer(api_key=MOCK_API_KEY, transport=transport, sample_rate=24000),
+        play,
+        streaming=True,
+        on_stage=on_stage,
+        speculator=speculator,
+    )
+
+    def on_sentence_end(text):
+        recognizer.pause()
+        pipeline.submit(text)
+
+    utterances = [
+        (synthetic_utterance(1.0 + 0.1 * (i % 5), seed=i), USER_INPUTS[i % len(USER_INPUTS)])
+        for i in range(turns)
+    ]
+    recognizer = PlaybackRecognizer(
+        utterances,
+        on_sentence_end_callback=on_sentence_end,
+        on_partial_callback=speculator.on_partial if speculator is not None else None,
+        speed=recognizer_speed,
+    )
+    recognizer.start()
+    for _ in range(turns):
+        pipeline.run_turn(pipeline.next_input(), on_response=lambda response: None)
+    recognizer.stop()
+
+    result = {
+        "ttft": summarize(samples[STAGE_FIRST_DELTA]),
+        "ttfa": summarize(samples[STAGE_PLAYBACK_START]),
+        "turn": summarize(samples[STAGE_PLAYBACK_DONE]),
+    }
+    if speculator is not None:
+        result["speculation"] = speculator.stats()
+    return result
+
+
+def print_results(results: Dict[str, Any]):
+    for bench, metrics in results.items():
+        if bench == "config":
+            continue
+        print(f"\n[{bench}]")
+        for name, stats in metrics.items():
+            if "p50" in stats:
+                print(
+                    f"  {name:<8} n={stats['count']:<4} p50={stats['p50']:8.1f} ms  "
+                    f"p95={stats['p95']:8.1f} ms  p99={stats['p99']:8.1f} ms"
+                )
+            else:
+                print(f"  {name:<8} {stats}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="使用本地模拟服务评测对话流程的延迟")
+    parser.add_argument("--turns", type=int, default=10, help="每项评测的轮数")
+    parser.add_argument("--chat-latency", type=float, default=0.2, help="对话服务的首字节延迟（秒）")
+    parser.add_argument("--chat-jitter", type=float, default=0.05, help="对话服务延迟的抖动上限（秒）")
+    parser.add_argument("--token-rate", type=float, default=60.0, help="对话服务每秒生成的令牌数")
+    parser.add_argument("--tts-latency", type=float, default=0.15, help="语音合成服务的首字节延迟（秒）")
+    parser.add_argument("--tts-speed", type=float, default=4.0, help="语音合成相对实时的速度")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="服务返回错误的概率")
+    parser.add_argument("--stall-rate", type=float, default=0.0, help="对话服务出现长时间停顿的概率")
+    parser.add_argument("--playback-speed", type=float, default=10.0, help="模拟播放相对实时的速度")
+    parser.add_argument("--recognizer-speed", type=float, default=4.0, help="模拟识别回放录音相对实时的速度")
+    parser.add_argument("--speculative", action="store_true", help="语音循环中开启推测请求")
+    parser.add_argument("--only", choices=["agent", "tts", "voice_loop"], help="只运行一项评测")
+    parser.add_argument("--json", help="将结果写入 JSON 文件")
+    args = parser.parse_args()
+
+    server = MockServer(
+        chat=MockBehavior(
+            latency=args.chat_latency,
+            jitter=args.chat_jitter,
+            tokens_per_second=args.token_rate,
+            failure_rate=args.failure_rate,
+            stall_rate=args.stall_rate,
+        ),
+        tts=MockBehavior(
+            latency=args.tts_latency,
+            tokens_per_second=args.tts_speed,
+            failure_rate=args.failure_rate,
+            seed=1,
+        ),
+    )
+    results: Dict[str, Any] = {"config": vars(args)}
+    with server:
+        os.environ["SILICONFLOW_BASE_URL"] = server.base_url
+        transport = HTTPTransport()
+        try:
+            if args.only in (None, "agent"):
+                results["agent"] = bench_agent(transport, args.turns)
+            if args.only in (None, "tts"):
+                results["tts"] = bench_tts(transport, args.turns)
+            if args.only in (None, "voice_loop"):
+                results["voice_loop"] = bench_voice_loop(
+                    transport, args.turns, args.speculative, args.playback_speed, args.recognizer_speed
+                )
+        finally:
+            transport.close()
+
+    print_results(results)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=4)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,16 +1,55 @@
 import os
-import time
-import threading
-from game_prompt.siliconflow_api import GameAgent
+from game_prompt.siliconflow_api import GameAgent, SiliconFlowAPI, FALLBACK_SPEAK
+from game_prompt.deepseek_api import DeepSeekAPI
+from game_prompt.router import HedgedRouter
+from game_prompt.session_journal import SessionJournal
+from game_prompt.http_transport import HTTPTransport
+from game_prompt.context_window import ContextWindow
+from game_prompt.world_state import WorldState
+from game_prompt.fast_path import INTENT_COMMAND, FastPath
+from game_prompt.cascade import DEFAULT_SMALL_MODEL, ModelCascade
+from game_prompt.tracing import JSONLExporter, format_summary, load_records, summarize, tracer
 from game_prompt.game_prompts import (
     system_prompt_init,
-    system_prompt_env_update1,
-    system_prompt_env_update2,
+    scenario_hospital,
 )
 import dotenv
-from playsound import playsound
-from text2voice.generate_voice import generate_voice
-from voice2text.audio_recorder import start_voice_recognition
+from concurrent.futures import ThreadPoolExecutor
+from text2voice.tts_pipeline import (
+    DEFAULT_EMOTION_PROMPT,
+    make_file_synthesizer,
+    make_stream_synthesizer,
+    play_and_remove,
+    remove_audio_file,
+    split_sentences,
+)
+from text2voice.tts_cache import TTSCache
+from text2voice.generate_voice import prewarm_voice_cache
+from text2voice.audio_player import StreamingAudioPlayer
+
+# 是否流式播放语音：开启时音频块直接写入常驻的输出流，不经过临时文件（需要安装 PyAudio，
+# 无法打开输出设备时改为通过临时文件播放）
+STREAM_PLAYBACK = False
+# 每轮结束后自动追加保存到会话日志（只写入新增的消息和状态变化）
+AUTOSAVE = True
+# 启动时从会话日志恢复上一次的游戏，不询问玩家（为 False 时发现存档会询问是否恢复）
+RESUME_GAME = False
+SAVE_PATH = os.path.join("saves", "game")
+# 简单的输入（如"收到"、"等一下"）先由小模型回答，返回不合格或请求出错时再请求大模型。
+# 小模型的台词质量不如大模型，默认关闭
+MODEL_CASCADE = False
+# 动作以工具调用的方式返回：目标只能是当前环境中的物体 ID，不再发送 JSON 示例
+TOOL_CALLS = True
+# 记录每轮各阶段（识别、请求、首个增量、合成、播放等）的耗时和令牌用量，退出时打印 p50/p95/p99
+TRACE_TURNS = False
+TRACE_PATH = os.path.join("logs", "turns.jsonl")
+# 是否打印每轮各阶段（识别、对话、合成、播放）的耗时
+SHOW_STAGE_TIMING = False
+# 是否根据稳定的识别中间结果提前发起对话请求，最终结果不一致时取消
+SPECULATIVE_TURNS = False
+from voice2text.audio_recorder import VoiceSession
+from turn_pipeline import STAGE_PLAYBACK_DONE, TurnPipeline
+from game_prompt.speculative import SpeculativeTurns
 
 
 def main():
@@ -31,14 +70,74 @@ def main():
         print("请设置环境变量: export DASHSCOPE_API_KEY=你的API密钥")
         return
 
+    # 对话和语音合成共用同一个连接池，避免每轮重复建立 TCP/TLS 连接
+    transport = HTTPTransport()
+
+    # 同时设置了 DEEPSEEK_API_KEY 时在两个服务商之间路由：按最近的延迟选择较快的一个，
+    # 超过对冲延迟仍未开始返回时向另一个发出请求，采用先返回的结果
+    router = None
+    if os.environ.get("DEEPSEEK_API_KEY"):
+        router = HedgedRouter([
+            SiliconFlowAPI(api_key, transport=transport),
+            DeepSeekAPI(transport=transport),
+        ])
+
+    if TRACE_TURNS:
+        tracer.enable(JSONLExporter(TRACE_PATH))
+
+    # 游戏世界：在本地校验和执行动作，之后只把环境的变化告诉模型
+    world = WorldState(scenario_hospital)
+
+    def valid_target(response):
+        return world.validate(response["action"], response["target"]) is None
+
+    # 模型级联：输入中提到当前环境的物体或动作动词时直接请求大模型
+    cascade = None
+    if MODEL_CASCADE:
+        cascade = ModelCascade(
+            SiliconFlowAPI(api_key, model=DEFAULT_SMALL_MODEL, transport=transport),
+            targets=world.target_ids,
+            validator=valid_target,
+        )
+
     # 初始化游戏代理
-    agent = GameAgent(api_key=api_key)
+    # 按令牌预算管理消息历史，长时间游戏时每轮请求的长度保持稳定；
+    # 静态提示在前、环境和心情在后，使服务端的上下文缓存能够命中
+    agent = GameAgent(
+        api_key=api_key,
+        transport=transport,
+        context_window=ContextWindow(),
+        layout="prefix_cache",
+        api=router,
+        journal=SessionJournal(SAVE_PATH) if AUTOSAVE else None,
+        cascade=cascade,
+        tool_targets=world.target_ids if TOOL_CALLS else None,
+    )
+
+    # 有上次的存档（包括崩溃时自动保存的）且没有设置自动恢复时，询问玩家是否恢复
+    resume = RESUME_GAME
+    if not resume and agent.journal is not None and agent.journal.exists():
+        answer = input(f"发现 {SAVE_PATH} 中有上次的游戏，是否恢复？(y/n): ").strip().lower()
+        resume = answer in ("y", "yes", "是")
+
+    if resume and agent.journal is not None and agent.journal.restore(agent):
+        print(f"已从 {SAVE_PATH} 恢复游戏，共 {len(agent.messages)} 条消息")
+        # 游戏世界恢复到存档时的状态（所在房间、物体的变化），与恢复的对话历史一致
+        if agent.world_state is not None:
+            world.load_state(agent.world_state)
+    else:
+        # 开始新游戏：上次的存档移到一旁（.bak），不直接删除
+        if agent.journal is not None and agent.journal.archive():
+            print(f"上次的存档已备份为 {SAVE_PATH}.*.bak")
 
-    # 设置系统提示
-    agent.initialize_game(system_prompt_init)
+        # 设置系统提示
+        agent.initialize_game(system_prompt_init)
 
     # 更新初始环境信息
-    agent.update_environment(system_prompt_env_update1)
+    world.sync(agent)
+
+    # 本地快速通道：特殊命令、空的或重复的识别结果，以及相同输入、环境、心情和世界状态下已验证过的响应不请求模型
+    fast_path = FastPath(agent, validator=valid_target, state_version=lambda: world.version)
 
     print("游戏已初始化。按'Ctrl+C'结束游戏，输入'保存'保存当前游戏状态。")
     print("=" * 50)
@@ -49,199 +148,160 @@ def main():
     temp_dir = 'temp'
     if not os.path.exists(os.path.join(current_dir, temp_dir)):
         os.makedirs(os.path.join(current_dir, temp_dir))
-    audio_file = os.path.join(current_dir, 'temp', 'doctor_speech.mp3')
-
-    
-    # 用于存储用户输入的队列
-    user_input_queue = []
-    user_input_lock = threading.Lock()
-    
-    # 用于控制语音识别的标志
-    voice_recognition_active = False
-    voice_recognition_lock = threading.Lock()
-    
-    # 用于存储语音识别对象
-    recognition = None
-    
-    # 用于控制音频处理线程的标志
-    audio_thread_running = False
-    audio_thread = None
-    
+
+    # 语音按句合成：合成请求共用一个有界线程池。流式播放时音频块直接写入常驻的输出流，
+    # 否则每句生成一个临时文件，播放后删除
+    # 重复出现的台词（如默认回复）从本地缓存读取，不再请求合成
+    tts_executor = ThreadPoolExecutor(max_workers=3)
+    tts_cache = TTSCache(cache_dir=os.path.join(".cache", "tts"))
+    player = None
+    if STREAM_PLAYBACK:
+        try:
+            player = StreamingAudioPlayer(sample_rate=24000)
+        except (ImportError, OSError) as e:
+            print(f"无法打开音频输出设备，改为通过临时文件播放: {e}")
+    streaming = player is not None
+    if streaming:
+        synthesize = make_stream_synthesizer(
+            api_key=api_key, transport=transport, sample_rate=24000, cache=tts_cache
+        )
+        play = player.play
+        discard = None
+        audio_options = {"response_format": "pcm", "sample_rate": 24000}
+    else:
+        synthesize = make_file_synthesizer(
+            os.path.join(current_dir, temp_dir), api_key=api_key, transport=transport, cache=tts_cache
+        )
+        play = play_and_remove
+        # 取消后不再播放的片段直接删除临时文件
+        discard = remove_audio_file
+        audio_options = {}
+
+    # 在后台预先合成默认回复，玩家遇到解析失败时可以立即听到
+    tts_executor.submit(
+        prewarm_voice_cache,
+        tts_cache,
+        [DEFAULT_EMOTION_PROMPT + line for line in split_sentences(FALLBACK_SPEAK)],
+        api_key=api_key,
+        transport=transport,
+        **audio_options,
+    )
+
+    # 每个阶段开始时调用：播放结束后恢复语音识别；需要时打印各阶段距收到输入的耗时
+    def on_stage(stage, turn, elapsed):
+        if SHOW_STAGE_TIMING:
+            print(f"[第{turn}轮] {stage}: {elapsed * 1000:.0f} ms")
+        if stage == STAGE_PLAYBACK_DONE:
+            voice_session.resume()
+
+    speculator = SpeculativeTurns(agent, skip=("退出", "保存")) if SPECULATIVE_TURNS else None
+
+    # 识别、对话、合成和播放通过阻塞队列和回调交接，识别到句子结束后主线程立即发出对话请求
+    turns = TurnPipeline(
+        agent,
+        synthesize,
+        play,
+        executor=tts_executor,
+        streaming=streaming,
+        on_stage=on_stage,
+        discard=discard,
+        speculator=speculator,
+        fast_path=fast_path,
+    )
+
     # 处理用户输入的函数
     def process_user_input(text):
         """处理用户输入的语音识别结果"""
-        with user_input_lock:
-            user_input_queue.append(text)
-            print(f"\n你: {text}")
-            # 获取到用户输入后，停止语音识别
-            with voice_recognition_lock:
-                nonlocal voice_recognition_active
-                voice_recognition_active = False
-    
-    # 音频处理线程函数
-    def audio_processing_thread():
-        """处理音频数据的线程"""
-        nonlocal audio_thread_running
-        print("音频处理线程已启动")
-        
-        # 导入必要的模块
-        from voice2text.audio_recorder import stream
-        
-        while audio_thread_running:
-            if stream and stream.is_active():
-                try:
-                    # 读取音频数据
-                    data = stream.read(3200, exception_on_overflow=False)
-                    # 发送音频数据到识别服务
-                    recognition.send_audio_frame(data)
-                except Exception as e:
-                    print(f"音频处理错误: {e}")
-                    break
-            else:
-                print("音频流不可用，等待...")
-                time.sleep(0.1)
-        
-        print("音频处理线程已停止")
-    
+        # 获取到用户输入后暂停发送音频，直到医生回应结束，避免录入医生的声音
+        voice_session.pause()
+        print(f"\n你: {text}")
+        turns.submit(text)
+
+    # 整个游戏只建立一个识别连接、打开一次麦克风，只有检测到说话时才发送音频
+    voice_session = VoiceSession(
+        process_user_input,
+        on_partial_callback=speculator.on_partial if speculator is not None else None,
+    )
+
     # 主游戏循环
     try:
+        voice_session.start()
         print("游戏主循环已启动，等待用户输入...")
+        print("\n请开始说话...")
         while True:
-            # 启动语音识别
-            with voice_recognition_lock:
-                if not voice_recognition_active:
-                    print("\n请开始说话...")
-                    voice_recognition_active = True
-                    recognition = start_voice_recognition(process_user_input)
-                    
-                    # 启动音频处理线程
-                    audio_thread_running = True
-                    audio_thread = threading.Thread(target=audio_processing_thread)
-                    audio_thread.daemon = True
-                    audio_thread.start()
-            
-            # 等待用户输入
-            user_input = None
-            while not user_input:
-                with user_input_lock:
-                    if user_input_queue:
-                        user_input = user_input_queue.pop(0)
-                
-                # 检查语音识别是否仍然活跃
-                with voice_recognition_lock:
-                    if not voice_recognition_active:
-                        # 如果语音识别已停止，但没有用户输入，可能是出现了错误
-                        if not user_input:
-                            print("语音识别已停止，但没有获取到用户输入。请重试。")
-                            break
-                
-                # 如果没有用户输入，继续等待
-                if not user_input:
-                    time.sleep(0.1)
-            
-            # 如果没有获取到用户输入，继续下一次循环
-            if not user_input:
-                continue
-            
-            # 停止音频处理线程
-            audio_thread_running = False
-            if audio_thread:
-                audio_thread.join(timeout=1.0)
-            
+            # 阻塞等待用户输入
+            user_input = turns.next_input()
+            if user_input is None:
+                break
+
             print(f"处理用户输入: {user_input}")
-            
-            # 检查特殊命令
-            if user_input.lower() == "退出":
+
+            # 检查特殊命令和不需要处理的输入
+            intent = fast_path.classify(user_input)
+            if intent is not None and speculator is not None:
+                speculator.discard()
+            if intent is not None and intent.kind == INTENT_COMMAND and intent.name == "退出":
                 print("游戏结束。")
                 break
-            elif user_input.lower() == "保存":
+            elif intent is not None and intent.kind == INTENT_COMMAND and intent.name == "保存":
                 agent.save_messages("game_save.json")
                 print("游戏状态已保存到 game_save.json")
+                voice_session.resume()
                 continue
-            
+            elif intent is not None:
+                print(f"忽略输入（{intent.name}）")
+                voice_session.resume()
+                continue
+
             # 获取当前心情状态
             old_mood = agent.mood
-            
-            # 处理用户输入
-            response = agent.process_user_input(user_input)
-            
-            # 显示代理说的话并转换为语音
-            if "speak" in response:
-                doctor_speech = response['speak']
-                print(f"医生: {doctor_speech}")
-                
-                # 根据医生的心情状态选择不同的语音
-                voice = "FunAudioLLM/CosyVoice2-0.5B:alex"  # 默认语音
-            
-                # 生成语音
-                try:
-                    # 添加情感标记
-                    emotion_prompt = f"用非常紧张的情绪 说: <|endofprompt|>{doctor_speech}"
-                    generate_voice(
-                        text=emotion_prompt,
-                        voice=voice,
-                        api_key=api_key,
-                        output_file=audio_file
-                    )
-                    
-                    # 播放语音
-                    playsound(audio_file)
-                    
-                    # 播放后删除文件
-                    try:
-                        os.remove(audio_file)
-                    except Exception as e:
-                        print(f"删除临时音频文件时出错: {e}")
-                        
-                except Exception as e:
-                    print(f"生成或播放语音时出错: {e}")
-            
-            # 处理动作
-            action = response.get("action")
-            target = response.get("target")
-            
-            # 根据动作类型处理响应
-            if action == "move":
-                print(f"医生移动到了 {target}")
-                # 这里可以根据实际情况更新环境信息
-                if target == "Target_Cube_4":
-                    agent.update_environment(system_prompt_env_update2)
-            elif action == "interact":
-                print(f"医生与 {target} 交互")
-                # 这里可以根据实际情况更新环境信息
-                if target == "Target_Cube_4":
-                    print("门被锁住了，无法打开。")
-            elif action == "none":
-                print("医生选择不行动")
-            else:
-                print(f"未知动作: {action}")
-            
-            # 显示心情状态变化
-            if "mood" in response:
-                new_mood = response["mood"]
-                if old_mood != new_mood:
-                    print(f"医生的心情状态从 {old_mood} 变为 {new_mood}")
-                else:
-                    print("医生的心情状态没有变化")
-            
-            # 显示当前心情状态
-            print(f"当前心情状态: {agent.mood}")
-            print("-" * 50)
-    
+
+            def handle_response(response):
+                # 处理动作：在本地校验目标并按分发表执行，无效的目标不改变世界，原因随下一次环境更新告诉模型
+                result = world.apply(response)
+                print(result.describe())
+                world.sync(agent)
+
+                # 显示心情状态变化
+                if "mood" in response:
+                    new_mood = response["mood"]
+                    if old_mood != new_mood:
+                        print(f"医生的心情状态从 {old_mood} 变为 {new_mood}")
+                    else:
+                        print("医生的心情状态没有变化")
+
+                # 显示当前心情状态
+                print(f"当前心情状态: {agent.mood}")
+                print("-" * 50)
+
+            # 流式处理用户输入：每凑满一句就提交语音合成，按顺序播放，播放结束后恢复语音识别
+            turns.run_turn(user_input, on_response=handle_response)
+            print("\n请开始说话...")
+
     except KeyboardInterrupt:
         print("\n游戏被用户中断。")
     except Exception as e:
         print(f"游戏运行时出错: {e}")
     finally:
-        # 停止音频处理线程
-        audio_thread_running = False
-        if audio_thread:
-            audio_thread.join(timeout=1.0)
+        tts_executor.shutdown(wait=False)
+        if player is not None:
+            player.close()
         
         # 停止语音识别
-        if recognition:
-            print("正在停止语音识别...")
-            recognition.stop()
+        print("正在停止语音识别...")
+        voice_session.stop()
+        print(f"语音识别统计: {voice_session.stats()}")
+        if speculator is not None:
+            print(f"推测请求统计: {speculator.stats()}")
+        print(f"快速通道统计: {fast_path.stats()}")
+        if cascade is not None:
+            print(f"模型级联统计: {cascade.stats()}")
+        if router is not None:
+            print(f"服务商延迟统计: {router.report()}")
+        if TRACE_TURNS and tracer.turns:
+            print(format_summary(summarize(load_records(TRACE_PATH)[-tracer.turns:])))
+        if agent.journal is not None:
+            agent.journal.close()
         
         # 清理临时文件
         try:
@@ -0,0 +1,180 @@
+import copy
+from typing import Any, Callable, Dict, Iterable, Optional
+
+from game_prompt.response_schema import parse_response
+from game_prompt.router import fork_client
+from game_prompt.speculative import normalize_transcript
+from game_prompt.tracing import tracer
+
+# 回答的模型层级
+TIER_SMALL = "small"
+TIER_LARGE = "large"
+
+DEFAULT_SMALL_MODEL = "Qwen/Qwen2.5-7B-Instruct"
+
+# 出现这些动词时输入通常要求医生行动，交给大模型
+DEFAULT_VERBS = (
+    "打开", "拿", "捡", "走", "去", "移动", "进入", "离开", "使用", "用", "检查", "搜", "找",
+    "躲", "推", "拉", "撬", "关", "看看", "调查", "靠近", "跑", "爬", "按",
+)
+# 这些心情下的简单回复交给小模型；更紧张时台词需要更细致的情绪，交给大模型
+CALM_MOODS = ("平静", "轻微紧张")
+
+
+class ModelCascade:
+    """
+    模型级联：根据输入的简单特征（长度、是否提到物体 ID 或动作动词、当前心情）选择模型，
+    简单的输入（如"收到"、"等一下"）由小模型回答；小模型的返回不符合格式或目标无效时改由大模型回答
+    """
+
+    def __init__(
+        self,
+        api,
+        max_tokens: int = 300,
+        max_input_length: int = 12,
+        verbs: Iterable[str] = DEFAULT_VERBS,
+        calm_moods: Iterable[str] = CALM_MOODS,
+        targets: Optional[Callable[[], Iterable[str]]] = None,
+        validator: Optional[Callable[[Dict[str, Any]], bool]] = None,
+    ):
+        """
+        初始化模型级联
+
+        Args:
+            api: 小模型的客户端（与大模型的客户端接口相同）
+            max_tokens: 小模型最大生成的令牌数
+            max_input_length: 交给小模型的输入最多多少个字（不计标点和空白）
+            verbs: 动作动词
+            calm_moods: 交给小模型时的心情
+            targets: 返回当前可作为目标的物体 ID（如 WorldState.target_ids），输入中提到时交给大模型
+            validator: 额外的响应校验（如 WorldState 的目标校验），不通过时改由大模型回答
+        """
+        self.api = api
+        self.max_tokens = max_tokens
+        self.max_input_length = max_input_length
+        self.verbs = tuple(verbs)
+        self.calm_moods = tuple(calm_moods)
+        self.targets = targets
+        self.validator = validator
+        self.answered: Dict[str, int] = {TIER_SMALL: 0, TIER_LARGE: 0}
+        self.tokens: Dict[str, int] = {TIER_SMALL: 0, TIER_LARGE: 0}
+        self.escalations = 0
+        self.errors = 0  # 小模型请求出错（计入升级）的次数
+        self.last_tier: Optional[str] = None  # 最近一轮回答的模型层级
+
+    def choose(self, user_input: str, mood: str) -> str:
+        """
+        选择回答的模型层级
+
+        Args:
+            user_input: 玩家输入
+            mood: 当前心情
+
+        Returns:
+            TIER_SMALL 或 TIER_LARGE
+        """
+        text = normalize_transcript(user_input)
+        if not text or len(text) > self.max_input_length or mood not in self.calm_moods:
+            return TIER_LARGE
+        if any(verb in text for verb in self.verbs):
+            return TIER_LARGE
+        if self.targets is not None and any(normalize_transcript(target) in text for target in self.targets()):
+            return TIER_LARGE
+        return TIER_SMALL
+
+    def accept(self, response_content: str, mood: str) -> bool:
+        """
+        检查小模型的返回，不合格时计为一次升级
+
+        Args:
+            response_content: 小模型返回的文本
+            mood: 当前心情
+
+        Returns:
+            是否采用
+        """
+        response, _ = parse_response(response_content, mood)
+        if response is not None and (self.validator is None or self.validator(response)):
+            return True
+        self.escalations += 1
+        return False
+
+    def fail(self, error: Exception):
+        """
+        记录一次小模型请求出错，本轮改由大模型回答，计为一次升级
+
+        Args:
+            error: 请求的异常
+        """
+        self.errors += 1
+        self.escalations += 1
+
+    def record(self, tier: str):
+        """
+        记录回答本轮的模型层级
+
+        Args:
+            tier: 模型层级
+        """
+        self.last_tier = tier
+        self.answered[tier] += 1
+        tracer.annotate(tier=tier)
+
+    def charge(self, tier: str, usage: Optional[Dict[str, Any]]):
+        """
+        记录一次请求的令牌用量（小模型的返回未被采用时同样计入）
+
+        Args:
+            tier: 模型层级
+            usage: 服务端返回的令牌用量
+        """
+        if usage:
+            self.tokens[tier] += usage.get("total_tokens", 0)
+
+    def fork(self) -> "ModelCascade":
+        """
+        复制一个计数从零开始的级联，用于推测执行：与原级联共用配置，小模型的客户端复制一份（用量各自记录），
+        复制体的统计只在被采用时通过 merge 并入，丢弃的推测不改变原级联的统计
+
+        Returns:
+            复制的级联
+        """
+        forked = copy.copy(self)
+        forked.api = fork_client(self.api)
+        forked.answered = {TIER_SMALL: 0, TIER_LARGE: 0}
+        forked.tokens = {TIER_SMALL: 0, TIER_LARGE: 0}
+        forked.escalations = 0
+        forked.errors = 0
+        forked.last_tier = None
+        return forked
+
+    def merge(self, forked: "ModelCascade"):
+        """
+        并入由 fork 得到的级联的统计
+
+        Args:
+            forked: 复制的级联
+        """
+        for tier in (TIER_SMALL, TIER_LARGE):
+            self.answered[tier] += forked.answered[tier]
+            self.tokens[tier] += forked.tokens[tier]
+        self.escalations += forked.escalations
+        self.errors += forked.errors
+        if forked.last_tier is not None:
+            self.last_tier = forked.last_tier
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        获取统计
+
+        Returns:
+            各层级回答的轮次数和令牌数、升级次数（其中小模型请求出错的次数），以及小模型回答的比例
+        """
+        total = sum(self.answered.values())
+        return {
+            "answered": dict(self.answered),
+            "tokens": dict(self.tokens),
+            "escalations": self.escalations,
+            "errors": self.errors,
+            "small_rate": self.answered[TIER_SMALL] / total if total else 0.0,
+        }
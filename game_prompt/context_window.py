@@ -0,0 +1,186 @@
+import json
+from typing import Callable, Dict, List, Optional
+
+from game_prompt.game_prompts import action_prompt, tool_prompt
+
+
+# GameAgent.update_mood 写入的心情更新消息前缀
+MOOD_UPDATE_PREFIX = "你的心情状态现在是"
+# 折叠后的历史对话摘要消息前缀
+SUMMARY_HEADER = "<此前对话摘要>"
+# 环境增量消息（WorldState 发送的新增、移除和变化的物体）前缀
+ENVIRONMENT_DELTA_PREFIX = "你周围的环境发生了变化（只列出变化的部分，其余不变）："
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    粗略估计文本的令牌数：中日韩字符按每字 1 个令牌计算，其余字符按每 4 个字符 1 个令牌计算
+
+    Args:
+        text: 文本内容
+
+    Returns:
+        估计的令牌数
+    """
+    cjk = 0
+    for char in text:
+        if "\u3000" <= char <= "\u9fff" or "\uff00" <= char <= "\uffef":
+            cjk += 1
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+class ContextWindow:
+    """按令牌预算管理 GameAgent 的消息历史，保证每轮请求的长度不随会话时长增长"""
+
+    def __init__(
+        self,
+        max_tokens: int = 6000,
+        target_ratio: float = 0.75,
+        min_recent_messages: int = 6,
+        max_summary_tokens: int = 600,
+        summary_line_chars: int = 60,
+        token_counter: Optional[Callable[[str], int]] = None,
+    ):
+        """
+        初始化上下文窗口
+
+        Args:
+            max_tokens: 消息历史的令牌预算，超过时触发压缩
+            target_ratio: 压缩后的目标长度占预算的比例，留出余量避免每轮都压缩
+            min_recent_messages: 至少原样保留的最近对话消息条数
+            max_summary_tokens: 历史摘要的令牌上限，超过时丢弃最早的摘要行
+            summary_line_chars: 每条摘要行保留的最大字符数
+            token_counter: 自定义的令牌计数函数，默认使用 estimate_tokens
+        """
+        self.max_tokens = max_tokens
+        self.target_tokens = int(max_tokens * target_ratio)
+        self.min_recent_messages = min_recent_messages
+        self.max_summary_tokens = max_summary_tokens
+        self.summary_line_chars = summary_line_chars
+        self.token_counter = token_counter or estimate_tokens
+
+    def count(self, messages: List[Dict[str, str]]) -> int:
+        """
+        估计消息列表的令牌数（每条消息额外计 4 个令牌的格式开销）
+
+        Args:
+            messages: 消息列表
+
+        Returns:
+            估计的令牌数
+        """
+        return sum(self.token_counter(m.get("content") or "") + 4 for m in messages)
+
+    def compact(self, messages: List[Dict[str, str]]) -> List[Dict[str, str]]:
+        """
+        在超出预算时压缩消息历史：
+        1. 始终保留开头的系统提示和动作提示；
+        2. 只保留最新的环境信息和心情状态，丢弃已被取代的旧消息（环境增量只保留最新环境信息之后的）；
+        3. 仍超出目标长度时，将最早的对话折叠进一条摘要消息。
+
+        Args:
+            messages: 当前的消息历史
+
+        Returns:
+            压缩后的消息历史；未超出预算时原样返回
+        """
+        if self.count(messages) <= self.max_tokens:
+            return messages
+
+        kinds = [self._classify(i, m) for i, m in enumerate(messages)]
+        latest = {}
+        for i, kind in enumerate(kinds):
+            if kind in ("environment", "mood"):
+                latest[kind] = i
+
+        summary_lines: List[str] = []
+        kept = []
+        for i, (kind, message) in enumerate(zip(kinds, messages)):
+            if kind == "summary":
+                summary_lines.extend(message["content"].split("\n")[1:])
+            elif kind in ("environment", "mood") and latest[kind] != i:
+                continue
+            elif kind == "environment_delta" and i < latest.get("environment", -1):
+                continue
+            else:
+                kept.append((kind, message))
+
+        # 逐条折叠最早的对话，直到满足目标长度或只剩最近的消息
+        dialogue = [idx for idx, (kind, _) in enumerate(kept) if kind == "dialogue"]
+        foldable = dialogue[:max(0, len(dialogue) - self.min_recent_messages)]
+        folded = set()
+        for idx in foldable:
+            if self._count_result(kept, folded, summary_lines) <= self.target_tokens:
+                break
+            folded.add(idx)
+            summary_lines.append(self._summarize(kept[idx][1]))
+            summary_lines = self._trim_summary(summary_lines)
+
+        return self._assemble(kept, folded, summary_lines)
+
+    def _classify(self, index: int, message: Dict[str, str]) -> str:
+        """判断消息类型：pinned、summary、environment、environment_delta、mood 或 dialogue"""
+        content = message.get("content") or ""
+        if message.get("role") != "system":
+            return "dialogue"
+        if index == 0 or content in (action_prompt, tool_prompt):
+            return "pinned"
+        if content.startswith(SUMMARY_HEADER):
+            return "summary"
+        if content.startswith(MOOD_UPDATE_PREFIX):
+            return "mood"
+        if content.startswith(ENVIRONMENT_DELTA_PREFIX):
+            return "environment_delta"
+        if '"room"' in content:
+            return "environment"
+        # 交互结果等其他系统消息按对话事件处理，过旧时一并折叠
+        return "dialogue"
+
+    def _summarize(self, message: Dict[str, str]) -> str:
+        """将一条对话消息压缩成一行摘要"""
+        content = (message.get("content") or "").strip()
+        role = message.get("role")
+        if role == "user":
+            line = f"警方: {content}"
+        elif role == "assistant":
+            try:
+                data = json.loads(content)
+                line = f"你: [{data.get('action', 'none')} {data.get('target', 'none')}] {data.get('speak', '')}"
+            except (json.JSONDecodeError, AttributeError):
+                line = f"你: {content}"
+        else:
+            line = f"系统: {content}"
+        line = " ".join(line.split())
+        if len(line) > self.summary_line_chars:
+            line = line[:self.summary_line_chars] + "…"
+        return line
+
+    def _trim_summary(self, lines: List[str]) -> List[str]:
+        """超出摘要令牌上限时丢弃最早的摘要行"""
+        while len(lines) > 1 and sum(self.token_counter(line) for line in lines) > self.max_summary_tokens:
+            lines = lines[1:]
+        return lines
+
+    def _assemble(self, kept, folded, summary_lines) -> List[Dict[str, str]]:
+        """按原有顺序组装消息，摘要紧跟在固定的系统提示之后"""
+        result = []
+        summary_inserted = not summary_lines
+        for idx, (kind, message) in enumerate(kept):
+            if idx in folded:
+                continue
+            if not summary_inserted and kind != "pinned":
+                result.append(self._summary_message(summary_lines))
+                summary_inserted = True
+            result.append(message)
+        if not summary_inserted:
+            result.append(self._summary_message(summary_lines))
+        return result
+
+    def _count_result(self, kept, folded, summary_lines) -> int:
+        messages = [m for idx, (_, m) in enumerate(kept) if idx not in folded]
+        if summary_lines:
+            messages.append(self._summary_message(summary_lines))
+        return self.count(messages)
+
+    def _summary_message(self, lines: List[str]) -> Dict[str, str]:
+        return {"role": "system", "content": "\n".join([SUMMARY_HEADER] + lines)}
@@ -1,21 +1,45 @@
 import os
 import json
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Iterator
 from openai import OpenAI
 import dotenv
 from .game_prompts import get_mood_prompt, action_prompt
+from .http_transport import HTTPTransport
+from .tool_protocol import ToolCallStream, first_tool_call, tool_call_text
+
+
+def _request_options(
+    response_format: Optional[Dict[str, str]],
+    tools: Optional[List[Dict[str, Any]]] = None,
+    tool_choice: Optional[str] = None,
+) -> Dict[str, Any]:
+    """只在指定了响应格式或工具时传给 SDK"""
+    options: Dict[str, Any] = {}
+    if response_format:
+        options["response_format"] = response_format
+    if tools:
+        options["tools"] = tools
+        if tool_choice:
+            options["tool_choice"] = tool_choice
+    return options
 
 
 class DeepSeekAPI:
     """DeepSeek API 客户端，使用OpenAI接口，支持历史消息功能"""
 
-    def __init__(self, api_key: Optional[str] = None, model: str = "deepseek-chat"):
+    def __init__(
+        self,
+        api_key: Optional[str] = None,
+        model: str = "deepseek-chat",
+        transport: Optional[HTTPTransport] = None,
+    ):
         """
         初始化 DeepSeek API 客户端
 
         Args:
             api_key: DeepSeek API 密钥，如果为 None，则从环境变量 DEEPSEEK_API_KEY 获取
             model: 使用的模型名称，默认为 "deepseek-chat"
+            transport: 共享的 HTTP 传输层，为 None 时使用 OpenAI SDK 自带的连接
         """
         self.api_key = api_key or os.environ.get("DEEPSEEK_API_KEY")
         if not self.api_key:
@@ -25,8 +49,11 @@ class DeepSeekAPI:
 
         self.model = model
         self.client = OpenAI(
-            api_key=self.api_key, base_url="https://api.deepseek.com/v1"
+            api_key=self.api_key,
+            base_url=os.environ.get("DEEPSEEK_BASE_URL", "https://api.deepseek.com/v1"),
+            http_client=transport.openai_http_client() if transport else None,
         )
+        self.last_usage: Optional[Dict[str, Any]] = None  # 最近一次请求的令牌用量
 
     def chat(
         self,
@@ -34,6 +61,9 @@ class DeepSeekAPI:
         temperature: float = 0.7,
         max_tokens: int = 1000,
         stream: bool = False,
+        response_format: Optional[Dict[str, str]] = None,
+        tools: Optional[List[Dict[str, Any]]] = None,
+        tool_choice: Optional[str] = None,
     ) -> Dict[str, Any]:
         """
         发送聊天请求到 DeepSeek API
@@ -43,6 +73,9 @@ class DeepSeekAPI:
             temperature: 温度参数，控制输出的随机性
             max_tokens: 最大生成的令牌数
             stream: 是否使用流式响应
+            response_format: 响应格式设置，为 None 时不指定
+            tools: 工具函数列表，模型调用工具时返回的内容为转换后的响应 JSON
+            tool_choice: 工具的选择方式（如 "required" 要求必须调用工具），为 None 时由服务端决定
 
         Returns:
             API 响应
@@ -53,13 +86,78 @@ class DeepSeekAPI:
             temperature=temperature,
             max_tokens=max_tokens,
             stream=stream,
+            **_request_options(response_format, tools, tool_choice),
         )
 
+        if stream:
+            content = "".join(
+                chunk.choices[0].delta.content or "" for chunk in response if chunk.choices
+            )
+            return {"choices": [{"message": {"content": content}}]}
+
+        self.last_usage = response.usage.model_dump() if response.usage else None
+
         # 将OpenAI响应转换为与之前兼容的格式
+        message = response.choices[0].message
+        tool_call = first_tool_call(message.tool_calls)
+        content = tool_call_text(*tool_call) if tool_call is not None else message.content
         return {
-            "choices": [{"message": {"content": response.choices[0].message.content}}]
+            "choices": [{"message": {"content": content}}]
         }
 
+    def chat_stream(
+        self,
+        messages: List[Dict[str, str]],
+        temperature: float = 0.7,
+        max_tokens: int = 1000,
+        response_format: Optional[Dict[str, str]] = None,
+        tools: Optional[List[Dict[str, Any]]] = None,
+        tool_choice: Optional[str] = None,
+    ) -> Iterator[str]:
+        """
+        以流式方式发送聊天请求，边生成边返回增量文本
+
+        Args:
+            messages: 消息历史列表
+            temperature: 温度参数
+            max_tokens: 最大生成的令牌数
+            response_format: 响应格式设置，为 None 时不指定
+            tools: 工具函数列表，模型调用工具时参数转换为响应 JSON 的增量文本
+            tool_choice: 工具的选择方式，见 chat
+
+        Returns:
+            增量文本的迭代器
+        """
+        response = self.client.chat.completions.create(
+            model=self.model,
+            messages=messages,
+            temperature=temperature,
+            max_tokens=max_tokens,
+            stream=True,
+            stream_options={"include_usage": True},
+            **_request_options(response_format, tools, tool_choice),
+        )
+        tool_stream = ToolCallStream()
+        try:
+            for chunk in response:
+                if chunk.usage:
+                    self.last_usage = chunk.usage.model_dump()
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta
+                if delta.content:
+                    yield delta.content
+                for tool_call in delta.tool_calls or ():
+                    if tool_call.index == 0 and tool_call.function is not None:
+                        text = tool_stream.feed(tool_call.function.name, tool_call.function.arguments or "")
+                        if text:
+                            yield text
+            tail = tool_stream.finish()
+            if tail:
+                yield tail
+        finally:
+            response.close()
+
     def get_response_content(self, response: Dict[str, Any]) -> str:
         """
         从 API 响应中提取内容
@@ -76,15 +174,21 @@ class DeepSeekAPI:
 class GameAgent:
     """游戏代理，管理与 DeepSeek API 的交互和消息历史"""
 
-    def __init__(self, api_key: Optional[str] = None, model: str = "deepseek-chat"):
+    def __init__(
+        self,
+        api_key: Optional[str] = None,
+        model: str = "deepseek-chat",
+        transport: Optional[HTTPTransport] = None,
+    ):
         """
         初始化游戏代理
 
         Args:
             api_key: DeepSeek API 密钥
             model: 使用的模型名称
+            transport: 共享的 HTTP 传输层
         """
-        self.api = DeepSeekAPI(api_key, model)
+        self.api = DeepSeekAPI(api_key, model, transport=transport)
         self.messages = []
         self.mood = "轻微紧张"  # 初始心情状态
         self.action_prompt_sent = False  # 添加标志，跟踪是否已发送action_prompt
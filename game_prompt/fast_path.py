@@ -0,0 +1,220 @@
+import json
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from game_prompt.response_schema import validate_response
+from game_prompt.siliconflow_api import FALLBACK_SPEAK
+from game_prompt.speculative import normalize_transcript
+
+# 意图类型
+INTENT_COMMAND = "command"  # 特殊命令（退出、保存），由调用方处理
+INTENT_IGNORE = "ignore"  # 不需要处理的输入（空的或重复的识别结果）
+
+# 响应来源
+SOURCE_RULE = "rule"
+SOURCE_CACHE = "cache"
+SOURCE_LLM = "llm"
+
+DEFAULT_COMMANDS = ("退出", "保存")
+
+# 响应规则：参数为玩家输入和游戏代理，有把握时返回完整的响应，否则返回 None
+Rule = Callable[[str, Any], Optional[Dict[str, Any]]]
+
+
+class Intent:
+    """在请求模型之前识别出的意图"""
+
+    def __init__(self, kind: str, name: str):
+        """
+        Args:
+            kind: 意图类型，INTENT_COMMAND 或 INTENT_IGNORE
+            name: 命令名称或忽略的原因（empty、duplicate）
+        """
+        self.kind = kind
+        self.name = name
+
+
+def is_well_formed(response: Dict[str, Any]) -> bool:
+    """
+    检查响应是否包含合法的 action、target、speak 和 mood
+
+    Args:
+        response: 游戏响应
+
+    Returns:
+        是否合法
+    """
+    return not validate_response(response)
+
+
+class FastPath:
+    """
+    请求模型之前的本地快速通道：识别特殊命令，忽略空的和重复的识别结果，
+    由可插拔的规则和已验证响应的缓存直接给出确定的响应，省去一次对话请求和语音合成
+    """
+
+    def __init__(
+        self,
+        agent,
+        commands: Iterable[str] = DEFAULT_COMMANDS,
+        rules: Iterable[Tuple[str, Rule]] = (),
+        validator: Optional[Callable[[Dict[str, Any]], bool]] = None,
+        cache_size: int = 256,
+        duplicate_window: Optional[float] = 3.0,
+        state_version: Optional[Callable[[], Any]] = None,
+    ):
+        """
+        初始化快速通道
+
+        Args:
+            agent: 游戏代理（GameAgent）
+            commands: 特殊命令
+            rules: (名称, 规则) 列表，按顺序尝试
+            validator: 额外的响应校验（如 WorldState 的目标校验），通过校验的模型响应才会被缓存
+            cache_size: 缓存的响应数
+            duplicate_window: 与上一条输入相同且间隔不超过多少秒时视为重复的识别结果，为 None 时不去重（键盘输入）
+            state_version: 返回游戏世界当前版本的函数（如 WorldState.version），加入缓存键，
+                           世界变化后不再重放变化前缓存的响应
+        """
+        self.agent = agent
+        self.commands = {normalize_transcript(command): command for command in commands}
+        self.rules: List[Tuple[str, Rule]] = list(rules)
+        self.validator = validator
+        self.cache_size = cache_size
+        self.duplicate_window = duplicate_window
+        self.state_version = state_version
+        # (规范化输入, 环境信息, 心情, 世界版本) -> 响应
+        self.cache: "OrderedDict[Tuple[str, Optional[str], str, Any], Dict[str, Any]]" = OrderedDict()
+        self.inputs = 0
+        self.hits: Dict[str, int] = {}  # 来源或意图名称 -> 次数
+        self.llm_calls = 0
+        self.last_source: Optional[str] = None  # 最近一轮响应的来源
+        self._last_key: Optional[str] = None
+        self._last_time = 0.0
+
+    def add_rule(self, name: str, rule: Rule):
+        """
+        添加响应规则
+
+        Args:
+            name: 规则名称（用于统计）
+            rule: 规则函数
+        """
+        self.rules.append((name, rule))
+
+    def classify(self, text: str) -> Optional[Intent]:
+        """
+        识别特殊命令和不需要处理的输入
+
+        Args:
+            text: 玩家输入
+
+        Returns:
+            识别出的意图，普通输入返回 None
+        """
+        key = normalize_transcript(text)
+        now = time.monotonic()
+        duplicate = (
+            self.duplicate_window is not None
+            and key == self._last_key
+            and now - self._last_time <= self.duplicate_window
+        )
+        self._last_key, self._last_time = key, now
+        self.inputs += 1
+
+        if key in self.commands:
+            return self._count(Intent(INTENT_COMMAND, self.commands[key]))
+        if not key:
+            return self._count(Intent(INTENT_IGNORE, "empty"))
+        if duplicate:
+            return self._count(Intent(INTENT_IGNORE, "duplicate"))
+        return None
+
+    def run(
+        self,
+        user_input: str,
+        on_speak_delta: Optional[Callable[[str], None]] = None,
+        on_field: Optional[Callable[[str, str], None]] = None,
+        process: Optional[Callable[..., Dict[str, Any]]] = None,
+        on_retract: Optional[Callable[[], None]] = None,
+    ) -> Dict[str, Any]:
+        """
+        处理一轮输入，参数和返回值与 GameAgent.process_user_input_stream 相同。
+        规则或缓存命中时直接回调并写入代理的消息历史，否则调用 process 请求模型并缓存通过校验的响应
+
+        Args:
+            user_input: 玩家输入
+            on_speak_delta: "speak" 字段的回调，命中时以完整文本调用一次
+            on_field: 字段读取完整时的回调
+            process: 请求模型的函数，默认为 agent.process_user_input_stream
+            on_retract: 请求模型时，已回调的 "speak" 被替换时调用
+
+        Returns:
+            游戏响应
+        """
+        version = self.state_version() if self.state_version is not None else None
+        key = (normalize_transcript(user_input), self.agent.environment, self.agent.mood, version)
+
+        for name, rule in self.rules:
+            response = rule(user_input, self.agent)
+            if response is not None and is_well_formed(response):
+                self.hits[name] = self.hits.get(name, 0) + 1
+                return self._answer(SOURCE_RULE, user_input, response, on_speak_delta, on_field)
+
+        response = self.cache.get(key)
+        # 重放前按当前的世界重新校验（如目标物体已被移除），不通过时丢弃缓存并请求模型
+        if response is not None and self.validator is not None and not self.validator(response):
+            del self.cache[key]
+            response = None
+        if response is not None:
+            self.cache.move_to_end(key)
+            self.hits[SOURCE_CACHE] = self.hits.get(SOURCE_CACHE, 0) + 1
+            return self._answer(SOURCE_CACHE, user_input, dict(response), on_speak_delta, on_field)
+
+        process = process or self.agent.process_user_input_stream
+        self.llm_calls += 1
+        self.last_source = SOURCE_LLM
+        response = process(user_input, on_speak_delta=on_speak_delta, on_field=on_field, on_retract=on_retract)
+        if self._cacheable(response):
+            self.cache[key] = dict(response)
+            if len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+        return response
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        获取统计
+
+        Returns:
+            输入数、各来源和意图的命中次数、模型请求次数，以及本地处理的比例
+        """
+        local = sum(self.hits.values())
+        return {
+            "inputs": self.inputs,
+            "hits": dict(self.hits),
+            "llm_calls": self.llm_calls,
+            "cached_responses": len(self.cache),
+            "hit_rate": local / (local + self.llm_calls) if local + self.llm_calls else 0.0,
+        }
+
+    def _count(self, intent: Intent) -> Intent:
+        self.hits[intent.name] = self.hits.get(intent.name, 0) + 1
+        return intent
+
+    def _cacheable(self, response: Dict[str, Any]) -> bool:
+        if not is_well_formed(response) or response["speak"] == FALLBACK_SPEAK:
+            return False
+        return self.validator is None or self.validator(response)
+
+    def _answer(self, source, user_input, response, on_speak_delta, on_field) -> Dict[str, Any]:
+        """以本地响应完成一轮：按流式处理的顺序回调，并像模型返回一样写入消息历史"""
+        self.last_source = source
+        if on_speak_delta:
+            on_speak_delta(response["speak"])
+        if on_field:
+            for field, value in response.items():
+                if isinstance(value, str):
+                    on_field(field, value)
+        self.agent.record_turn(user_input, json.dumps(response, ensure_ascii=False))
+        return response
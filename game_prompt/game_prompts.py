@@ -178,4 +178,68 @@ system_prompt_interact_update2 = """
 {
     "result": "门被锁住了，无法打开。", 
 },
-"""
\ No newline at end of file
+"""
+
+# 结构化的场景数据（由 world_state.WorldState 使用）：
+# objects 为房间内的物体 ID 和描述；exits 为移动到该物体时进入的房间；
+# interactions 为与物体交互的结果，可包含 result（结果描述）、change（物体描述的变化）、
+# add（新出现的物体）、remove（消失的物体）、move_to（进入的房间）
+scenario_hospital = {
+    "start": "办公室",
+    "rooms": {
+        "办公室": {
+            "description": "你自己的办公室，暂时是安全的",
+            "objects": {
+                "Target_Cube_1": "一张办公桌",
+                "Target_Cube_2": "存放有重要文件的柜子",
+                "Target_Cube_3": "一扇窗户",
+                "Target_Cube_4": "一扇门，通往走廊，门是关着的",
+                "Target_Cube_5": "坏掉的电脑",
+            },
+            "exits": {
+                "Target_Cube_4": "走廊",
+            },
+            "interactions": {
+                "Target_Cube_2": {
+                    "result": "你发现了一把钥匙，可能是用来打开某个房间的门。",
+                    "change": {"Target_Cube_2": "存放有重要文件的柜子，已经被翻开"},
+                    "add": {"Key_1": "一把钥匙，可能是用来打开某个房间的门"},
+                },
+                "Target_Cube_4": {
+                    "result": "门被锁住了，无法打开。",
+                },
+            },
+        },
+        "走廊": {
+            "description": "办公室外的走廊，有歹徒经过的痕迹",
+            "objects": {
+                "Target_Cube_1": "一张办公桌",
+                "Target_Cube_2": "存放有重要文件的柜子",
+                "Target_Cube_3": "一扇窗户",
+                "Target_Cube_4": "一扇门，通往走廊，门是关着的",
+                "Target_Cube_5": "坏掉的电脑",
+            },
+            "exits": {},
+            "interactions": {},
+        },
+    },
+}
+
+# 心情状态，按紧张程度从低到高排列
+MOODS = ("平静", "轻微紧张", "中度紧张", "极度恐慌", "惊慌失措")
+
+# 模型可以返回的动作
+ACTIONS = ("move", "interact", "none")
+
+# 工具调用协议的动作提示：返回格式由工具定义约束，不需要示例
+tool_prompt = """
+每次回复都必须调用且只调用一个工具：move（移动到某个物体旁边）、interact（与某个物体交互）或 none（没有明确的命令或不确定该做什么时）。
+target 只能是当前环境中的物体 ID；speak 是你要说的话，根据当前心情调整语气；mood 是你的当前心情状态。
+你应该保持当前的心情状态，除非有明确的理由改变（如遇到危险、获得帮助等），心情状态应该根据环境和事件的变化而逐渐变化。
+"""
+
+# 模型的返回不符合格式时，追加在请求末尾的简短重问提示
+reask_prompt = """你上一条回复不符合返回格式（{errors}）。请只输出一个 JSON 对象，包含 "action"、"target"、"speak"、"mood" 四个字段，不要输出任何其他内容。"""
+
+# 工具调用协议下的重问提示
+tool_reask_prompt = """你上一条回复不符合要求（{errors}）。请调用 move、interact 或 none 中的一个工具，move 和 interact 必须给出 target，不要输出任何其他内容。"""
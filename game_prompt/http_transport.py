@@ -0,0 +1,328 @@
+import threading
+from typing import Any, Dict, Iterator, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+
+
+class HTTPTransport:
+    """共享的 HTTP 传输层，按主机维护连接池并保持长连接，供对话、语音合成和心情评分客户端复用"""
+
+    def __init__(
+        self,
+        pool_connections: int = 10,
+        pool_maxsize: int = 20,
+        connect_timeout: float = 5.0,
+        read_timeout: float = 60.0,
+        max_retries: int = 0,
+        http2: bool = False,
+    ):
+        """
+        初始化传输层
+
+        Args:
+            pool_connections: 缓存的主机连接池数量（每个主机一个连接池）
+            pool_maxsize: 每个主机连接池保持的最大连接数
+            connect_timeout: 建立连接的超时时间（秒）
+            read_timeout: 等待响应数据的超时时间（秒）
+            max_retries: 连接失败时的重试次数
+            http2: 是否启用 HTTP/2，需要安装 httpx[http2]
+        """
+        self.pool_connections = pool_connections
+        self.pool_maxsize = pool_maxsize
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.max_retries = max_retries
+        self.http2 = http2
+        self._session = None
+        self._client = None
+        self._openai_client = None
+        self._lock = threading.Lock()
+
+        if http2:
+            self._client = self._create_httpx_client(http2=True)
+        else:
+            self._session = requests.Session()
+            adapter = HTTPAdapter(
+                pool_connections=pool_connections,
+                pool_maxsize=pool_maxsize,
+                max_retries=max_retries,
+            )
+            self._session.mount("https://", adapter)
+            self._session.mount("http://", adapter)
+
+    def post(
+        self,
+        url: str,
+        json: Optional[Dict[str, Any]] = None,
+        headers: Optional[Dict[str, str]] = None,
+        stream: bool = False,
+        timeout: Optional[float] = None,
+        data: Optional[bytes] = None,
+    ) -> "TransportResponse":
+        """
+        发送 POST 请求，复用已有的长连接
+
+        Args:
+            url: 请求地址
+            json: 请求体，会被序列化为 JSON
+            headers: 请求头
+            stream: 是否以流式方式读取响应体
+            timeout: 读取超时时间（秒），为 None 时使用默认值
+            data: 已经编码好的请求体，与 json 二选一
+
+        Returns:
+            响应对象，需要在流式读取结束后关闭（支持 with 语句）
+        """
+        read_timeout = timeout if timeout is not None else self.read_timeout
+
+        if self._client is not None:
+            request = self._client.build_request(
+                "POST", url, json=json, content=data, headers=headers,
+                timeout=self._httpx_timeout(read_timeout),
+            )
+            response = self._client.send(request, stream=stream)
+            return TransportResponse(response, is_httpx=True)
+
+        response = self._session.post(
+            url, json=json, data=data, headers=headers, stream=stream,
+            timeout=(self.connect_timeout, read_timeout),
+        )
+        return TransportResponse(response)
+
+    def openai_http_client(self):
+        """
+        获取可以传给 OpenAI(http_client=...) 的 httpx 客户端，使 OpenAI SDK 的请求也复用连接池
+
+        Returns:
+            httpx.Client 对象
+        """
+        if self._client is not None:
+            return self._client
+        with self._lock:
+            if self._openai_client is None:
+                self._openai_client = self._create_httpx_client(http2=False)
+            return self._openai_client
+
+    def close(self):
+        """关闭所有连接"""
+        if self._session is not None:
+            self._session.close()
+        if self._client is not None:
+            self._client.close()
+        if self._openai_client is not None:
+            self._openai_client.close()
+
+    def _create_httpx_client(self, http2: bool):
+        """创建 httpx 客户端，连接池参数与 requests 会话保持一致"""
+        try:
+            import httpx
+        except ImportError:
+            raise ImportError("使用 HTTP/2 或 OpenAI 连接池需要安装 httpx: pip install 'httpx[http2]'")
+
+        limits = httpx.Limits(
+            max_connections=self.pool_connections * self.pool_maxsize,
+            max_keepalive_connections=self.pool_maxsize,
+        )
+        return httpx.Client(
+            timeout=self._httpx_timeout(self.read_timeout),
+            transport=httpx.HTTPTransport(http2=http2, limits=limits, retries=self.max_retries),
+        )
+
+    def _httpx_timeout(self, read_timeout: float):
+        import httpx
+        return httpx.Timeout(read_timeout, connect=self.connect_timeout)
+
+
+class TransportResponse:
+    """对 requests 和 httpx 响应的统一封装"""
+
+    def __init__(self, response, is_httpx: bool = False):
+        self._response = response
+        self._is_httpx = is_httpx
+
+    @property
+    def status_code(self) -> int:
+        return self._response.status_code
+
+    @property
+    def content(self) -> bytes:
+        if self._is_httpx:
+            self._response.read()
+        return self._response.content
+
+    @property
+    def text(self) -> str:
+        if self._is_httpx:
+            self._response.read()
+        return self._response.text
+
+    def json(self) -> Any:
+        if self._is_httpx:
+            self._response.read()
+        return self._response.json()
+
+    def iter_lines(self) -> Iterator:
+        """逐行读取响应体"""
+        return self._response.iter_lines()
+
+    def iter_content(self, chunk_size: int = 4096) -> Iterator[bytes]:
+        """按块读取响应体"""
+        if self._is_httpx:
+            return self._response.iter_bytes(chunk_size)
+        return self._response.iter_content(chunk_size)
+
+    def close(self):
+        self._response.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+_default_transport: Optional[HTTPTransport] = None
+_default_transport_lock = threading.Lock()
+
+
+def get_default_transport() -> HTTPTransport:
+    """
+    获取进程内共享的默认传输层，未显式注入传输层的客户端都会使用它
+
+    Returns:
+        HTTPTransport 对象
+    """
+    global _default_transport
+    if _default_transport is None:
+        with _default_transport_lock:
+            if _default_transport is None:
+                _default_transport = HTTPTransport()
+    return _default_transport
+
+
+class AsyncHTTPTransport:
+    """异步 HTTP 传输层，基于 httpx.AsyncClient，在单个事件循环中复用连接池"""
+
+    def __init__(
+        self,
+        pool_connections: int = 10,
+        pool_maxsize: int = 100,
+        connect_timeout: float = 5.0,
+        read_timeout: float = 60.0,
+        max_retries: int = 0,
+        http2: bool = False,
+    ):
+        """
+        初始化异步传输层
+
+        Args:
+            pool_connections: 预计访问的主机数量，用于计算总连接数上限
+            pool_maxsize: 每个主机保持的最大长连接数
+            connect_timeout: 建立连接的超时时间（秒）
+            read_timeout: 等待响应数据的超时时间（秒）
+            max_retries: 连接失败时的重试次数
+            http2: 是否启用 HTTP/2，需要安装 httpx[http2]
+        """
+        try:
+            import httpx
+        except ImportError:
+            raise ImportError("异步客户端需要安装 httpx: pip install httpx")
+
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.http2 = http2
+        limits = httpx.Limits(
+            max_connections=pool_connections * pool_maxsize,
+            max_keepalive_connections=pool_maxsize,
+        )
+        self._client = httpx.AsyncClient(
+            timeout=httpx.Timeout(read_timeout, connect=connect_timeout),
+            transport=httpx.AsyncHTTPTransport(http2=http2, limits=limits, retries=max_retries),
+        )
+
+    async def post(
+        self,
+        url: str,
+        json: Optional[Dict[str, Any]] = None,
+        headers: Optional[Dict[str, str]] = None,
+        stream: bool = False,
+        timeout: Optional[float] = None,
+        data: Optional[bytes] = None,
+    ) -> "AsyncTransportResponse":
+        """
+        发送 POST 请求，参数与 HTTPTransport.post 相同
+
+        Returns:
+            异步响应对象，流式读取时需要关闭（支持 async with 语句）
+        """
+        import httpx
+
+        read_timeout = timeout if timeout is not None else self.read_timeout
+        request = self._client.build_request(
+            "POST", url, json=json, content=data, headers=headers,
+            timeout=httpx.Timeout(read_timeout, connect=self.connect_timeout),
+        )
+        response = await self._client.send(request, stream=stream)
+        return AsyncTransportResponse(response)
+
+    async def aclose(self):
+        """关闭所有连接"""
+        await self._client.aclose()
+
+
+class AsyncTransportResponse:
+    """对 httpx 异步响应的封装，接口与 TransportResponse 对应"""
+
+    def __init__(self, response):
+        self._response = response
+
+    @property
+    def status_code(self) -> int:
+        return self._response.status_code
+
+    async def read(self) -> bytes:
+        """读取完整的响应体"""
+        return await self._response.aread()
+
+    async def text(self) -> str:
+        await self._response.aread()
+        return self._response.text
+
+    async def json(self) -> Any:
+        await self._response.aread()
+        return self._response.json()
+
+    def iter_lines(self):
+        """逐行异步读取响应体"""
+        return self._response.aiter_lines()
+
+    def iter_content(self, chunk_size: int = 4096):
+        """按块异步读取响应体"""
+        return self._response.aiter_bytes(chunk_size)
+
+    async def close(self):
+        await self._response.aclose()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+
+_default_async_transport: Optional[AsyncHTTPTransport] = None
+
+
+def get_default_async_transport() -> AsyncHTTPTransport:
+    """
+    获取默认的异步传输层。httpx.AsyncClient 绑定在首次使用它的事件循环上，
+    因此同一进程中应只在一个事件循环里使用默认传输层
+
+    Returns:
+        AsyncHTTPTransport 对象
+    """
+    global _default_async_transport
+    if _default_async_transport is None:
+        _default_async_transport = AsyncHTTPTransport()
+    return _default_async_transport
@@ -0,0 +1,145 @@
+import json
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Tuple
+
+
+def _encode(obj: Any) -> bytes:
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+class InternTable:
+    """
+    共享的提示文本和消息表：内容相同的静态提示（角色设定、动作提示、心情提示）在所有代理之间只保存一份，
+    消息历史中保存的是同一个消息对象的引用，并缓存其 JSON 编码，发送请求时直接拼接。
+    每轮变化的环境信息不放入表中，否则表中很快只剩下不会再次出现的条目
+    """
+
+    def __init__(self, max_entries: int = 1024):
+        """
+        初始化共享表
+
+        Args:
+            max_entries: 最多保存的文本和消息数，超出时淘汰最久未使用的条目
+                         （已被代理引用的对象不受影响，只是之后相同的内容不再共享）
+        """
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._texts: "OrderedDict[str, str]" = OrderedDict()
+        self._messages: "OrderedDict[Tuple[str, str], Dict[str, str]]" = OrderedDict()
+        # 消息对象的 id -> (消息对象, JSON 编码)。同时保存对象本身，保证条目存在期间 id 不会被复用
+        self._fragments: Dict[int, Tuple[Dict[str, str], bytes]] = {}
+        self._lock = threading.Lock()
+
+    def text(self, text: str) -> str:
+        """
+        获取与 text 内容相同的共享字符串
+
+        Args:
+            text: 文本
+
+        Returns:
+            共享的字符串对象
+        """
+        with self._lock:
+            shared = self._texts.get(text)
+            if shared is not None:
+                self._texts.move_to_end(text)
+                self.hits += 1
+                return shared
+            self.misses += 1
+            self._texts[text] = text
+            if len(self._texts) > self.max_entries:
+                self._texts.popitem(last=False)
+            return text
+
+    def message(self, role: str, content: str) -> Dict[str, str]:
+        """
+        获取共享的消息对象。返回的消息被多个代理引用，调用方不能修改
+
+        Args:
+            role: 消息角色
+            content: 消息内容
+
+        Returns:
+            共享的消息字典
+        """
+        content = self.text(content)
+        key = (role, content)
+        with self._lock:
+            message = self._messages.get(key)
+            if message is not None:
+                self._messages.move_to_end(key)
+                return message
+            message = {"role": role, "content": content}
+            self._messages[key] = message
+            self._fragments[id(message)] = (message, _encode(message))
+            if len(self._messages) > self.max_entries:
+                _, evicted = self._messages.popitem(last=False)
+                self._fragments.pop(id(evicted), None)
+            return message
+
+    def is_shared(self, obj: Any) -> bool:
+        """判断对象是否为表中共享的字符串或消息"""
+        if isinstance(obj, str):
+            return self._texts.get(obj) is obj
+        entry = self._fragments.get(id(obj))
+        return entry is not None and entry[0] is obj
+
+    def encode(self, message: Dict[str, Any]) -> bytes:
+        """
+        获取消息的 JSON 编码，共享消息直接返回缓存的编码
+
+        Args:
+            message: 消息
+
+        Returns:
+            UTF-8 编码的紧凑 JSON
+        """
+        entry = self._fragments.get(id(message))
+        if entry is not None and entry[0] is message:
+            return entry[1]
+        return _encode(message)
+
+    def encode_messages(self, messages: List[Dict[str, Any]]) -> bytes:
+        """将消息列表编码为 JSON 数组"""
+        return b"[" + b",".join(self.encode(message) for message in messages) + b"]"
+
+    def encode_payload(self, payload: Dict[str, Any]) -> bytes:
+        """
+        编码请求体：messages 以外的参数正常编码，messages 由各条消息的编码拼接而成
+
+        Args:
+            payload: 请求体
+
+        Returns:
+            UTF-8 编码的 JSON
+        """
+        head = {key: value for key, value in payload.items() if key != "messages"}
+        body = _encode(head)
+        if "messages" not in payload:
+            return body
+        messages = self.encode_messages(payload["messages"])
+        if not head:
+            return b'{"messages":' + messages + b"}"
+        return body[:-1] + b',"messages":' + messages + b"}"
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        获取统计
+
+        Returns:
+            共享的文本数、消息数，以及查找文本时的命中和未命中次数
+        """
+        return {
+            "texts": len(self._texts),
+            "messages": len(self._messages),
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+# 进程内所有代理共用的表
+shared_prompts = InternTable()
+
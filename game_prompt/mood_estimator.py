@@ -0,0 +1,343 @@
+import json
+import os
+import re
+import threading
+import zlib
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+# 评分规则（见 api_test/moodprompt.txt）：没有命中任何评分类别的轮次按基础衰减计分；
+# 命中类别时按类别计分，不再叠加基础衰减（与提示词中的示例一致，如无关话题为 -10）
+BASE_DECAY = -1
+
+# 类别 -> 该类别的分数变化（取规则区间的中间值）
+CATEGORY_SCORES = {
+    "neutral": 0,
+    "reassure": 4,  # 有效安抚 +3~+5
+    "discovery": 10,  # 关键发现 +8~+12
+    "breakthrough": 17,  # 重大突破 +15~+20
+    "threat_indirect": -3,  # 间接威胁 -2~-4
+    "threat_direct": -6,  # 直接威胁 -5~-8
+    "passive": -6,  # 消极应对 -5~-7
+    "off_topic": -10,  # 无关话题
+    "immersion": -15,  # 破坏沉浸
+}
+CATEGORIES = tuple(CATEGORY_SCORES)
+# 无效交互类别：优先检查，命中时不再评估其他加分项
+INVALID_CATEGORIES = ("immersion", "off_topic", "passive")
+
+# 关键词表：类别 -> (检查的字段, 关键词)。user_input 为警方的指令，llm_response 为医生的回复。
+# 匹配时不区分大小写；英文关键词按整词匹配（"AI" 不匹配 "wait"、"said"）
+DEFAULT_LEXICON: Dict[str, Tuple[Tuple[str, ...], Tuple[str, ...]]] = {
+    "immersion": (("user_input",), ("游戏", "AI", "人工智能", "机器人", "大模型", "假的", "演戏", "剧本")),
+    "off_topic": (("user_input",), ("天气", "喜欢吃", "吃什么", "电影", "明星", "股票", "足球", "周末", "男朋友", "女朋友", "星座")),
+    "breakthrough": (("user_input", "llm_response"), ("逃出来了", "安全了", "找到出口", "出口在", "门开了", "打开了门", "救援到了", "已经脱险")),
+    "discovery": (("llm_response",), ("找到", "发现", "钥匙", "密码", "门禁卡", "工具", "地图", "撬棍")),
+    "threat_direct": (("llm_response",), ("看到歹徒", "歹徒来了", "枪", "受伤", "流血", "开枪", "抓住")),
+    "threat_indirect": (("llm_response",), ("脚步声", "声音", "血迹", "异响", "动静", "影子", "尖叫")),
+    "reassure": (("user_input",), ("别怕", "不要怕", "冷静", "放心", "没事", "深呼吸", "相信我", "我们会", "别担心", "慢慢来")),
+}
+
+# 含义宽泛的关键词：只命中这些时不能确定类别（如"声音"可能只是描述），交给分类器或评分模型
+WEAK_KEYWORDS = frozenset((
+    "游戏", "假的", "周末", "找到", "发现", "工具", "声音", "动静", "影子", "抓住", "冷静", "没事", "我们会",
+))
+# 同一轮命中时，前者覆盖后者：重大突破已包含关键发现，直接威胁已包含间接威胁，不重复计分
+OVERRIDES = {
+    "breakthrough": ("discovery",),
+    "threat_direct": ("threat_indirect",),
+}
+# 关键词给出结果时的置信度：有明确的关键词时较高，只有宽泛的关键词时低于默认阈值
+STRONG_CONFIDENCE = 0.9
+WEAK_CONFIDENCE = 0.5
+
+# 文本特征：字符一元和二元组哈希到固定维度
+FEATURE_DIM = 2048
+
+
+def _keyword_pattern(keyword: str) -> "re.Pattern":
+    """关键词的匹配模式：英文和数字的两侧不能紧接其他英文字母或数字，中文关键词按子串匹配"""
+    pattern = re.escape(keyword)
+    if keyword[:1].isascii() and keyword[:1].isalnum():
+        pattern = r"(?<![a-z0-9])" + pattern
+    if keyword[-1:].isascii() and keyword[-1:].isalnum():
+        pattern += r"(?![a-z0-9])"
+    return re.compile(pattern)
+
+
+def featurize(texts: Iterable[str], dim: int = FEATURE_DIM) -> "np.ndarray":
+    """
+    把文本转换为字符 n-gram 的哈希特征（按行 L2 归一化）
+
+    Args:
+        texts: 文本列表
+        dim: 特征维度
+
+    Returns:
+        形状为 (文本数, dim) 的矩阵
+    """
+    texts = list(texts)
+    features = np.zeros((len(texts), dim), dtype=np.float32)
+    for row, text in enumerate(texts):
+        grams = list(text) + [text[i:i + 2] for i in range(len(text) - 1)]
+        for gram in grams:
+            features[row, zlib.crc32(gram.encode("utf-8")) % dim] += 1.0
+    norms = np.linalg.norm(features, axis=1, keepdims=True)
+    return features / np.maximum(norms, 1e-6)
+
+
+def _turn_text(mood_input: Dict[str, Any]) -> str:
+    return f"{mood_input.get('user_input', '')}\n{mood_input.get('llm_response', '')}"
+
+
+def label_for(score_change: float) -> str:
+    """把评分模型给出的分数变化还原为最接近的类别（只有基础衰减时为 neutral）"""
+    if score_change == BASE_DECAY:
+        return "neutral"
+    return min(CATEGORIES, key=lambda category: abs(CATEGORY_SCORES[category] - score_change))
+
+
+class MoodClassifier:
+    """在记录的会话上训练的多分类逻辑回归，预测一轮对话属于哪个评分类别"""
+
+    def __init__(self, dim: int = FEATURE_DIM):
+        """
+        Args:
+            dim: 特征维度
+        """
+        self.dim = dim
+        self.weights = np.zeros((dim, len(CATEGORIES)), dtype=np.float32)
+        self.bias = np.zeros(len(CATEGORIES), dtype=np.float32)
+        self.trained = False
+
+    def fit(
+        self,
+        samples: List[Dict[str, Any]],
+        epochs: int = 200,
+        learning_rate: float = 0.5,
+        l2: float = 1e-4,
+    ) -> "MoodClassifier":
+        """
+        训练分类器
+
+        Args:
+            samples: 训练样本，每条包含 user_input、llm_response 和 score_change（TrainingLog 的记录格式）
+            epochs: 梯度下降的轮数
+            learning_rate: 学习率
+            l2: L2 正则化系数
+
+        Returns:
+            分类器本身
+        """
+        if not samples:
+            return self
+        x = featurize((_turn_text(sample) for sample in samples), self.dim)
+        y = np.zeros((len(samples), len(CATEGORIES)), dtype=np.float32)
+        for row, sample in enumerate(samples):
+            y[row, CATEGORIES.index(label_for(sample["score_change"]))] = 1.0
+
+        for _ in range(epochs):
+            probs = self._softmax(x @ self.weights + self.bias)
+            grad = (probs - y) / len(samples)
+            self.weights -= learning_rate * (x.T @ grad + l2 * self.weights)
+            self.bias -= learning_rate * grad.sum(axis=0)
+        self.trained = True
+        return self
+
+    def predict(self, mood_input: Dict[str, Any]) -> Tuple[str, float]:
+        """
+        预测评分类别
+
+        Args:
+            mood_input: 评分输入
+
+        Returns:
+            (类别, 概率)
+        """
+        probs = self._softmax(featurize([_turn_text(mood_input)], self.dim) @ self.weights + self.bias)[0]
+        index = int(probs.argmax())
+        return CATEGORIES[index], float(probs[index])
+
+    def save(self, path: str):
+        """保存模型参数"""
+        np.savez(path, weights=self.weights, bias=self.bias)
+
+    @classmethod
+    def load(cls, path: str) -> "MoodClassifier":
+        """加载 save 保存的模型参数"""
+        data = np.load(path)
+        classifier = cls(dim=data["weights"].shape[0])
+        classifier.weights = data["weights"]
+        classifier.bias = data["bias"]
+        classifier.trained = True
+        return classifier
+
+    @staticmethod
+    def _softmax(logits: "np.ndarray") -> "np.ndarray":
+        logits = logits - logits.max(axis=1, keepdims=True)
+        exp = np.exp(logits)
+        return exp / exp.sum(axis=1, keepdims=True)
+
+
+class TrainingLog:
+    """记录评分模型给出的结果（追加写入 JSONL），用于训练 MoodClassifier"""
+
+    def __init__(self, path: str):
+        """
+        Args:
+            path: 记录文件路径
+        """
+        self.path = path
+        self._lock = threading.Lock()
+
+    def append(self, mood_input: Dict[str, Any], result: Dict[str, Any]):
+        """
+        追加一条记录
+
+        Args:
+            mood_input: 评分输入
+            result: 评分模型的结果，包含 score_change 和 reason
+        """
+        record = {
+            "user_input": mood_input.get("user_input", ""),
+            "llm_response": mood_input.get("llm_response", ""),
+            "score_change": result["score_change"],
+            "reason": result.get("reason", ""),
+        }
+        line = json.dumps(record, ensure_ascii=False) + "\n"
+        with self._lock:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line)
+
+    def load(self) -> List[Dict[str, Any]]:
+        """读取所有记录，文件不存在时返回空列表"""
+        if not os.path.exists(self.path):
+            return []
+        with open(self.path, "r", encoding="utf-8") as f:
+            return [json.loads(line) for line in f if line.strip()]
+
+
+class LocalMoodEstimator:
+    """
+    本地心情评分：先按关键词表应用评分规则，关键词不能确定时使用分类器，
+    置信度达到阈值的轮次直接给出结果，其余交给评分模型
+    """
+
+    def __init__(
+        self,
+        lexicon: Dict[str, Tuple[Tuple[str, ...], Tuple[str, ...]]] = DEFAULT_LEXICON,
+        classifier: Optional[MoodClassifier] = None,
+        threshold: float = 0.7,
+        weak_keywords: Iterable[str] = WEAK_KEYWORDS,
+    ):
+        """
+        初始化本地评分
+
+        Args:
+            lexicon: 关键词表，格式见 DEFAULT_LEXICON
+            classifier: 训练好的分类器，为 None 时只使用关键词表
+            threshold: 关键词或分类器的置信度达到多少时采用其结果
+            weak_keywords: 含义宽泛的关键词，只命中这些时置信度为 WEAK_CONFIDENCE
+        """
+        # 关键词统一转为小写，匹配时不区分大小写
+        self.lexicon = {
+            category: (fields, tuple(keyword.lower() for keyword in keywords))
+            for category, (fields, keywords) in lexicon.items()
+        }
+        self._patterns = {
+            keyword: _keyword_pattern(keyword)
+            for _, keywords in self.lexicon.values()
+            for keyword in keywords
+        }
+        self.weak_keywords = frozenset(keyword.lower() for keyword in weak_keywords)
+        self.classifier = classifier
+        self.threshold = threshold
+        self.local = 0
+        self.deferred = 0
+        self._last_input: Optional[str] = None
+
+    def estimate(self, mood_input: Dict[str, Any]) -> Tuple[Optional[Dict[str, Any]], float]:
+        """
+        估计一轮的心情变化
+
+        Args:
+            mood_input: 评分输入（user_input、llm_response、current_mood）
+
+        Returns:
+            (结果, 置信度)。结果格式与评分模型相同（score_change、reason），不确定时结果为 None
+        """
+        user_input = mood_input.get("user_input", "").strip()
+        repeated = user_input and user_input == self._last_input
+        self._last_input = user_input
+
+        strength = self._scan(mood_input)
+        if repeated and not strength:
+            strength = {"passive": True}
+        result, confidence = None, 0.0
+        if strength:
+            invalid = [category for category in INVALID_CATEGORIES if category in strength]
+            # 先检查无效交互，命中时只扣分；否则叠加其他类别
+            categories = invalid[:1] if invalid else list(strength)
+            confidence = STRONG_CONFIDENCE if any(strength[category] for category in categories) else WEAK_CONFIDENCE
+            if confidence >= self.threshold:
+                result = self._result(categories, "关键词")
+        if result is None and self.classifier is not None and self.classifier.trained:
+            category, probability = self.classifier.predict(mood_input)
+            if probability >= self.threshold:
+                result, confidence = self._result([category], "分类器"), probability
+
+        if result is None:
+            self.deferred += 1
+        else:
+            self.local += 1
+        return result, confidence
+
+    def match(self, mood_input: Dict[str, Any]) -> List[str]:
+        """
+        按关键词表匹配评分类别
+
+        Args:
+            mood_input: 评分输入
+
+        Returns:
+            命中的类别
+        """
+        return list(self._scan(mood_input))
+
+    def _scan(self, mood_input: Dict[str, Any]) -> Dict[str, bool]:
+        """按关键词表匹配，返回命中的类别 -> 是否命中了明确的（非宽泛的）关键词，已被覆盖的类别去掉"""
+        strength: Dict[str, bool] = {}
+        for category, (fields, keywords) in self.lexicon.items():
+            text = " ".join(str(mood_input.get(field, "")) for field in fields).lower()
+            hits = [keyword for keyword in keywords if self._patterns[keyword].search(text)]
+            if hits:
+                strength[category] = any(keyword not in self.weak_keywords for keyword in hits)
+        for category, overridden in OVERRIDES.items():
+            if category in strength:
+                for other in overridden:
+                    strength.pop(other, None)
+        return strength
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        获取统计
+
+        Returns:
+            本地给出结果和交给评分模型的轮次数，以及本地处理的比例
+        """
+        total = self.local + self.deferred
+        return {
+            "local": self.local,
+            "deferred": self.deferred,
+            "local_rate": self.local / total if total else 0.0,
+        }
+
+    @staticmethod
+    def _result(categories: List[str], source: str) -> Dict[str, Any]:
+        scored = [category for category in categories if category != "neutral"]
+        score_change = sum(CATEGORY_SCORES[category] for category in scored) if scored else BASE_DECAY
+        return {"score_change": score_change, "reason": f"{source}: {'、'.join(categories)}"}
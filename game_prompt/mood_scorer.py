@@ -0,0 +1,140 @@
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Hashable, List, Optional
+
+# 评分函数：参数为若干条评分输入，返回与输入一一对应的结果（{"score_change": ..., "reason": ...}），
+# 某一条无法评分时对应位置为 None
+ScoreBatch = Callable[[List[Dict[str, Any]]], List[Optional[Dict[str, Any]]]]
+
+_CLOSE = object()
+
+
+class MoodScorer:
+    """
+    心情评分流水线：评分请求在后台执行，不阻塞主回复和语音播放，玩家不需要等待评分模型；
+    完成的结果由调用方在下一轮请求前取回并应用。可以把多个会话的评分请求合并成一次请求
+    """
+
+    def __init__(
+        self,
+        score_batch: ScoreBatch,
+        batch_size: int = 1,
+        batch_wait: float = 0.05,
+        max_workers: int = 2,
+    ):
+        """
+        初始化评分流水线
+
+        Args:
+            score_batch: 评分函数
+            batch_size: 一次请求最多合并多少条评分输入，为 1 时每条单独请求
+            batch_wait: 合并时等待更多输入的最长时间（秒）
+            max_workers: 同时进行的评分请求数
+        """
+        self.score_batch = score_batch
+        self.batch_size = max(1, batch_size)
+        self.batch_wait = batch_wait
+        self.requests = 0
+        self.scored = 0
+        self.failed = 0
+        self._queue: "queue.Queue" = queue.Queue()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers)
+        self._results: Dict[Hashable, List[Optional[Dict[str, Any]]]] = {}
+        self._pending: Dict[Hashable, int] = {}
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(target=self._dispatch, daemon=True)
+        self._thread.start()
+
+    def submit(self, session_id: Hashable, mood_input: Dict[str, Any]):
+        """
+        提交一轮的评分输入，立即返回
+
+        Args:
+            session_id: 会话 ID，多个会话共用一个流水线时用于区分结果
+            mood_input: 评分输入（玩家输入、医生的回复和当前心情值）
+        """
+        with self._lock:
+            self._pending[session_id] = self._pending.get(session_id, 0) + 1
+        self._queue.put((session_id, mood_input))
+
+    def collect(self, session_id: Hashable) -> List[Optional[Dict[str, Any]]]:
+        """
+        取回会话已完成的评分结果，不等待未完成的请求（它们留到之后的轮次）
+
+        Args:
+            session_id: 会话 ID
+
+        Returns:
+            按完成顺序排列的结果，评分失败的位置为 None
+        """
+        with self._lock:
+            return self._results.pop(session_id, [])
+
+    def pending(self, session_id: Hashable) -> int:
+        """会话尚未完成的评分请求数"""
+        with self._lock:
+            return self._pending.get(session_id, 0)
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        获取统计
+
+        Returns:
+            评分请求数（合并后的）、完成和失败的评分条数
+        """
+        return {"requests": self.requests, "scored": self.scored, "failed": self.failed}
+
+    def close(self, wait: bool = False):
+        """
+        停止流水线
+
+        Args:
+            wait: 是否等待已提交的评分完成
+        """
+        self._queue.put(_CLOSE)
+        if wait:
+            self._thread.join()
+        self._executor.shutdown(wait=wait)
+
+    def _dispatch(self):
+        """后台线程：按 batch_size 和 batch_wait 合并评分输入，交给线程池请求"""
+        while True:
+            item = self._queue.get()
+            if item is _CLOSE:
+                return
+            batch = [item]
+            deadline = time.monotonic() + self.batch_wait
+            while len(batch) < self.batch_size:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                if item is _CLOSE:
+                    self._queue.put(_CLOSE)
+                    break
+                batch.append(item)
+            try:
+                self._executor.submit(self._score, batch)
+            except RuntimeError:
+                return  # 线程池已关闭
+            self.requests += 1
+
+    def _score(self, batch):
+        try:
+            results = list(self.score_batch([mood_input for _, mood_input in batch]))
+        except Exception:
+            results = []
+        results += [None] * (len(batch) - len(results))
+        with self._lock:
+            for (session_id, _), result in zip(batch, results):
+                self._results.setdefault(session_id, []).append(result)
+                self._pending[session_id] -= 1
+                if result is None:
+                    self.failed += 1
+                else:
+                    self.scored += 1
@@ -0,0 +1,130 @@
+from typing import Any, Dict, List, Optional
+
+from game_prompt.game_prompts import action_prompt, get_mood_prompt
+from game_prompt.interning import shared_prompts
+
+
+# 消息布局：legacy 为原有的交替追加方式，prefix_cache 将静态内容放在最前、易变状态放在最后
+LAYOUT_LEGACY = "legacy"
+LAYOUT_PREFIX_CACHE = "prefix_cache"
+
+
+def build_static_prompt(system_prompt: str, action: str = action_prompt) -> str:
+    """
+    构造静态的系统提示：角色设定与动作提示拼在一起，不包含心情和环境，所有会话字节完全一致
+
+    Args:
+        system_prompt: 系统提示内容
+        action: 动作提示（文本协议为 action_prompt，工具调用协议为 tool_prompt）
+
+    Returns:
+        静态系统提示（所有代理共享同一个字符串对象）
+    """
+    return shared_prompts.text(system_prompt + action)
+
+
+def build_state_message(environment: Optional[str], mood: str) -> Dict[str, str]:
+    """
+    构造放在请求末尾的易变状态消息，内容顺序固定为：环境信息、心情状态
+
+    Args:
+        environment: 最新的环境信息
+        mood: 当前心情状态
+
+    Returns:
+        系统消息（没有环境信息时，心情相同的代理共享同一个消息对象，不能修改）
+    """
+    mood_prompt = get_mood_prompt(mood).strip()
+    if not environment:
+        return shared_prompts.message("system", mood_prompt)
+    # 环境信息每轮都可能变化，不放入共享表
+    return {"role": "system", "content": f"{environment.strip()}\n\n{mood_prompt}"}
+
+
+class PrefixStabilityTracker:
+    """统计相邻两轮请求中保持不变的消息前缀字节数，用来评估服务端上下文缓存的命中潜力"""
+
+    def __init__(self):
+        self.turns = 0
+        self.last_stable_bytes = 0
+        self.last_total_bytes = 0
+        self.stable_bytes = 0  # 累计稳定前缀字节数
+        self.total_bytes = 0  # 累计请求字节数
+        self.cache_hit_tokens = 0  # 服务端报告的缓存命中令牌数
+        self.prompt_tokens = 0  # 服务端报告的输入令牌数
+        self._previous: List[bytes] = []
+
+    def record(self, messages: List[Dict[str, str]]) -> int:
+        """
+        记录一次请求的消息列表
+
+        Args:
+            messages: 本轮发送的消息列表
+
+        Returns:
+            与上一轮相比保持不变的前缀字节数
+        """
+        # 共享消息使用缓存的编码
+        encoded = [shared_prompts.encode(m) for m in messages]
+
+        stable = 0
+        for previous, current in zip(self._previous, encoded):
+            if previous == current:
+                stable += len(current) + 1  # 加上消息之间的逗号
+                continue
+            stable += _common_prefix_length(previous, current)
+            break
+
+        total = sum(len(e) + 1 for e in encoded)
+        self._previous = encoded
+        self.turns += 1
+        self.last_stable_bytes = stable
+        self.last_total_bytes = total
+        self.stable_bytes += stable
+        self.total_bytes += total
+        return stable
+
+    def record_usage(self, usage: Optional[Dict[str, Any]]):
+        """
+        记录 API 返回的令牌用量，兼容 DeepSeek 的 prompt_cache_hit_tokens 和 OpenAI 的 cached_tokens 字段
+
+        Args:
+            usage: 响应中的 usage 字段
+        """
+        if not usage:
+            return
+        self.prompt_tokens += usage.get("prompt_tokens") or 0
+        hit = usage.get("prompt_cache_hit_tokens")
+        if hit is None:
+            hit = (usage.get("prompt_tokens_details") or {}).get("cached_tokens")
+        self.cache_hit_tokens += hit or 0
+
+    def report(self) -> Dict[str, Any]:
+        """
+        获取统计结果
+
+        Returns:
+            包含最近一轮和累计的稳定前缀字节数、比例及服务端缓存命中情况的字典
+        """
+        return {
+            "turns": self.turns,
+            "last_stable_bytes": self.last_stable_bytes,
+            "last_total_bytes": self.last_total_bytes,
+            "last_stable_ratio": _ratio(self.last_stable_bytes, self.last_total_bytes),
+            "stable_ratio": _ratio(self.stable_bytes, self.total_bytes),
+            "cache_hit_tokens": self.cache_hit_tokens,
+            "prompt_tokens": self.prompt_tokens,
+            "cache_hit_ratio": _ratio(self.cache_hit_tokens, self.prompt_tokens),
+        }
+
+
+def _common_prefix_length(a: bytes, b: bytes) -> int:
+    length = min(len(a), len(b))
+    for i in range(length):
+        if a[i] != b[i]:
+            return i
+    return length
+
+
+def _ratio(part: int, whole: int) -> float:
+    return part / whole if whole else 0.0
@@ -0,0 +1,126 @@
+import json
+import re
+from typing import Any, Dict, List, Optional, Tuple
+
+from game_prompt.game_prompts import ACTIONS, MOODS
+from game_prompt.stream_parser import IncrementalJSONReader
+
+# 请求模型输出 JSON 对象（OpenAI 兼容接口的 response_format）
+JSON_OBJECT_FORMAT = {"type": "json_object"}
+
+# 响应的字段和取值范围
+RESPONSE_SCHEMA = {
+    "action": ACTIONS,
+    "target": str,
+    "speak": str,
+    "mood": MOODS,
+}
+
+_FENCE = re.compile(r"```(?:json)?\s*(.*?)```", re.DOTALL | re.IGNORECASE)
+_TRAILING_COMMA = re.compile(r",\s*([}\]])")
+_SMART_QUOTES = str.maketrans({"“": '"', "”": '"'})
+
+
+def extract_json(text: str) -> Optional[Dict[str, Any]]:
+    """
+    从模型的返回中提取 JSON 对象，依次尝试：直接解析；去掉 markdown 代码块和对象前后的文字；
+    去掉多余的逗号；最后逐字读取已完整的顶层字符串字段（可处理被截断的返回）
+
+    Args:
+        text: 模型返回的文本
+
+    Returns:
+        提取出的字典，无法提取时返回 None
+    """
+    if not text:
+        return None
+    try:
+        data = json.loads(text)
+        if isinstance(data, dict):
+            return data
+    except json.JSONDecodeError:
+        pass
+
+    fenced = _FENCE.search(text)
+    candidate = fenced.group(1) if fenced else text
+    start, end = candidate.find("{"), candidate.rfind("}")
+    if start != -1 and end > start:
+        body = candidate[start:end + 1]
+        for attempt in (body, _TRAILING_COMMA.sub(r"\1", body), _TRAILING_COMMA.sub(r"\1", body.translate(_SMART_QUOTES))):
+            try:
+                data = json.loads(attempt)
+                if isinstance(data, dict):
+                    return data
+            except json.JSONDecodeError:
+                continue
+
+    reader = IncrementalJSONReader()
+    reader.feed(candidate)
+    return dict(reader.fields) or None
+
+
+def validate_response(data: Dict[str, Any]) -> List[str]:
+    """
+    按 RESPONSE_SCHEMA 校验响应
+
+    Args:
+        data: 响应
+
+    Returns:
+        错误列表，为空时表示合法
+    """
+    if not isinstance(data, dict):
+        return ["返回的不是 JSON 对象"]
+    errors = []
+    for field, allowed in RESPONSE_SCHEMA.items():
+        value = data.get(field)
+        if not isinstance(value, str) or not value.strip():
+            errors.append(f"缺少 {field}")
+        elif allowed is not str and value not in allowed:
+            errors.append(f"{field} 只能是 {'、'.join(allowed)}")
+    if data.get("action") in ("move", "interact") and data.get("target") == "none":
+        errors.append(f"{data['action']} 需要目标")
+    return errors
+
+
+def repair_response(data: Dict[str, Any], mood: str) -> Dict[str, Any]:
+    """
+    修正可以确定的小问题：动作大小写和空白、不行动时缺少的目标、不在取值范围内的心情（保持当前心情）
+
+    Args:
+        data: extract_json 提取的字典
+        mood: 当前心情
+
+    Returns:
+        修正后的响应（新字典）
+    """
+    data = dict(data)
+    action = data.get("action")
+    if isinstance(action, str):
+        data["action"] = action.strip().lower()
+    if data.get("action") == "none" and not data.get("target"):
+        data["target"] = "none"
+    if data.get("mood") not in MOODS:
+        data["mood"] = mood
+    return data
+
+
+def parse_response(text: str, mood: str) -> Tuple[Optional[Dict[str, Any]], List[str]]:
+    """
+    提取、修正并校验模型的返回
+
+    Args:
+        text: 模型返回的文本
+        mood: 当前心情，返回的心情不合法时使用
+
+    Returns:
+        (响应, 错误列表)。无法得到合法响应时响应为 None
+    """
+    data = extract_json(text)
+    if data is None:
+        return None, ["返回的不是 JSON 对象"]
+    data = repair_response(data, mood)
+    errors = validate_response(data)
+    if errors:
+        return None, errors
+    return data, []
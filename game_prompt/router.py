@@ -0,0 +1,387 @@
+import copy
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Any, Dict, Iterator, List, Optional
+
+from game_prompt.tracing import tracer
+
+
+class LatencyTracker:
+    """记录一个后端最近若干次请求的延迟和连续失败次数"""
+
+    def __init__(self, window: int = 50):
+        """
+        Args:
+            window: 用于计算百分位数的最近样本数
+        """
+        self.samples: deque = deque(maxlen=window)
+        self.requests = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.last_failure = 0.0
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float):
+        """记录一次成功请求的延迟"""
+        with self._lock:
+            self.samples.append(seconds)
+            self.requests += 1
+            self.consecutive_failures = 0
+
+    def record_failure(self):
+        """记录一次失败的请求"""
+        with self._lock:
+            self.requests += 1
+            self.failures += 1
+            self.consecutive_failures += 1
+            self.last_failure = time.monotonic()
+
+    def percentile(self, p: float) -> Optional[float]:
+        """
+        计算延迟的百分位数
+
+        Args:
+            p: 百分位（0-100）
+
+        Returns:
+            延迟秒数，没有样本时返回 None
+        """
+        with self._lock:
+            if not self.samples:
+                return None
+            ordered = sorted(self.samples)
+        index = min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))
+        return ordered[index]
+
+    def healthy(self, max_failures: int, cooldown: float) -> bool:
+        """连续失败达到上限后，冷却时间内视为不可用"""
+        return (
+            self.consecutive_failures < max_failures
+            or time.monotonic() - self.last_failure >= cooldown
+        )
+
+
+class HedgedRouter:
+    """
+    在多个可互换的对话后端（SiliconFlowAPI、DeepSeekAPI）之间路由：按各后端最近的延迟百分位数
+    选择最快的可用后端，超过对冲延迟仍未返回时向下一个后端发出对冲请求，采用先返回的结果。
+    接口与 SiliconFlowAPI 相同，可直接作为 GameAgent 的 api 使用
+    """
+
+    def __init__(
+        self,
+        backends: List[Any],
+        hedge_delay: Optional[float] = 1.5,
+        hedge_percentile: Optional[float] = None,
+        rank_percentile: float = 50,
+        window: int = 50,
+        max_failures: int = 3,
+        cooldown: float = 30.0,
+        executor: Optional[ThreadPoolExecutor] = None,
+    ):
+        """
+        初始化路由
+
+        Args:
+            backends: 对话后端列表，需提供 chat、chat_stream 和 get_response_content
+            hedge_delay: 发出对冲请求前等待的秒数，为 None 时不对冲
+            hedge_percentile: 设置后，主后端样本足够时用其延迟的该百分位数作为对冲延迟（不小于 hedge_delay）
+            rank_percentile: 选择主后端时比较的延迟百分位
+            window: 每个后端用于计算百分位数的最近样本数
+            max_failures: 连续失败多少次后暂时视为不可用
+            cooldown: 不可用的后端多少秒后重新尝试
+            executor: 发送请求的线程池，为 None 时每个请求使用单独的线程。被对冲掉或卡住的请求会一直占用线程，
+                      直到返回或读取超时，固定大小的线程池在服务商连续卡顿时会被占满，新的请求只能排队
+        """
+        if not backends:
+            raise ValueError("至少需要一个对话后端")
+
+        self.backends = list(backends)
+        self.hedge_delay = hedge_delay
+        self.hedge_percentile = hedge_percentile
+        self.rank_percentile = rank_percentile
+        self.max_failures = max_failures
+        self.cooldown = cooldown
+        self.hedges = 0  # 发出的对冲请求数
+        self.hedge_wins = 0  # 对冲请求先返回的次数
+        self.last_usage: Optional[Dict[str, Any]] = None
+        self.last_backend: Optional[str] = None  # 最近一次采用结果的后端
+        # 非流式请求记录总耗时，流式请求记录首个增量的耗时，两者分开统计
+        self._trackers = {
+            (backend_name(backend), mode): LatencyTracker(window)
+            for backend in self.backends
+            for mode in ("chat", "stream")
+        }
+        self._executor = executor
+
+    @property
+    def model(self) -> str:
+        """主后端的模型名称"""
+        return self._ranked("chat")[0].model
+
+    def chat(self, messages: List[Dict[str, str]], **kwargs) -> Dict[str, Any]:
+        """
+        发送聊天请求，参数与 SiliconFlowAPI.chat 相同（各后端不支持的参数需要调用方避免传入）
+
+        Returns:
+            最先成功返回的后端的响应
+        """
+        ranked = self._ranked("chat")
+        pending: Dict[Future, Any] = {}
+        errors = []
+
+        def submit(backend):
+            pending[self._submit(tracer.bind(self._timed_chat), backend, messages, kwargs)] = backend
+
+        submit(ranked[0])
+        delay = self._hedge_delay(ranked[0], "chat")
+        while pending:
+            done, _ = wait(pending, timeout=delay, return_when=FIRST_COMPLETED)
+            if not done:
+                # 主后端超过对冲延迟仍未返回，向下一个后端发出对冲请求
+                delay = None
+                hedge = self._next_backend(ranked, pending.values())
+                if hedge is not None:
+                    self.hedges += 1
+                    submit(hedge)
+                continue
+            for future in done:
+                backend = pending.pop(future)
+                try:
+                    response = future.result()
+                except Exception as e:
+                    errors.append(e)
+                    # 主后端失败时立即改用下一个后端
+                    fallback = self._next_backend(ranked, list(pending.values()) + [backend])
+                    if fallback is not None and not pending:
+                        submit(fallback)
+                    continue
+                if backend is not ranked[0]:
+                    self.hedge_wins += 1
+                self._adopt(backend)
+                return response
+        raise errors[-1]
+
+    def chat_stream(self, messages: List[Dict[str, str]], **kwargs) -> Iterator[str]:
+        """
+        以流式方式发送聊天请求，按首个增量的到达时间对冲，参数与 SiliconFlowAPI.chat_stream 相同
+
+        Returns:
+            最先开始生成的后端的增量文本迭代器
+        """
+        ranked = self._ranked("stream")
+        events: "queue.Queue" = queue.Queue()
+        stops: Dict[int, threading.Event] = {}
+        started: Dict[int, float] = {}
+        tried = []
+
+        def start(backend):
+            index = len(tried)
+            tried.append(backend)
+            stops[index] = threading.Event()
+            started[index] = time.perf_counter()
+            # 工作线程中的请求记入发起请求的轮次
+            self._submit(
+                tracer.bind(self._pump_stream), index, backend, messages, kwargs, events, stops[index]
+            )
+
+        start(ranked[0])
+        delay = self._hedge_delay(ranked[0], "stream")
+        winner = None
+        failed = set()
+        try:
+            while True:
+                try:
+                    index, kind, value = events.get(timeout=delay)
+                except queue.Empty:
+                    delay = None
+                    hedge = self._next_backend(ranked, tried)
+                    if hedge is not None:
+                        self.hedges += 1
+                        start(hedge)
+                    continue
+
+                if winner is None:
+                    if kind == "error":
+                        failed.add(index)
+                        fallback = self._next_backend(ranked, tried)
+                        if fallback is not None and len(failed) == len(tried):
+                            start(fallback)
+                        elif len(failed) == len(tried):
+                            raise value
+                        continue
+                    # 第一个产生增量（或直接结束）的后端胜出，其余请求停止
+                    winner = index
+                    backend = tried[index]
+                    now = time.perf_counter()
+                    elapsed = now - started[index]
+                    self._tracker(backend, "stream").record(elapsed)
+                    for other, stop in stops.items():
+                        if other != index:
+                            stop.set()
+                            # 被取消的请求只知道延迟不低于已运行的时间：比胜出者运行得更久时才记为样本
+                            # （删失样本），否则较晚发出的对冲请求会被当作延迟很低
+                            waited = now - started[other]
+                            if other not in failed and waited > elapsed:
+                                self._tracker(tried[other], "stream").record(waited)
+                    if index != 0:
+                        self.hedge_wins += 1
+                    self.last_backend = backend_name(backend)
+
+                if index != winner:
+                    continue
+                if kind == "delta":
+                    yield value
+                elif kind == "error":
+                    raise value
+                else:
+                    self.last_usage = getattr(tried[winner], "last_usage", None)
+                    return
+        finally:
+            for stop in stops.values():
+                stop.set()
+
+    def fork(self) -> "HedgedRouter":
+        """
+        复制一个记录各自令牌用量的路由（如推测执行使用）：后端也各复制一份，
+        连接池和延迟统计与原路由共用
+
+        Returns:
+            复制的路由
+        """
+        forked = copy.copy(self)
+        forked.backends = [fork_client(backend) for backend in self.backends]
+        forked.last_usage = None
+        return forked
+
+    def get_response_content(self, response: Dict[str, Any]) -> str:
+        """从响应中提取内容，各后端的响应格式相同"""
+        return self.backends[0].get_response_content(response)
+
+    def report(self) -> Dict[str, Any]:
+        """
+        获取各后端的延迟统计
+
+        Returns:
+            以 "后端:模型" 和请求方式为键的请求数、失败数、p50/p95/p99 延迟，以及对冲次数
+        """
+        backends = {}
+        for (name, mode), tracker in self._trackers.items():
+            if not tracker.requests:
+                continue
+            backends[f"{name} {mode}"] = {
+                "requests": tracker.requests,
+                "failures": tracker.failures,
+                "p50": tracker.percentile(50),
+                "p95": tracker.percentile(95),
+                "p99": tracker.percentile(99),
+            }
+        return {"backends": backends, "hedges": self.hedges, "hedge_wins": self.hedge_wins}
+
+    def _submit(self, fn, *args) -> Future:
+        """在线程池或新的守护线程中执行请求"""
+        if self._executor is not None:
+            return self._executor.submit(fn, *args)
+        future: Future = Future()
+
+        def run():
+            if not future.set_running_or_notify_cancel():
+                return
+            try:
+                future.set_result(fn(*args))
+            except BaseException as e:
+                future.set_exception(e)
+
+        threading.Thread(target=run, daemon=True).start()
+        return future
+
+    def _tracker(self, backend, mode: str) -> LatencyTracker:
+        return self._trackers[(backend_name(backend), mode)]
+
+    def _ranked(self, mode: str) -> List[Any]:
+        """可用的后端按延迟从低到高排序，没有样本的后端排在最前以便获得样本；都不可用时按原顺序全部尝试"""
+
+        def latency(backend):
+            value = self._tracker(backend, mode).percentile(self.rank_percentile)
+            return -1.0 if value is None else value
+
+        healthy = [
+            backend for backend in self.backends
+            if self._tracker(backend, mode).healthy(self.max_failures, self.cooldown)
+        ]
+        return sorted(healthy, key=latency) if healthy else list(self.backends)
+
+    def _next_backend(self, ranked: List[Any], used) -> Optional[Any]:
+        used = list(used)
+        for backend in ranked:
+            if not any(backend is other for other in used):
+                return backend
+        return None
+
+    def _hedge_delay(self, backend, mode: str) -> Optional[float]:
+        if self.hedge_delay is None or len(self.backends) < 2:
+            return None
+        if self.hedge_percentile is not None:
+            tracker = self._tracker(backend, mode)
+            if len(tracker.samples) >= 10:
+                return max(self.hedge_delay, tracker.percentile(self.hedge_percentile))
+        return self.hedge_delay
+
+    def _adopt(self, backend):
+        self.last_backend = backend_name(backend)
+        self.last_usage = getattr(backend, "last_usage", None)
+
+    def _timed_chat(self, backend, messages, kwargs) -> Dict[str, Any]:
+        """在线程池中发送非流式请求并记录延迟（被对冲的请求也会记录，用于反映后端的真实延迟）"""
+        start = time.perf_counter()
+        try:
+            response = backend.chat(messages, **kwargs)
+        except Exception:
+            self._tracker(backend, "chat").record_failure()
+            raise
+        self._tracker(backend, "chat").record(time.perf_counter() - start)
+        return response
+
+    def _pump_stream(self, index, backend, messages, kwargs, events, stop):
+        """在线程池中读取一个后端的流式响应，增量写入事件队列，收到停止信号后关闭连接"""
+        stream = backend.chat_stream(messages, **kwargs)
+        try:
+            for delta in stream:
+                if stop.is_set():
+                    return
+                events.put((index, "delta", delta))
+            events.put((index, "end", None))
+        except Exception as e:
+            if not stop.is_set():
+                self._tracker(backend, "stream").record_failure()
+            events.put((index, "error", e))
+        finally:
+            stream.close()
+
+
+def fork_client(api):
+    """
+    复制对话客户端：共用连接池和配置，最近一次请求的令牌用量（last_usage）各自记录，
+    同时进行的请求（如推测执行和正式的一轮）不会覆盖对方的用量
+
+    Args:
+        api: 对话客户端（SiliconFlowAPI、DeepSeekAPI、HedgedRouter 等）
+
+    Returns:
+        复制的客户端，提供 fork 方法的客户端由其自行复制
+    """
+    fork = getattr(api, "fork", None)
+    if callable(fork):
+        return fork()
+    forked = copy.copy(api)
+    if hasattr(forked, "last_usage"):
+        forked.last_usage = None
+    return forked
+
+
+def backend_name(backend) -> str:
+    """后端的名称，格式为 "类名:模型" """
+    return f"{type(backend).__name__}:{backend.model}"
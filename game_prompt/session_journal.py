@@ -0,0 +1,269 @@
+import gzip
+import json
+import os
+import time
+from typing import Any, Dict, List, Optional
+
+from game_prompt.interning import shared_prompts
+
+# 写入日志的代理状态字段（消息历史之外）
+STATE_FIELDS = ("mood", "environment", "action_prompt_sent", "environment_in_history", "world_state")
+
+
+class SessionJournal:
+    """
+    追加式的会话日志：每条新消息或状态变化追加一行紧凑的 JSON 记录，定期压缩成快照。
+    每轮自动保存只写入新增的记录，恢复时读取快照再重放其后的记录
+    """
+
+    def __init__(
+        self,
+        path: str,
+        compress: bool = False,
+        fsync_interval: float = 1.0,
+        fsync_every: int = 32,
+        compact_every: int = 500,
+    ):
+        """
+        初始化日志
+
+        Args:
+            path: 日志路径前缀，实际文件为 <path>.snapshot.json 和 <path>.journal.jsonl（压缩时加 .gz）
+            compress: 是否使用 gzip 压缩
+            fsync_interval: 距上次落盘超过多少秒后，下一次写入时执行 fsync
+            fsync_every: 累计多少条未落盘的记录后执行 fsync
+            compact_every: 日志中累计多少条记录后压缩成快照
+        """
+        suffix = ".gz" if compress else ""
+        self.snapshot_path = f"{path}.snapshot.json{suffix}"
+        self.journal_path = f"{path}.journal.jsonl{suffix}"
+        self.compress = compress
+        self.fsync_interval = fsync_interval
+        self.fsync_every = fsync_every
+        self.compact_every = compact_every
+        self.seq = 0  # 最后一条记录的序号
+        self.records = 0  # 当前日志文件中的记录数
+        self._file = None
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+        self._messages_ref: Optional[List[Dict[str, Any]]] = None
+        self._message_count = 0
+        self._state: Optional[Dict[str, Any]] = None
+
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+
+    def record(self, agent):
+        """
+        记录代理自上次记录以来的变化：新增的消息逐条追加；消息历史被替换（如上下文压缩、重新初始化）时写入快照
+
+        Args:
+            agent: 游戏代理
+        """
+        messages = agent.messages
+        if messages is not self._messages_ref or len(messages) < self._message_count:
+            self.snapshot(agent)
+            return
+
+        for message in messages[self._message_count:]:
+            self._append({"op": "append", "message": message})
+        self._message_count = len(messages)
+
+        state = _agent_state(agent)
+        if state != self._state:
+            self._append({"op": "state", **state})
+            self._state = state
+
+        if self.records >= self.compact_every:
+            self.snapshot(agent)
+        else:
+            self._maybe_sync()
+
+    def snapshot(self, agent):
+        """
+        将代理的完整状态写入快照并清空日志（先写临时文件再改名，中途崩溃不会损坏已有快照）
+
+        Args:
+            agent: 游戏代理
+        """
+        data = {"seq": self.seq, "messages": agent.messages, **_agent_state(agent)}
+        encoded = json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        temp_path = f"{self.snapshot_path}.tmp"
+        with open(temp_path, "wb") as f:
+            f.write(gzip.compress(encoded) if self.compress else encoded)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, self.snapshot_path)
+
+        # 快照已包含所有记录，日志从空文件重新开始；若在此之前崩溃，恢复时按序号跳过快照中已有的记录
+        self._close_file()
+        self._file = self._open_journal("wb")
+        self.records = 0
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+        self._messages_ref = agent.messages
+        self._message_count = len(agent.messages)
+        self._state = _agent_state(agent)
+
+    def load(self) -> Optional[Dict[str, Any]]:
+        """
+        读取快照并重放日志
+
+        Returns:
+            包含 messages 和 STATE_FIELDS 中各状态字段的字典，没有存档时返回 None
+        """
+        data = None
+        if os.path.exists(self.snapshot_path):
+            with open(self.snapshot_path, "rb") as f:
+                content = f.read()
+            data = json.loads(gzip.decompress(content) if self.compress else content)
+
+        snapshot_seq = data["seq"] if data else 0
+        seq = snapshot_seq
+        for record in self._read_journal():
+            if record["seq"] <= snapshot_seq:
+                continue
+            if data is None:
+                data = {"messages": [], **{field: None for field in STATE_FIELDS}, "action_prompt_sent": False}
+            if record["op"] == "append":
+                data["messages"].append(record["message"])
+            elif record["op"] == "state":
+                # 较早的存档中没有后来加入的字段
+                for field in STATE_FIELDS:
+                    data[field] = record.get(field)
+            seq = record["seq"]
+
+        if data is not None:
+            self.seq = seq
+        return data
+
+    def restore(self, agent) -> bool:
+        """
+        从存档恢复代理，之后的变化继续追加到同一份日志
+
+        Args:
+            agent: 游戏代理
+
+        Returns:
+            是否找到了存档
+        """
+        data = self.load()
+        if data is None:
+            return False
+        apply_state(agent, data)
+        # 恢复后立即压缩，日志从新的快照开始
+        self.snapshot(agent)
+        return True
+
+    def exists(self) -> bool:
+        """是否有存档"""
+        return os.path.exists(self.snapshot_path) or os.path.exists(self.journal_path)
+
+    def archive(self) -> bool:
+        """
+        将已有的存档移到一旁（文件名加 .bak，覆盖更早的备份）后重新开始，存档不会被删除
+
+        Returns:
+            是否有存档被移走
+        """
+        self._close_file()
+        moved = self.exists()
+        if moved:
+            for path in (self.snapshot_path, self.journal_path):
+                backup = f"{path}.bak"
+                if os.path.exists(path):
+                    os.replace(path, backup)
+                elif os.path.exists(backup):
+                    # 快照和日志成对备份，删除不属于这次存档的旧备份
+                    os.remove(backup)
+        self.reset()
+        return moved
+
+    def reset(self):
+        """删除已有的存档，重新开始"""
+        self._close_file()
+        for path in (self.snapshot_path, self.journal_path):
+            if os.path.exists(path):
+                os.remove(path)
+        self.seq = 0
+        self.records = 0
+        self._messages_ref = None
+        self._message_count = 0
+        self._state = None
+
+    def sync(self):
+        """将已写入的记录落盘"""
+        if self._file is not None:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._unsynced = 0
+            self._last_sync = time.monotonic()
+
+    def close(self):
+        """落盘并关闭日志文件"""
+        self._close_file()
+
+    def _append(self, record: Dict[str, Any]):
+        if self._file is None:
+            self._file = self._open_journal("ab")
+        self.seq += 1
+        line = json.dumps({"seq": self.seq, **record}, ensure_ascii=False, separators=(",", ":"))
+        self._file.write(line.encode("utf-8") + b"\n")
+        self.records += 1
+        self._unsynced += 1
+
+    def _maybe_sync(self):
+        """每次记录后写入操作系统缓冲区（进程崩溃不丢失），按条数或时间批量 fsync（断电最多丢失最近一批）"""
+        if self._file is None:
+            return
+        self._file.flush()
+        if self._unsynced >= self.fsync_every or time.monotonic() - self._last_sync >= self.fsync_interval:
+            self.sync()
+
+    def _open_journal(self, mode: str):
+        if self.compress:
+            return gzip.open(self.journal_path, mode)
+        return open(self.journal_path, mode)
+
+    def _close_file(self):
+        if self._file is not None:
+            self.sync()
+            self._file.close()
+            self._file = None
+
+    def _read_journal(self):
+        """逐条读取日志记录，忽略崩溃时未写完的最后一条"""
+        if not os.path.exists(self.journal_path):
+            return
+        opener = gzip.open if self.compress else open
+        with opener(self.journal_path, "rb") as f:
+            try:
+                for line in f:
+                    try:
+                        yield json.loads(line)
+                    except json.JSONDecodeError:
+                        return
+            except (EOFError, gzip.BadGzipFile):
+                return
+
+
+def _agent_state(agent) -> Dict[str, Any]:
+    return {field: getattr(agent, field, None) for field in STATE_FIELDS}
+
+
+def apply_state(agent, data: Dict[str, Any]):
+    """
+    将 load 读取的存档写回代理
+
+    Args:
+        agent: 游戏代理
+        data: 包含 messages 和状态字段的字典
+    """
+    # 开头的静态系统提示重新指向进程内共享的消息对象；环境信息等其余消息不放入共享表
+    agent.messages = [
+        shared_prompts.message(m["role"], m["content"]) if index == 0 and m.get("role") == "system" else m
+        for index, m in enumerate(data["messages"])
+    ]
+    for field in STATE_FIELDS:
+        if data.get(field) is not None:
+            setattr(agent, field, data[field])
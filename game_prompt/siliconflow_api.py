@@ -3,23 +3,74 @@ import sys
 
 # 将项目根目录添加到Python路径
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import copy
 import json
-import requests
-from typing import List, Dict, Any, Optional
+import inspect
+from typing import List, Dict, Any, Optional, Iterable, Iterator, AsyncIterator, Callable
 import dotenv
-from game_prompt.game_prompts import get_mood_prompt, action_prompt, system_prompt_init
+from game_prompt.game_prompts import (
+    get_mood_prompt, action_prompt, reask_prompt, system_prompt_init, tool_prompt, tool_reask_prompt,
+)
+from game_prompt.context_window import ContextWindow, MOOD_UPDATE_PREFIX
+from game_prompt.interning import shared_prompts
+from game_prompt.response_schema import JSON_OBJECT_FORMAT, parse_response
+from game_prompt.cascade import TIER_LARGE, TIER_SMALL
+from game_prompt.router import fork_client
+from game_prompt.prefix_cache import (
+    LAYOUT_LEGACY,
+    LAYOUT_PREFIX_CACHE,
+    PrefixStabilityTracker,
+    build_static_prompt,
+    build_state_message,
+)
+from game_prompt.stream_parser import (
+    IncrementalJSONReader,
+    iter_sse_data,
+    aiter_sse_data,
+    get_stream_delta,
+    get_stream_tool_call,
+)
+from game_prompt.tool_protocol import (
+    TOOL_CHOICE_REQUIRED, ToolCallStream, build_tools, first_tool_call, tool_call_text,
+)
+from game_prompt.tracing import tracer
+from game_prompt.http_transport import (
+    HTTPTransport,
+    AsyncHTTPTransport,
+    get_default_transport,
+    get_default_async_transport,
+)
+
+# SiliconFlow API 的默认地址
+SILICONFLOW_BASE_URL = "https://api.siliconflow.cn/v1"
+
+# 无法解析模型返回内容时使用的默认台词
+FALLBACK_SPEAK = "我...我不知道该怎么做..."
+# 重问时允许生成的最大令牌数（只需要一个简短的 JSON 对象）
+REASK_MAX_TOKENS = 300
+
+
+def siliconflow_base_url() -> str:
+    """SiliconFlow API 的地址，设置了环境变量 SILICONFLOW_BASE_URL 时使用该地址"""
+    return os.environ.get("SILICONFLOW_BASE_URL", SILICONFLOW_BASE_URL).rstrip("/")
 
 
 class SiliconFlowAPI:
     """SiliconFlow API 客户端，使用requests库直接调用API，支持历史消息功能"""
 
-    def __init__(self, api_key: Optional[str] = None, model: str = "Pro/deepseek-ai/DeepSeek-V3"):
+    def __init__(
+        self,
+        api_key: Optional[str] = None,
+        model: str = "Pro/deepseek-ai/DeepSeek-V3",
+        transport: Optional[HTTPTransport] = None,
+    ):
         """
         初始化 SiliconFlow API 客户端
 
         Args:
             api_key: SiliconFlow API 密钥，如果为 None，则从环境变量 SILICONFLOW_API_KEY 获取
             model: 使用的模型名称
+            transport: 共享的 HTTP 传输层，为 None 时使用进程内默认的连接池
         """
         self.api_key = api_key or os.environ.get("SILICONFLOW_API_KEY")
         if not self.api_key:
@@ -28,11 +79,14 @@ class SiliconFlowAPI:
             )
 
         self.model = model
-        self.base_url = "https://api.siliconflow.cn/v1/chat/completions"
+        self.transport = transport or get_default_transport()
+        # 可通过环境变量 SILICONFLOW_BASE_URL 指向兼容的服务（如 benchmarks 中的本地模拟服务）
+        self.base_url = f"{siliconflow_base_url()}/chat/completions"
         self.headers = {
             "Authorization": f"Bearer {self.api_key}",
             "Content-Type": "application/json"
         }
+        self.last_usage: Optional[Dict[str, Any]] = None  # 最近一次请求的令牌用量
 
     def chat(
         self,
@@ -46,6 +100,7 @@ class SiliconFlowAPI:
         n: int = 1,
         response_format: Dict[str, str] = {"type": "text"},
         tools: Optional[List[Dict[str, Any]]] = None,
+        tool_choice: Optional[str] = None,
     ) -> Dict[str, Any]:
         """
         发送聊天请求到 SiliconFlow API
@@ -61,10 +116,123 @@ class SiliconFlowAPI:
             n: 生成回复的数量
             response_format: 响应格式设置
             tools: 工具函数列表
+            tool_choice: 工具的选择方式（如 "required" 要求必须调用工具），为 None 时由服务端决定
 
         Returns:
-            API 响应
+            API 响应，流式请求时会将所有增量拼接成与非流式相同格式的响应
+        """
+        if stream:
+            content = "".join(
+                self.chat_stream(
+                    messages,
+                    temperature=temperature,
+                    max_tokens=max_tokens,
+                    top_p=top_p,
+                    top_k=top_k,
+                    frequency_penalty=frequency_penalty,
+                    response_format=response_format,
+                    tools=tools,
+                    tool_choice=tool_choice,
+                )
+            )
+            return {"choices": [{"message": {"role": "assistant", "content": content}}]}
+
+        payload = self._build_payload(
+            messages, temperature, max_tokens, False, top_p, top_k,
+            frequency_penalty, n, response_format, tools, tool_choice,
+        )
+
+        # 共享的静态消息使用缓存的 JSON 编码，不再逐轮重新序列化
+        body = shared_prompts.encode_payload(payload)
+        with tracer.span("llm.chat", model=self.model) as span:
+            response = self.transport.post(self.base_url, data=body, headers=self.headers)
+            
+            if response.status_code != 200:
+                raise Exception(f"API请求失败: {response.status_code} - {response.text}")
+
+            data = response.json()
+            # 本次请求的用量用局部变量记录，不受同一客户端上并发请求的影响
+            usage = data.get("usage")
+            self.last_usage = usage
+            span.set(usage=usage)
+        tracer.add_usage(usage)
+        return data
+
+    def chat_stream(
+        self,
+        messages: List[Dict[str, str]],
+        temperature: float = 0.7,
+        max_tokens: int = 1000,
+        top_p: float = 0.7,
+        top_k: int = 50,
+        frequency_penalty: float = 0.5,
+        response_format: Dict[str, str] = {"type": "text"},
+        tools: Optional[List[Dict[str, Any]]] = None,
+        tool_choice: Optional[str] = None,
+    ) -> Iterator[str]:
+        """
+        以 SSE 流式方式发送聊天请求，边生成边返回增量文本
+
+        Args:
+            messages: 消息历史列表
+            temperature: 温度参数
+            max_tokens: 最大生成的令牌数
+            top_p: 控制采样概率的参数
+            top_k: 控制采样时考虑的候选数量
+            frequency_penalty: 频率惩罚参数
+            response_format: 响应格式设置
+            tools: 工具函数列表，模型调用工具时参数按 tool_protocol 转换为响应 JSON 的增量文本
+            tool_choice: 工具的选择方式，见 chat
+
+        Returns:
+            增量文本的迭代器
         """
+        payload = self._build_payload(
+            messages, temperature, max_tokens, True, top_p, top_k,
+            frequency_penalty, 1, response_format, tools, tool_choice,
+        )
+
+        body = shared_prompts.encode_payload(payload)
+        # ttfb 为收到第一个数据块，first_delta 为收到第一段文本
+        span = tracer.span("llm.chat_stream", model=self.model)
+        with span, self.transport.post(self.base_url, data=body, headers=self.headers, stream=True) as response:
+            if response.status_code != 200:
+                raise Exception(f"API请求失败: {response.status_code} - {response.text}")
+
+            tool_stream = ToolCallStream()
+            usage = None
+            for chunk in iter_sse_data(response.iter_lines()):
+                span.mark("ttfb")
+                if chunk.get("usage"):
+                    usage = self.last_usage = chunk["usage"]
+                delta = get_stream_delta(chunk)
+                tool_call = get_stream_tool_call(chunk)
+                if tool_call is not None:
+                    delta += tool_stream.feed(*tool_call)
+                if delta:
+                    span.mark("first_delta")
+                    yield delta
+            tail = tool_stream.finish()
+            if tail:
+                yield tail
+            span.set(usage=usage)
+            tracer.add_usage(usage)
+
+    def _build_payload(
+        self,
+        messages: List[Dict[str, str]],
+        temperature: float,
+        max_tokens: int,
+        stream: bool,
+        top_p: float,
+        top_k: int,
+        frequency_penalty: float,
+        n: int,
+        response_format: Dict[str, str],
+        tools: Optional[List[Dict[str, Any]]],
+        tool_choice: Optional[str],
+    ) -> Dict[str, Any]:
+        """构造请求体"""
         payload = {
             "model": self.model,
             "messages": messages,
@@ -78,16 +246,13 @@ class SiliconFlowAPI:
             "n": n,
             "response_format": response_format,
         }
-        
+
         if tools:
             payload["tools"] = tools
+            if tool_choice:
+                payload["tool_choice"] = tool_choice
 
-        response = requests.post(self.base_url, json=payload, headers=self.headers)
-        
-        if response.status_code != 200:
-            raise Exception(f"API请求失败: {response.status_code} - {response.text}")
-            
-        return response.json()
+        return payload
 
     def get_response_content(self, response: Dict[str, Any]) -> str:
         """
@@ -97,12 +262,16 @@ class SiliconFlowAPI:
             response: API 响应
 
         Returns:
-            响应内容
+            响应内容，模型调用了工具时为转换后的响应 JSON
         """
         # 根据SiliconFlow API的响应格式提取内容
         if "choices" in response and len(response["choices"]) > 0:
             if "message" in response["choices"][0]:
-                return response["choices"][0]["message"]["content"]
+                message = response["choices"][0]["message"]
+                tool_call = first_tool_call(message.get("tool_calls"))
+                if tool_call is not None:
+                    return tool_call_text(*tool_call)
+                return message["content"]
             elif "text" in response["choices"][0]:
                 return response["choices"][0]["text"]
         return ""
@@ -111,18 +280,62 @@ class SiliconFlowAPI:
 class GameAgent:
     """游戏代理，管理与 SiliconFlow API 的交互和消息历史"""
 
-    def __init__(self, api_key: Optional[str] = None, model: str = "Pro/deepseek-ai/DeepSeek-V3"):
+    def __init__(
+        self,
+        api_key: Optional[str] = None,
+        model: str = "Pro/deepseek-ai/DeepSeek-V3",
+        transport: Optional[HTTPTransport] = None,
+        context_window: Optional[ContextWindow] = None,
+        layout: str = LAYOUT_LEGACY,
+        api=None,
+        journal=None,
+        response_format: Optional[Dict[str, str]] = JSON_OBJECT_FORMAT,
+        max_reasks: int = 1,
+        cascade=None,
+        tool_targets: Optional[Callable[[], Iterable[str]]] = None,
+    ):
         """
         初始化游戏代理
 
         Args:
             api_key: SiliconFlow API 密钥
             model: 使用的模型名称
+            transport: 共享的 HTTP 传输层，可与语音合成客户端共用同一个连接池
+            context_window: 上下文窗口管理器，设置后每轮请求前按令牌预算压缩消息历史
+            layout: 消息布局。"legacy" 为原有方式；"prefix_cache" 将所有会话一致的静态提示放在最前，
+                    环境和心情只在请求末尾以一条状态消息发送，使服务端的上下文缓存能够命中
+                    （WorldState 的环境更新追加到历史，见 update_environment）
+            api: 对话后端（如在多个服务商之间路由的 HedgedRouter），设置后不再使用 api_key、model 和 transport
+            journal: 会话日志（SessionJournal），设置后每轮结束和状态变化时追加记录，实现逐轮自动保存
+            response_format: 请求的输出格式，默认要求模型输出 JSON 对象，为 None 时不指定
+            max_reasks: 返回内容经本地提取和修正后仍不符合格式时，最多重问几次
+            cascade: 模型级联（ModelCascade），设置后简单的输入先由小模型回答，不合格时再请求 api
+            tool_targets: 返回当前环境中物体 ID 的函数（如 WorldState.target_ids）。设置后使用工具调用协议：
+                          动作作为 move、interact、none 工具发送，目标只能是这些 ID，不再发送 JSON 示例
         """
-        self.api = SiliconFlowAPI(api_key, model)
+        if layout not in (LAYOUT_LEGACY, LAYOUT_PREFIX_CACHE):
+            raise ValueError(f"未知的消息布局: {layout}")
+
+        self.api = api or SiliconFlowAPI(api_key, model, transport=transport)
         self.messages = []
         self.mood = "轻微紧张"  # 初始心情状态
         self.action_prompt_sent = False  # 添加标志，跟踪是否已发送action_prompt
+        self.context_window = context_window
+        self.layout = layout
+        self.environment: Optional[str] = None  # 最新的环境信息（prefix_cache 布局使用）
+        # 最新的环境信息已追加到消息历史中，不再放入请求末尾的状态消息
+        self.environment_in_history = layout != LAYOUT_PREFIX_CACHE
+        self.world_state: Optional[Dict[str, Any]] = None  # 游戏世界的可变状态（WorldState.export_state），随日志保存
+        # 统计相邻两轮请求的稳定前缀，prefix_cache 布局下默认开启
+        self.prefix_tracker = PrefixStabilityTracker() if layout == LAYOUT_PREFIX_CACHE else None
+        self.journal = journal
+        self.response_format = response_format
+        self.max_reasks = max_reasks
+        self.repaired = 0  # 经本地提取和修正才符合格式的返回数
+        self.reasks = 0  # 重问次数
+        self.fallbacks = 0  # 最终仍不符合格式、使用默认响应的次数
+        self.cascade = cascade
+        self.tool_targets = tool_targets
 
     def initialize_game(self, system_prompt: str):
         """
@@ -131,18 +344,31 @@ class GameAgent:
         Args:
             system_prompt: 系统提示内容
         """
-        # 添加心情值相关的系统提示
-        mood_prompt = get_mood_prompt(self.mood)
-        self.messages = [{"role": "system", "content": system_prompt + mood_prompt}]
+        if self.layout == LAYOUT_PREFIX_CACHE:
+            # 静态提示中不包含心情，心情随状态消息放在请求末尾
+            self.messages = [shared_prompts.message("system", build_static_prompt(system_prompt, self._action_prompt()))]
+            self.action_prompt_sent = True
+        else:
+            # 添加心情值相关的系统提示
+            mood_prompt = get_mood_prompt(self.mood)
+            self.messages = [shared_prompts.message("system", system_prompt + mood_prompt)]
+        self._autosave()
 
-    def update_environment(self, environment_info: str):
+    def update_environment(self, environment_info: str, append: bool = False):
         """
         更新环境信息
 
         Args:
             environment_info: 环境信息内容
+            append: prefix_cache 布局下也追加到消息历史（如 WorldState 的增量更新，只发送一次，之后成为稳定前缀的一部分），
+                    不再放入请求末尾的状态消息；legacy 布局始终追加
         """
-        self.messages.append({"role": "system", "content": environment_info})
+        # 环境信息每轮都可能变化，不放入共享表（只共享静态提示）
+        self.environment = environment_info
+        self.environment_in_history = append or self.layout != LAYOUT_PREFIX_CACHE
+        if self.environment_in_history:
+            self.messages.append({"role": "system", "content": self.environment})
+        self._autosave()
 
     def update_mood(self, mood: str):
         """
@@ -152,8 +378,10 @@ class GameAgent:
             mood: 新的心情状态，可以是"平静"、"轻微紧张"、"中度紧张"、"极度恐慌"或"惊慌失措"
         """
         self.mood = mood
-        mood_update = f"你的心情状态现在是 {self.mood}。"
-        self.messages.append({"role": "system", "content": mood_update})
+        if self.layout == LAYOUT_PREFIX_CACHE:
+            return
+        mood_update = f"{MOOD_UPDATE_PREFIX} {self.mood}。"
+        self.messages.append(shared_prompts.message("system", mood_update))
 
     def process_user_input(self, user_input: str) -> Dict[str, Any]:
         """
@@ -165,44 +393,266 @@ class GameAgent:
         Returns:
             代理响应，包含动作和说话内容
         """
+        with tracer.span("agent.prepare"):
+            self._begin_turn(user_input)
+            messages = self._request_messages()
+
+        # 简单的输入先由小模型回答
+        response_content = self._small_reply(user_input, messages)
+        if response_content is not None:
+            return self._finish_turn(response_content)
+
+        # 调用 API 获取响应
+        response = self.api.chat(messages, **self._chat_options())
+        response_content = self.api.get_response_content(response)
+        self._record_usage()
+
+        return self._finish_turn(self._ensure_valid(response_content))
+
+    def process_user_input_stream(
+        self,
+        user_input: str,
+        on_speak_delta: Optional[Callable[[str], None]] = None,
+        on_field: Optional[Callable[[str, str], None]] = None,
+        on_retract: Optional[Callable[[], None]] = None,
+    ) -> Dict[str, Any]:
+        """
+        以流式方式处理用户输入，在模型生成过程中回调已读取的字段
 
+        Args:
+            user_input: 用户输入内容
+            on_speak_delta: "speak" 字段每有新增文本时调用，参数为新增文本
+            on_field: 顶层字符串字段（action、target、speak、mood）读取完整时调用，参数为字段名和值
+            on_retract: 已回调的 "speak" 被替换时调用（返回不合格，重问得到了新的回复或使用了默认响应），
+                        调用方应停止播放已收到的台词；之后以最终响应重新回调 on_speak_delta 和 on_field
+
+        Returns:
+            代理响应，与 process_user_input 的返回相同
+        """
+        with tracer.span("agent.prepare"):
+            self._begin_turn(user_input)
+            messages = self._request_messages()
+
+        # 小模型的回复很短，不流式请求：通过校验后再一次性回调，不合格的回复不会被播放
+        response_content = self._small_reply(user_input, messages)
+        deltas = [response_content] if response_content is not None else None
+        if deltas is None:
+            deltas = self.api.chat_stream(messages, **self._chat_options())
+
+        reader = IncrementalJSONReader()
+        spoken = []
+        for delta in deltas:
+            for event, key, text in reader.feed(delta):
+                if event == "delta" and key == "speak":
+                    spoken.append(text)
+                    if on_speak_delta:
+                        on_speak_delta(text)
+                elif event == "field" and on_field:
+                    on_field(key, text)
+
+        if response_content is not None:
+            return self._finish_turn(response_content)
+        self._record_usage()
+        response_data = self._finish_turn(self._ensure_valid(reader.text))
+        if on_retract and _speak_replaced("".join(spoken), response_data):
+            on_retract()
+            for event in _replay_events(response_data):
+                _deliver_event(event, on_speak_delta, on_field)
+        return response_data
+
+    def record_turn(self, user_input: str, response_content: str) -> Dict[str, Any]:
+        """
+        不请求模型，直接以给定的响应完成一轮（如本地快速通道给出的响应），消息历史与请求模型时相同
+
+        Args:
+            user_input: 用户输入内容
+            response_content: 响应的 JSON 文本
+
+        Returns:
+            代理响应
+        """
+        self._begin_turn(user_input)
+        return self._finish_turn(response_content)
+
+    def _begin_turn(self, user_input: str):
+        """在请求模型前将动作提示和用户消息加入历史"""
         # 只在第一次发送动作提示
         if not self.action_prompt_sent:
-            self.messages.append({"role": "system", "content": action_prompt})
+            self.messages.append(shared_prompts.message("system", self._action_prompt()))
             self.action_prompt_sent = True
 
         # 添加用户消息到历史
         self.messages.append({"role": "user", "content": user_input})
 
-        # 调用 API 获取响应
-        response = self.api.chat(self.messages)
-        response_content = self.api.get_response_content(response)
-
-        # 解析响应
+        # 超出令牌预算时压缩历史
+        if self.context_window is not None:
+            self.messages = self.context_window.compact(self.messages)
+
+    def _request_messages(self) -> List[Dict[str, str]]:
+        """构造本轮实际发送的消息列表"""
+        messages = self.messages
+        if self.layout == LAYOUT_PREFIX_CACHE:
+            # 易变状态放在最后，之前的内容与上一轮请求保持字节一致
+            messages = messages + [self._state_message()]
+        if self.prefix_tracker is not None:
+            self.prefix_tracker.record(messages)
+        return messages
+
+    def _state_message(self) -> Dict[str, str]:
+        """prefix_cache 布局放在请求末尾的状态消息，已追加到历史中的环境信息不重复发送"""
+        return build_state_message(None if self.environment_in_history else self.environment, self.mood)
+
+    def _action_prompt(self) -> str:
+        """动作提示：工具调用协议只需要简短的说明"""
+        return tool_prompt if self.tool_targets is not None else action_prompt
+
+    def _reask_prompt(self) -> str:
+        """重问提示：工具调用协议要求重新调用工具"""
+        return tool_reask_prompt if self.tool_targets is not None else reask_prompt
+
+    def _chat_options(self) -> Dict[str, Any]:
+        """请求模型时的附加参数"""
+        if self.tool_targets is not None:
+            return {"tools": build_tools(self.tool_targets()), "tool_choice": TOOL_CHOICE_REQUIRED}
+        if self.response_format is None:
+            return {}
+        return {"response_format": self.response_format}
+
+    def _ensure_valid(self, response_content: str) -> str:
+        """返回内容在本地无法修正为合法响应时，带上错误原因简短重问，最多 max_reasks 次"""
+        for _ in range(self.max_reasks):
+            response_data, errors = parse_response(response_content, self.mood)
+            if response_data is not None:
+                break
+            response = self.api.chat(
+                self._reask_messages(response_content, errors),
+                max_tokens=REASK_MAX_TOKENS,
+                **self._chat_options(),
+            )
+            self.reasks += 1
+            response_content = self.api.get_response_content(response)
+        return response_content
+
+    def _reask_messages(self, response_content: str, errors: List[str]) -> List[Dict[str, str]]:
+        """重问的消息列表：原请求加上不合格的返回和一条指出错误的系统消息"""
+        messages = self.messages
+        if self.layout == LAYOUT_PREFIX_CACHE:
+            messages = messages + [self._state_message()]
+        return messages + [
+            {"role": "assistant", "content": response_content},
+            {"role": "system", "content": self._reask_prompt().format(errors="；".join(errors))},
+        ]
+
+    def _small_reply(self, user_input: str, messages: List[Dict[str, str]]) -> Optional[str]:
+        """级联时由小模型回答简单的输入，不需要小模型或其返回不合格时返回 None"""
+        cascade = self.cascade
+        if cascade is None or cascade.choose(user_input, self.mood) != TIER_SMALL:
+            return None
         try:
-            response_data = json.loads(response_content)
-            # 添加代理响应到历史
-            self.messages.append({"role": "assistant", "content": response_content})
-            # 更新心情状态
-            if "mood" in response_data:
+            response = cascade.api.chat(messages, max_tokens=cascade.max_tokens, **self._chat_options())
+            response_content = cascade.api.get_response_content(response)
+        except Exception as e:
+            # 小模型不可用时改由大模型回答，不影响本轮
+            cascade.fail(e)
+            return None
+        cascade.charge(TIER_SMALL, getattr(cascade.api, "last_usage", None))
+        if not cascade.accept(response_content, self.mood):
+            return None
+        cascade.record(TIER_SMALL)
+        return response_content
+
+    def _record_usage(self):
+        """记录服务端返回的令牌用量（含缓存命中）"""
+        usage = getattr(self.api, "last_usage", None)
+        if self.prefix_tracker is not None:
+            self.prefix_tracker.record_usage(usage)
+        if self.cascade is not None:
+            self.cascade.charge(TIER_LARGE, usage)
+            self.cascade.record(TIER_LARGE)
+
+    def _finish_turn(self, response_content: str) -> Dict[str, Any]:
+        """解析模型返回内容并记录到历史"""
+        with tracer.span("agent.finish"):
+            # 解析响应：提取 JSON（去掉代码块、多余的逗号，处理截断）并按格式校验
+            response_data, _ = parse_response(response_content, self.mood)
+            if response_data is not None:
+                content = json.dumps(response_data, ensure_ascii=False)
+                if content != response_content:
+                    try:
+                        if json.loads(response_content) != response_data:
+                            self.repaired += 1
+                    except json.JSONDecodeError:
+                        self.repaired += 1
+                # 添加代理响应到历史（修正后的 JSON，保证历史中的示例都符合格式）
+                self.messages.append({"role": "assistant", "content": content})
+                # 更新心情状态
                 self.update_mood(response_data["mood"])
+            else:
+                # 如果无法得到合法的响应，则返回一个默认响应
+                self.fallbacks += 1
+                response_data = {
+                    "action": "none",
+                    "target": "none",
+                    "speak": FALLBACK_SPEAK,
+                    "mood": self.mood,
+                }
+                self.messages.append(
+                    {"role": "assistant", "content": json.dumps(response_data)}
+                )
+            self._autosave()
             return response_data
-        except json.JSONDecodeError:
-            # 如果无法解析JSON，则返回一个默认响应
-            default_response = {
-                "action": "none",
-                "target": "none",
-                "speak": "我...我不知道该怎么做...",
-                "mood": self.mood,
-            }
-            self.messages.append(
-                {"role": "assistant", "content": json.dumps(default_response)}
-            )
-            return default_response
+
+    def _autosave(self):
+        """设置了会话日志时，追加自上次保存以来的变化"""
+        if self.journal is not None:
+            self.journal.record(self)
+
+    def fork(self) -> "GameAgent":
+        """
+        复制一个可以独立推进的代理，用于推测执行。复制体与原代理共用连接池，
+        但消息历史、统计和每次请求的令牌用量是独立的，复制体处理输入不会改变原代理
+
+        Returns:
+            复制的代理
+        """
+        forked = copy.copy(self)
+        forked.messages = list(self.messages)
+        forked.prefix_tracker = copy.deepcopy(self.prefix_tracker)
+        # 复制体的推进不写入日志，被采用时由原代理记录
+        forked.journal = None
+        # 客户端复制一份：推测请求与正式的一轮同时进行时，各自读取自己的 last_usage
+        forked.api = fork_client(self.api)
+        # 级联的统计同样独立，被采用时并入
+        if self.cascade is not None:
+            forked.cascade = self.cascade.fork()
+        return forked
+
+    def adopt(self, forked: "GameAgent"):
+        """
+        采用复制体推进后的状态（消息历史、心情、环境和统计，包括级联的统计）
+
+        Args:
+            forked: 由 fork 得到的代理
+        """
+        messages = forked.messages
+        if len(messages) >= len(self.messages) and all(a is b for a, b in zip(self.messages, messages)):
+            # 复制体只在原历史之后追加了消息：原地扩展，会话日志只需追加新消息
+            self.messages.extend(messages[len(self.messages):])
+        else:
+            self.messages = messages
+        self.mood = forked.mood
+        self.action_prompt_sent = forked.action_prompt_sent
+        self.environment = forked.environment
+        self.environment_in_history = forked.environment_in_history
+        self.prefix_tracker = forked.prefix_tracker
+        self.repaired, self.reasks, self.fallbacks = forked.repaired, forked.reasks, forked.fallbacks
+        if self.cascade is not None and forked.cascade is not self.cascade:
+            self.cascade.merge(forked.cascade)
+        self._autosave()
 
     def save_messages(self, file_path: str):
         """
-        保存消息历史到文件
+        保存消息历史到文件（每次重写完整历史；逐轮自动保存请使用 journal）
 
         Args:
             file_path: 文件路径
@@ -221,6 +671,311 @@ class GameAgent:
             self.messages = json.load(f)
 
 
+class AsyncSiliconFlowAPI(SiliconFlowAPI):
+    """SiliconFlow API 的异步客户端，请求参数和返回格式与 SiliconFlowAPI 相同"""
+
+    def __init__(
+        self,
+        api_key: Optional[str] = None,
+        model: str = "Pro/deepseek-ai/DeepSeek-V3",
+        transport: Optional[AsyncHTTPTransport] = None,
+    ):
+        """
+        初始化异步客户端
+
+        Args:
+            api_key: SiliconFlow API 密钥，如果为 None，则从环境变量 SILICONFLOW_API_KEY 获取
+            model: 使用的模型名称
+            transport: 异步 HTTP 传输层，为 None 时使用默认的异步连接池
+        """
+        super().__init__(api_key, model, transport=transport or get_default_async_transport())
+
+    async def chat(
+        self,
+        messages: List[Dict[str, str]],
+        temperature: float = 0.7,
+        max_tokens: int = 1000,
+        stream: bool = False,
+        top_p: float = 0.7,
+        top_k: int = 50,
+        frequency_penalty: float = 0.5,
+        n: int = 1,
+        response_format: Dict[str, str] = {"type": "text"},
+        tools: Optional[List[Dict[str, Any]]] = None,
+        tool_choice: Optional[str] = None,
+    ) -> Dict[str, Any]:
+        """
+        异步发送聊天请求，参数与 SiliconFlowAPI.chat 相同
+
+        Returns:
+            API 响应
+        """
+        if stream:
+            parts = []
+            async for delta in self.chat_stream(
+                messages,
+                temperature=temperature,
+                max_tokens=max_tokens,
+                top_p=top_p,
+                top_k=top_k,
+                frequency_penalty=frequency_penalty,
+                response_format=response_format,
+                tools=tools,
+                tool_choice=tool_choice,
+            ):
+                parts.append(delta)
+            return {"choices": [{"message": {"role": "assistant", "content": "".join(parts)}}]}
+
+        payload = self._build_payload(
+            messages, temperature, max_tokens, False, top_p, top_k,
+            frequency_penalty, n, response_format, tools, tool_choice,
+        )
+
+        body = shared_prompts.encode_payload(payload)
+        with tracer.span("llm.chat", model=self.model) as span:
+            response = await self.transport.post(self.base_url, data=body, headers=self.headers)
+
+            if response.status_code != 200:
+                raise Exception(f"API请求失败: {response.status_code} - {await response.text()}")
+
+            data = await response.json()
+            # 本次请求的用量用局部变量记录，不受同一客户端上并发请求的影响
+            usage = data.get("usage")
+            self.last_usage = usage
+            span.set(usage=usage)
+        tracer.add_usage(usage)
+        return data
+
+    async def chat_stream(
+        self,
+        messages: List[Dict[str, str]],
+        temperature: float = 0.7,
+        max_tokens: int = 1000,
+        top_p: float = 0.7,
+        top_k: int = 50,
+        frequency_penalty: float = 0.5,
+        response_format: Dict[str, str] = {"type": "text"},
+        tools: Optional[List[Dict[str, Any]]] = None,
+        tool_choice: Optional[str] = None,
+    ) -> AsyncIterator[str]:
+        """
+        以 SSE 流式方式异步发送聊天请求，参数与 SiliconFlowAPI.chat_stream 相同
+
+        Returns:
+            增量文本的异步迭代器
+        """
+        payload = self._build_payload(
+            messages, temperature, max_tokens, True, top_p, top_k,
+            frequency_penalty, 1, response_format, tools, tool_choice,
+        )
+
+        body = shared_prompts.encode_payload(payload)
+        # 与同步客户端记录相同的区间和时间点，服务器的记录可以与本地游戏直接比较
+        span = tracer.span("llm.chat_stream", model=self.model)
+        with span:
+            response = await self.transport.post(self.base_url, data=body, headers=self.headers, stream=True)
+            async with response:
+                if response.status_code != 200:
+                    raise Exception(f"API请求失败: {response.status_code} - {await response.text()}")
+
+                tool_stream = ToolCallStream()
+                usage = None
+                async for chunk in aiter_sse_data(response.iter_lines()):
+                    span.mark("ttfb")
+                    if chunk.get("usage"):
+                        usage = self.last_usage = chunk["usage"]
+                    delta = get_stream_delta(chunk)
+                    tool_call = get_stream_tool_call(chunk)
+                    if tool_call is not None:
+                        delta += tool_stream.feed(*tool_call)
+                    if delta:
+                        span.mark("first_delta")
+                        yield delta
+                tail = tool_stream.finish()
+                if tail:
+                    yield tail
+                span.set(usage=usage)
+                tracer.add_usage(usage)
+
+
+class AsyncGameAgent(GameAgent):
+    """异步游戏代理，消息历史的管理方式与 GameAgent 相同，只有网络请求是异步的"""
+
+    def __init__(
+        self,
+        api_key: Optional[str] = None,
+        model: str = "Pro/deepseek-ai/DeepSeek-V3",
+        transport: Optional[AsyncHTTPTransport] = None,
+        context_window: Optional[ContextWindow] = None,
+        layout: str = LAYOUT_LEGACY,
+        journal=None,
+        response_format: Optional[Dict[str, str]] = JSON_OBJECT_FORMAT,
+        max_reasks: int = 1,
+        cascade=None,
+        tool_targets: Optional[Callable[[], Iterable[str]]] = None,
+    ):
+        """
+        初始化异步游戏代理
+
+        Args:
+            api_key: SiliconFlow API 密钥
+            model: 使用的模型名称
+            transport: 异步 HTTP 传输层，多个代理可共用同一个连接池
+            context_window: 上下文窗口管理器
+            layout: 消息布局，见 GameAgent
+            journal: 会话日志，见 GameAgent
+            response_format: 请求的输出格式，见 GameAgent
+            max_reasks: 最多重问次数，见 GameAgent
+            cascade: 模型级联，小模型的客户端需为异步客户端，见 GameAgent
+            tool_targets: 使用工具调用协议时返回当前环境中物体 ID 的函数，见 GameAgent
+        """
+        super().__init__(
+            api_key, model,
+            transport=transport or get_default_async_transport(),
+            context_window=context_window,
+            layout=layout,
+            journal=journal,
+            response_format=response_format,
+            max_reasks=max_reasks,
+            cascade=cascade,
+            tool_targets=tool_targets,
+        )
+        self.api = AsyncSiliconFlowAPI(api_key, model, transport=self.api.transport)
+
+    async def process_user_input(self, user_input: str) -> Dict[str, Any]:
+        """
+        异步处理用户输入并获取代理响应
+
+        Args:
+            user_input: 用户输入内容
+
+        Returns:
+            代理响应，包含动作和说话内容
+        """
+        with tracer.span("agent.prepare"):
+            self._begin_turn(user_input)
+            messages = self._request_messages()
+
+        response_content = await self._small_reply_async(user_input, messages)
+        if response_content is not None:
+            return self._finish_turn(response_content)
+
+        response = await self.api.chat(messages, **self._chat_options())
+        response_content = self.api.get_response_content(response)
+        self._record_usage()
+
+        return self._finish_turn(await self._ensure_valid_async(response_content))
+
+    async def process_user_input_stream(
+        self,
+        user_input: str,
+        on_speak_delta: Optional[Callable[[str], Any]] = None,
+        on_field: Optional[Callable[[str, str], Any]] = None,
+        on_retract: Optional[Callable[[], Any]] = None,
+    ) -> Dict[str, Any]:
+        """
+        以流式方式异步处理用户输入，回调可以是普通函数或协程函数
+
+        Args:
+            user_input: 用户输入内容
+            on_speak_delta: "speak" 字段每有新增文本时调用
+            on_field: 顶层字符串字段读取完整时调用
+            on_retract: 已回调的 "speak" 被替换时调用，见 GameAgent.process_user_input_stream
+
+        Returns:
+            代理响应，与 process_user_input 的返回相同
+        """
+        with tracer.span("agent.prepare"):
+            self._begin_turn(user_input)
+            messages = self._request_messages()
+        reader = IncrementalJSONReader()
+        spoken = []
+
+        async def feed(delta):
+            for event, key, text in reader.feed(delta):
+                if event == "delta" and key == "speak":
+                    spoken.append(text)
+                    if on_speak_delta:
+                        await _maybe_await(on_speak_delta(text))
+                elif event == "field" and on_field:
+                    await _maybe_await(on_field(key, text))
+
+        response_content = await self._small_reply_async(user_input, messages)
+        if response_content is not None:
+            await feed(response_content)
+            return self._finish_turn(response_content)
+
+        async for delta in self.api.chat_stream(messages, **self._chat_options()):
+            await feed(delta)
+
+        self._record_usage()
+        response_data = self._finish_turn(await self._ensure_valid_async(reader.text))
+        if on_retract and _speak_replaced("".join(spoken), response_data):
+            await _maybe_await(on_retract())
+            for event in _replay_events(response_data):
+                await _maybe_await(_deliver_event(event, on_speak_delta, on_field))
+        return response_data
+
+    async def _small_reply_async(self, user_input: str, messages: List[Dict[str, str]]) -> Optional[str]:
+        """_small_reply 的异步版本"""
+        cascade = self.cascade
+        if cascade is None or cascade.choose(user_input, self.mood) != TIER_SMALL:
+            return None
+        try:
+            response = await cascade.api.chat(messages, max_tokens=cascade.max_tokens, **self._chat_options())
+            response_content = cascade.api.get_response_content(response)
+        except Exception as e:
+            cascade.fail(e)
+            return None
+        cascade.charge(TIER_SMALL, getattr(cascade.api, "last_usage", None))
+        if not cascade.accept(response_content, self.mood):
+            return None
+        cascade.record(TIER_SMALL)
+        return response_content
+
+    async def _ensure_valid_async(self, response_content: str) -> str:
+        """_ensure_valid 的异步版本"""
+        for _ in range(self.max_reasks):
+            response_data, errors = parse_response(response_content, self.mood)
+            if response_data is not None:
+                break
+            response = await self.api.chat(
+                self._reask_messages(response_content, errors),
+                max_tokens=REASK_MAX_TOKENS,
+                **self._chat_options(),
+            )
+            self.reasks += 1
+            response_content = self.api.get_response_content(response)
+        return response_content
+
+
+def _speak_replaced(spoken: str, response_data: Dict[str, Any]) -> bool:
+    """流式回调过的台词与最终响应的台词不同（重问或使用了默认响应）"""
+    return bool(spoken) and spoken != response_data["speak"]
+
+
+def _replay_events(response_data: Dict[str, Any]):
+    """以完整响应重新回调时的事件：先是完整的 speak，再按顺序是各字符串字段"""
+    yield "delta", "speak", response_data["speak"]
+    for key, value in response_data.items():
+        if isinstance(value, str):
+            yield "field", key, value
+
+
+def _deliver_event(event, on_speak_delta, on_field):
+    """按事件类型调用回调，返回回调的结果（异步回调时为协程）"""
+    kind, key, value = event
+    if kind == "delta":
+        return on_speak_delta(value) if on_speak_delta else None
+    return on_field(key, value) if on_field else None
+
+
+async def _maybe_await(result):
+    """如果回调返回了协程则等待它完成"""
+    if inspect.isawaitable(result):
+        await result
+
+
 # 使用示例
 if __name__ == "__main__":
     # 从 game_prompts.py 导入系统提示
@@ -0,0 +1,237 @@
+import re
+import threading
+from typing import Any, Callable, Dict, Iterable, Optional
+
+from game_prompt.tracing import tracer
+
+# 比较识别结果时忽略标点和空白：最终结果通常只比中间结果多一个句末标点
+_IGNORED_CHARS = re.compile(r"[\W_]+")
+
+
+def normalize_transcript(text: str) -> str:
+    """
+    规范化识别文本，用于比较中间结果和最终结果
+
+    Args:
+        text: 识别文本
+
+    Returns:
+        去掉标点和空白、转为小写后的文本
+    """
+    return _IGNORED_CHARS.sub("", text).lower()
+
+
+class SpeculationCancelled(Exception):
+    """推测执行已取消，在回调中抛出以中断复制代理的流式请求"""
+
+
+class _SpeculativeRun:
+    """一次推测执行：在后台线程中用复制的代理处理输入，回调事件先缓存，采用后按顺序转发"""
+
+    def __init__(self, agent, text: str):
+        self.text = text
+        self.key = normalize_transcript(text)
+        self.state = _agent_state(agent)
+        self.forked = agent.fork()
+        self.response: Optional[Dict[str, Any]] = None
+        self.error: Optional[Exception] = None
+        self._events = []
+        self._target = None
+        self._cancelled = False
+        self._lock = threading.Lock()
+        self._done = threading.Event()
+        # 推测请求的耗时单独记录，被采用时并入最终的轮次，被取消时丢弃
+        self.trace = tracer.detached(speculative=True)
+        self._thread = threading.Thread(target=tracer.bind(self._run, self.trace), daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        try:
+            self.response = self.forked.process_user_input_stream(
+                self.text,
+                on_speak_delta=lambda text: self._dispatch(("delta", text)),
+                on_field=lambda key, value: self._dispatch(("field", key, value)),
+                on_retract=lambda: self._dispatch(("retract",)),
+            )
+        except Exception as e:
+            self.error = e
+        finally:
+            self._done.set()
+
+    def _dispatch(self, event):
+        # 在锁内转发，保证缓存的事件和之后的事件按生成顺序送达
+        with self._lock:
+            if self._cancelled:
+                raise SpeculationCancelled()
+            if self._target is None:
+                self._events.append(event)
+            else:
+                _deliver(self._target, event)
+
+    def attach(self, on_speak_delta, on_field, on_retract=None):
+        """采用本次推测：先补发已缓存的事件，之后的事件直接转发"""
+        with self._lock:
+            self._target = (on_speak_delta, on_field, on_retract)
+            for event in self._events:
+                _deliver(self._target, event)
+            self._events = []
+
+    def wait(self) -> Dict[str, Any]:
+        """等待推测请求完成并返回响应"""
+        self._done.wait()
+        if self.error is not None:
+            raise self.error
+        return self.response
+
+    def cancel(self):
+        """放弃本次推测，复制代理在下一次回调时中断请求"""
+        with self._lock:
+            self._cancelled = True
+            self._events = []
+
+
+class SpeculativeTurns:
+    """
+    根据稳定的语音识别中间结果提前发起对话请求：请求在复制的代理上执行，
+    最终结果与推测的文本一致时采用，不一致时取消，原代理的消息历史保持不变
+    """
+
+    def __init__(
+        self,
+        agent,
+        stable_updates: int = 2,
+        min_chars: int = 2,
+        skip: Iterable[str] = (),
+    ):
+        """
+        初始化推测执行
+
+        Args:
+            agent: 游戏代理（GameAgent），需支持 fork 和 adopt
+            stable_updates: 同一中间结果连续出现多少次视为稳定
+            min_chars: 推测所需的最少字符数（规范化后）
+            skip: 不进行推测的输入（如 "退出"、"保存" 等特殊命令）
+        """
+        self.agent = agent
+        self.stable_updates = stable_updates
+        self.min_chars = min_chars
+        self.skip = {normalize_transcript(text) for text in skip}
+        self.started = 0  # 发起的推测请求数
+        self.hits = 0  # 最终结果与推测一致并被采用的次数
+        self.misses = 0  # 有推测但最终结果不一致的次数
+        self.unspeculated = 0  # 最终结果到达时没有推测请求的次数
+        self._pending: Optional[_SpeculativeRun] = None
+        self._last_key = None
+        self._repeats = 0
+        self._lock = threading.Lock()
+
+    def on_partial(self, text: str):
+        """
+        接收语音识别的中间结果，可在识别回调线程中调用
+
+        Args:
+            text: 中间结果
+        """
+        key = normalize_transcript(text)
+        with self._lock:
+            if key == self._last_key:
+                self._repeats += 1
+            else:
+                self._last_key = key
+                self._repeats = 1
+            if (
+                self._repeats < self.stable_updates
+                or len(key) < self.min_chars
+                or key in self.skip
+                or (self._pending is not None and self._pending.key == key)
+            ):
+                return
+            # 新的稳定结果取代之前的推测
+            previous, self._pending = self._pending, _SpeculativeRun(self.agent, text)
+            self.started += 1
+        if previous is not None:
+            previous.cancel()
+
+    def run(
+        self,
+        user_input: str,
+        on_speak_delta: Optional[Callable[[str], None]] = None,
+        on_field: Optional[Callable[[str, str], None]] = None,
+        on_retract: Optional[Callable[[], None]] = None,
+    ) -> Dict[str, Any]:
+        """
+        处理最终识别结果，参数和返回值与 GameAgent.process_user_input_stream 相同。
+        推测命中时等待推测请求完成并采用其状态，否则取消推测并正常处理
+
+        Args:
+            user_input: 最终识别结果
+            on_speak_delta: "speak" 字段每有新增文本时调用
+            on_field: 顶层字符串字段读取完整时调用
+            on_retract: 已回调的 "speak" 被替换时调用
+
+        Returns:
+            代理响应
+        """
+        with self._lock:
+            pending, self._pending = self._pending, None
+            self._last_key = None
+            self._repeats = 0
+
+        if pending is None:
+            self.unspeculated += 1
+        elif pending.key == normalize_transcript(user_input) and pending.state == _agent_state(self.agent):
+            self.hits += 1
+            pending.attach(on_speak_delta, on_field, on_retract)
+            response = pending.wait()
+            self.agent.adopt(pending.forked)
+            tracer.merge(pending.trace)
+            return response
+        else:
+            self.misses += 1
+            pending.cancel()
+
+        return self.agent.process_user_input_stream(
+            user_input, on_speak_delta=on_speak_delta, on_field=on_field, on_retract=on_retract
+        )
+
+    def discard(self):
+        """取消尚未采用的推测（如最终结果是特殊命令时）"""
+        with self._lock:
+            pending, self._pending = self._pending, None
+            self._last_key = None
+            self._repeats = 0
+        if pending is not None:
+            pending.cancel()
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        获取推测统计
+
+        Returns:
+            发起、命中、未命中和未推测的次数，以及命中率（命中 / 有推测的轮次）
+        """
+        speculated = self.hits + self.misses
+        return {
+            "started": self.started,
+            "hits": self.hits,
+            "misses": self.misses,
+            "unspeculated": self.unspeculated,
+            "hit_rate": self.hits / speculated if speculated else 0.0,
+        }
+
+
+def _agent_state(agent):
+    """推测发起后代理状态是否改变的判断依据"""
+    return id(agent.messages), len(agent.messages), agent.mood, agent.environment
+
+
+def _deliver(target, event):
+    on_speak_delta, on_field, on_retract = target
+    if event[0] == "delta":
+        if on_speak_delta:
+            on_speak_delta(event[1])
+    elif event[0] == "retract":
+        if on_retract:
+            on_retract()
+    elif on_field:
+        on_field(event[1], event[2])
@@ -0,0 +1,239 @@
+import json
+from typing import AsyncIterable, AsyncIterator, Dict, Iterable, Iterator, List, Optional, Tuple
+
+
+# JSON 字符串中的转义字符
+_ESCAPES = {
+    '"': '"',
+    "\\": "\\",
+    "/": "/",
+    "b": "\b",
+    "f": "\f",
+    "n": "\n",
+    "r": "\r",
+    "t": "\t",
+}
+
+
+def iter_sse_data(lines: Iterable[bytes]) -> Iterator[Dict]:
+    """
+    解析 SSE (text/event-stream) 响应中的 data 行
+
+    Args:
+        lines: 按行切分的原始响应内容
+
+    Returns:
+        每个 data 事件解析后的 JSON 对象，遇到 [DONE] 时结束
+    """
+    for line in lines:
+        data = _parse_sse_line(line)
+        if data is _SSE_DONE:
+            return
+        if data is not None:
+            yield data
+
+
+async def aiter_sse_data(lines: AsyncIterable[bytes]) -> AsyncIterator[Dict]:
+    """
+    iter_sse_data 的异步版本
+
+    Args:
+        lines: 按行切分的原始响应内容（异步迭代器）
+
+    Returns:
+        每个 data 事件解析后的 JSON 对象，遇到 [DONE] 时结束
+    """
+    async for line in lines:
+        data = _parse_sse_line(line)
+        if data is _SSE_DONE:
+            return
+        if data is not None:
+            yield data
+
+
+def _parse_sse_line(line):
+    """解析一行 SSE 内容，返回 JSON 对象、结束标记或 None（非 data 行）"""
+    if isinstance(line, bytes):
+        # SSE 响应通常不带 charset，必须按 UTF-8 自行解码，否则中文会乱码
+        line = line.decode("utf-8")
+    line = line.strip()
+    if not line.startswith("data:"):
+        return None
+    data = line[len("data:"):].strip()
+    if data == "[DONE]":
+        return _SSE_DONE
+    return json.loads(data)
+
+
+# SSE 流结束标记
+_SSE_DONE = object()
+
+
+def get_stream_delta(chunk: Dict) -> str:
+    """
+    从流式响应的一个数据块中提取新增文本
+
+    Args:
+        chunk: SSE data 事件解析后的 JSON 对象
+
+    Returns:
+        新增的文本内容，没有内容时返回空字符串
+    """
+    choices = chunk.get("choices") or []
+    if not choices:
+        return ""
+    delta = choices[0].get("delta") or {}
+    return delta.get("content") or ""
+
+
+def get_stream_tool_call(chunk: Dict) -> Optional[Tuple[Optional[str], str]]:
+    """
+    从流式响应的一个数据块中提取第一个工具调用的增量
+
+    Args:
+        chunk: SSE data 事件解析后的 JSON 对象
+
+    Returns:
+        (工具名称, 参数的增量文本)，名称只在第一个数据块中出现；没有工具调用时返回 None
+    """
+    choices = chunk.get("choices") or []
+    if not choices:
+        return None
+    tool_calls = (choices[0].get("delta") or {}).get("tool_calls") or []
+    for tool_call in tool_calls:
+        if tool_call.get("index", 0) == 0:
+            function = tool_call.get("function") or {}
+            return function.get("name"), function.get("arguments") or ""
+    return None
+
+
+class IncrementalJSONReader:
+    """增量 JSON 读取器，在模型生成过程中逐步提取顶层字符串字段（如 action、target、speak）"""
+
+    def __init__(self):
+        self.text = ""  # 已接收的完整文本
+        self.fields: Dict[str, str] = {}  # 已完整读取的顶层字符串字段
+        self.done = False  # 顶层对象是否已结束
+        self._depth = 0
+        self._in_string = False
+        self._string_role = None  # "key"、"value" 或 None（嵌套内容，忽略）
+        self._expect = "key"
+        self._key: Optional[str] = None
+        self._token: List[str] = []
+        self._escape: Optional[str] = None
+        self._high_surrogate: Optional[int] = None
+
+    def feed(self, chunk: str) -> List[Tuple[str, str, str]]:
+        """
+        输入一段新生成的文本
+
+        Args:
+            chunk: 新增的文本
+
+        Returns:
+            事件列表，每个事件为 (类型, 字段名, 文本)：
+            - ("delta", key, text): 字段 key 新增的部分字符串内容
+            - ("field", key, value): 字段 key 已完整读取
+        """
+        self.text += chunk
+        events: List[Tuple[str, str, str]] = []
+        pending: List[str] = []
+
+        def flush():
+            if pending:
+                events.append(("delta", self._key, "".join(pending)))
+                pending.clear()
+
+        for char in chunk:
+            if self.done:
+                break
+
+            # 等待对象开始，跳过 ```json 之类的前缀
+            if self._depth == 0:
+                if char == "{":
+                    self._depth = 1
+                    self._expect = "key"
+                continue
+
+            if self._in_string:
+                decoded = self._read_string_char(char)
+                if decoded is None:
+                    continue
+                if decoded is _END_OF_STRING:
+                    self._in_string = False
+                    value = "".join(self._token)
+                    if self._string_role == "key":
+                        self._key = value
+                        self._expect = "colon"
+                    elif self._string_role == "value":
+                        flush()
+                        self.fields[self._key] = value
+                        events.append(("field", self._key, value))
+                        self._expect = "comma"
+                    continue
+                self._token.append(decoded)
+                if self._string_role == "value":
+                    pending.append(decoded)
+                continue
+
+            if char == '"':
+                self._in_string = True
+                self._token = []
+                if self._depth == 1 and self._expect == "key":
+                    self._string_role = "key"
+                elif self._depth == 1 and self._expect == "value":
+                    self._string_role = "value"
+                else:
+                    self._string_role = None
+            elif char in "{[":
+                self._depth += 1
+            elif char in "}]":
+                self._depth -= 1
+                if self._depth == 0:
+                    self.done = True
+            elif self._depth == 1:
+                if char == ":":
+                    self._expect = "value"
+                elif char == ",":
+                    self._expect = "key"
+                elif not char.isspace() and self._expect == "value":
+                    # 非字符串值（数字、布尔等）不做增量提取
+                    self._expect = "comma"
+
+        flush()
+        return events
+
+    def _read_string_char(self, char: str):
+        """处理字符串中的一个字符，返回解码后的字符、None（尚未完整）或字符串结束标记"""
+        if self._escape is not None:
+            self._escape += char
+            if self._escape.startswith("u"):
+                if len(self._escape) < 5:
+                    return None
+                hex_code = self._escape[1:]
+                self._escape = None
+                try:
+                    code = int(hex_code, 16)
+                except ValueError:
+                    return ""
+                # 代理对（如 emoji）需要两个 \uXXXX 拼接成一个字符
+                if 0xD800 <= code <= 0xDBFF:
+                    self._high_surrogate = code
+                    return None
+                if 0xDC00 <= code <= 0xDFFF and self._high_surrogate is not None:
+                    code = 0x10000 + ((self._high_surrogate - 0xD800) << 10) + (code - 0xDC00)
+                    self._high_surrogate = None
+                return chr(code)
+            escape = self._escape
+            self._escape = None
+            return _ESCAPES.get(escape, escape)
+        if char == "\\":
+            self._escape = ""
+            return None
+        if char == '"':
+            return _END_OF_STRING
+        return char
+
+
+# 字符串结束标记
+_END_OF_STRING = object()
@@ -0,0 +1,147 @@
+import json
+from functools import lru_cache
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from game_prompt.game_prompts import ACTIONS, MOODS
+
+# 要求模型必须调用工具（OpenAI 兼容接口的 tool_choice），不能以纯文本回答
+TOOL_CHOICE_REQUIRED = "required"
+
+# 各动作工具的说明
+_TOOL_DESCRIPTIONS = {
+    "move": "移动到当前环境中的某个物体旁边",
+    "interact": "与当前环境中的某个物体交互",
+    "none": "不行动（没有明确的命令或不确定该做什么时）",
+}
+
+
+def build_tools(targets: Iterable[str]) -> List[Dict[str, Any]]:
+    """
+    构造动作工具的定义：move、interact 和 none，目标只能是当前环境中的物体 ID（没有物体时只有 none）
+
+    Args:
+        targets: 当前环境中的物体 ID
+
+    Returns:
+        工具定义列表（相同的目标共享同一个列表，不能修改）
+    """
+    return _build_tools(tuple(targets))
+
+
+@lru_cache(maxsize=64)
+def _build_tools(targets: Tuple[str, ...]) -> List[Dict[str, Any]]:
+    tools = []
+    for action in ACTIONS:
+        if action != "none" and not targets:
+            # 当前环境中没有物体时只能不行动
+            continue
+        properties: Dict[str, Any] = {}
+        required = []
+        if action != "none":
+            properties["target"] = {"type": "string", "enum": list(targets), "description": "目标物体 ID"}
+            required.append("target")
+        properties["speak"] = {"type": "string", "description": "你要说的话，根据当前心情调整语气"}
+        properties["mood"] = {"type": "string", "enum": list(MOODS), "description": "你的当前心情状态"}
+        required += ["speak", "mood"]
+        tools.append({
+            "type": "function",
+            "function": {
+                "name": action,
+                "description": _TOOL_DESCRIPTIONS[action],
+                "parameters": {"type": "object", "properties": properties, "required": required},
+            },
+        })
+    return tools
+
+
+def tool_call_text(name: str, arguments: str) -> str:
+    """
+    把工具调用转换为与文本协议相同的响应 JSON（动作为工具名称，其余字段来自参数）
+
+    Args:
+        name: 工具名称
+        arguments: 工具参数的 JSON 文本
+
+    Returns:
+        响应的 JSON 文本
+    """
+    try:
+        data = json.loads(arguments) if arguments else {}
+    except json.JSONDecodeError:
+        data = {}
+    if not isinstance(data, dict):
+        data = {}
+    response = {"action": name}
+    # 只有 none 可以省略目标；move 和 interact 缺少目标时保持缺少，由校验要求重问
+    if name == "none":
+        response["target"] = data.pop("target", "none")
+    response.update(data)
+    return json.dumps(response, ensure_ascii=False)
+
+
+def first_tool_call(tool_calls: Optional[List[Any]]) -> Optional[Tuple[str, str]]:
+    """
+    取出第一个工具调用的名称和参数，兼容字典和 SDK 返回的对象
+
+    Args:
+        tool_calls: 消息中的 tool_calls
+
+    Returns:
+        (名称, 参数 JSON 文本)，没有工具调用时返回 None
+    """
+    if not tool_calls:
+        return None
+    function = tool_calls[0]["function"] if isinstance(tool_calls[0], dict) else tool_calls[0].function
+    if isinstance(function, dict):
+        return function.get("name") or "none", function.get("arguments") or ""
+    return function.name or "none", function.arguments or ""
+
+
+class ToolCallStream:
+    """
+    把流式返回的工具调用转换为响应 JSON 的增量文本：工具名称作为 action 字段写在最前，
+    之后直接转发参数的增量，下游的 IncrementalJSONReader 可以照常边生成边读取 speak
+    """
+
+    def __init__(self):
+        self.name: Optional[str] = None
+        self._opened = False  # 已越过参数的左花括号
+        self._pending = ""
+
+    def feed(self, name: Optional[str], fragment: str) -> str:
+        """
+        处理一个数据块中第一个工具调用的增量
+
+        Args:
+            name: 工具名称（只在第一个数据块中出现）
+            fragment: 参数的增量文本
+
+        Returns:
+            转换后的增量文本
+        """
+        text = ""
+        if name and self.name is None:
+            self.name = name
+            text = '{"action": ' + json.dumps(name)
+        if self.name is None:
+            return ""
+        if self._opened:
+            return text + fragment
+
+        # 去掉参数的左花括号：参数为空对象时直接结束，否则以逗号接在 action 之后
+        self._pending += fragment
+        rest = self._pending.lstrip()
+        if rest.startswith("{"):
+            rest = rest[1:].lstrip()
+        if not rest:
+            return text
+        self._opened = True
+        self._pending = ""
+        return text + (rest if rest.startswith("}") else ", " + rest)
+
+    def finish(self) -> str:
+        """流结束时补全未输出的部分"""
+        if self.name is not None and not self._opened:
+            self._opened = True
+            return "}"
+        return ""
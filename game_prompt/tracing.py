@@ -0,0 +1,462 @@
+import argparse
+import contextvars
+import json
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+# 轮次记录的默认路径
+DEFAULT_TRACE_PATH = os.path.join("logs", "turns.jsonl")
+
+
+class Span:
+    """一个计时区间，结束时记入开始时所在的轮次。也可以记录区间内的时间点（如首个增量到达）"""
+
+    __slots__ = ("turn", "name", "attrs", "start", "end", "marks")
+
+    def __init__(self, turn: "TurnTrace", name: str, attrs: Dict[str, Any]):
+        self.turn = turn
+        self.name = name
+        self.attrs = attrs
+        self.start = time.perf_counter()
+        self.end: Optional[float] = None
+        self.marks: Dict[str, float] = {}
+
+    def set(self, **attrs):
+        """添加属性（如模型名称、令牌用量）"""
+        self.attrs.update(attrs)
+
+    def mark(self, name: str):
+        """记录距区间开始的时间点，同名的只记录第一次"""
+        if name not in self.marks:
+            self.marks[name] = time.perf_counter() - self.start
+
+    def finish(self):
+        """结束区间，重复调用无效"""
+        if self.end is None:
+            self.end = time.perf_counter()
+            self.turn.add_span(self)
+
+    def __enter__(self) -> "Span":
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            self.attrs["error"] = exc_type.__name__
+        self.finish()
+
+
+class _NullSpan:
+    """关闭追踪或不在轮次中时使用的空区间，所有操作都不做任何事"""
+
+    __slots__ = ()
+
+    def set(self, **attrs):
+        pass
+
+    def mark(self, name: str):
+        pass
+
+    def finish(self):
+        pass
+
+    def __enter__(self) -> "_NullSpan":
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        pass
+
+
+NULL_SPAN = _NullSpan()
+
+
+class TurnTrace:
+    """
+    一轮的记录：区间、时间点、属性和令牌用量。每轮一个对象，随上下文（contextvars）传递，
+    交给其他线程时通过 Tracer.bind 显式传入，并发的多个轮次（多个会话、推测执行）互不混淆
+    """
+
+    def __init__(self, number: Optional[int], attrs: Dict[str, Any]):
+        """
+        Args:
+            number: 轮次序号，推测执行等尚未归属某一轮的记录为 None
+            attrs: 轮次的属性
+        """
+        self.start = time.perf_counter()
+        self.record: Dict[str, Any] = {
+            "turn": number,
+            "time": time.time(),
+            "attrs": dict(attrs),
+            "marks": {},
+            "spans": [],
+            "usage": {},
+        }
+        self.closed = False
+        self._lock = threading.Lock()
+
+    def mark(self, name: str):
+        """记录距本轮开始的时间点，同名的只记录第一次"""
+        with self._lock:
+            if not self.closed and name not in self.record["marks"]:
+                self.record["marks"][name] = time.perf_counter() - self.start
+
+    def annotate(self, **attrs):
+        """添加本轮的属性"""
+        with self._lock:
+            if not self.closed:
+                self.record["attrs"].update(attrs)
+
+    def add_usage(self, usage: Optional[Dict[str, Any]]):
+        """累加本轮的令牌用量"""
+        if not usage:
+            return
+        with self._lock:
+            if self.closed:
+                return
+            total = self.record["usage"]
+            for key in ("prompt_tokens", "completion_tokens", "total_tokens", "prompt_cache_hit_tokens"):
+                value = usage.get(key)
+                if isinstance(value, int):
+                    total[key] = total.get(key, 0) + value
+
+    def add_span(self, span: Span):
+        """记入一个已结束的区间，本轮结束后结束的区间被丢弃"""
+        entry = {
+            "name": span.name,
+            "start": span.start - self.start,
+            "duration": span.end - span.start,
+        }
+        if span.marks:
+            entry["marks"] = span.marks
+        if span.attrs:
+            entry["attrs"] = span.attrs
+        with self._lock:
+            if not self.closed:
+                self.record["spans"].append(entry)
+
+    def merge(self, other: "TurnTrace"):
+        """
+        并入另一份记录的区间、属性和令牌用量（如被采用的推测执行），区间的开始时间换算为距本轮开始的时间
+
+        Args:
+            other: 要并入的记录
+        """
+        offset = other.start - self.start
+        with other._lock:
+            other.closed = True
+            spans = [dict(entry, start=entry["start"] + offset) for entry in other.record["spans"]]
+            attrs = dict(other.record["attrs"])
+            usage = dict(other.record["usage"])
+        with self._lock:
+            if not self.closed:
+                self.record["spans"].extend(spans)
+                for key, value in attrs.items():
+                    self.record["attrs"].setdefault(key, value)
+        self.add_usage(usage)
+
+    def close(self, **attrs) -> Dict[str, Any]:
+        """结束本轮，返回记录"""
+        with self._lock:
+            self.closed = True
+            self.record["attrs"].update(attrs)
+            self.record["duration"] = time.perf_counter() - self.start
+            return self.record
+
+
+class JSONLExporter:
+    """把轮次记录追加写入 JSONL 文件，超过大小上限时轮转（turns.jsonl -> turns.jsonl.1 -> ...）"""
+
+    def __init__(self, path: str = DEFAULT_TRACE_PATH, max_bytes: int = 10 * 1024 * 1024, backups: int = 3):
+        """
+        Args:
+            path: 记录文件路径
+            max_bytes: 单个文件的大小上限
+            backups: 保留的历史文件数
+        """
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self._lock = threading.Lock()
+
+    def export(self, record: Dict[str, Any]):
+        """
+        写入一条记录
+
+        Args:
+            record: 轮次记录
+        """
+        line = json.dumps(record, ensure_ascii=False) + "\n"
+        with self._lock:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            if os.path.exists(self.path) and os.path.getsize(self.path) + len(line) > self.max_bytes:
+                self._rotate()
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line)
+
+    def _rotate(self):
+        for index in range(self.backups - 1, 0, -1):
+            source = f"{self.path}.{index}"
+            if os.path.exists(source):
+                os.replace(source, f"{self.path}.{index + 1}")
+        if self.backups > 0:
+            os.replace(self.path, f"{self.path}.1")
+        else:
+            os.remove(self.path)
+
+
+class Tracer:
+    """
+    按轮次收集各阶段的耗时：begin_turn 和 end_turn 之间结束的区间、时间点和令牌用量汇总为一条记录交给导出器。
+    当前轮次保存在 contextvars 中：每个线程、每个 asyncio 任务各自独立，新建的任务继承创建时的轮次，
+    线程池和新线程需要用 bind 包装。关闭时 span 直接返回空区间，其余方法立即返回，几乎没有开销
+    """
+
+    def __init__(self, exporter: Optional[JSONLExporter] = None):
+        """
+        Args:
+            exporter: 导出器，为 None 时关闭追踪
+        """
+        self.exporter = exporter
+        self.enabled = exporter is not None
+        self.turns = 0
+        self._current: "contextvars.ContextVar[Optional[TurnTrace]]" = contextvars.ContextVar(
+            "trace_turn", default=None
+        )
+        self._lock = threading.Lock()
+
+    def enable(self, exporter: Optional[JSONLExporter] = None):
+        """
+        开启追踪
+
+        Args:
+            exporter: 导出器，为 None 时写入 DEFAULT_TRACE_PATH
+        """
+        self.exporter = exporter or JSONLExporter()
+        self.enabled = True
+
+    def disable(self):
+        """关闭追踪，未结束的轮次不再导出"""
+        self.enabled = False
+
+    def current(self) -> Optional[TurnTrace]:
+        """当前上下文中进行中的轮次"""
+        return self._current.get() if self.enabled else None
+
+    def span(self, name: str, **attrs):
+        """
+        开始一个计时区间，可用作上下文管理器
+
+        Args:
+            name: 阶段名称（如 llm.chat、tts.synthesize）
+            **attrs: 区间的属性
+
+        Returns:
+            Span，关闭追踪或不在轮次中时为 NULL_SPAN
+        """
+        turn = self.current()
+        if turn is None:
+            return NULL_SPAN
+        return Span(turn, name, attrs)
+
+    def begin_turn(self, **attrs) -> Optional[TurnTrace]:
+        """
+        在当前上下文中开始一轮（如语音识别到句子结束），之前未结束的轮次被丢弃
+
+        Args:
+            **attrs: 轮次的属性
+
+        Returns:
+            轮次记录，关闭追踪时返回 None
+        """
+        if not self.enabled:
+            return None
+        with self._lock:
+            self.turns += 1
+            number = self.turns
+        turn = TurnTrace(number, attrs)
+        self._current.set(turn)
+        return turn
+
+    def detached(self, **attrs) -> Optional[TurnTrace]:
+        """
+        创建一份不属于任何一轮、不会导出的记录（如推测执行），配合 bind 在其他线程中记录，
+        被采用时用 merge 并入当前轮次
+
+        Returns:
+            记录，关闭追踪时返回 None
+        """
+        if not self.enabled:
+            return None
+        return TurnTrace(None, attrs)
+
+    def bind(self, fn: Callable, turn: Optional[TurnTrace] = None) -> Callable:
+        """
+        包装要在其他线程中执行的函数，使其中的记录归入指定的轮次
+
+        Args:
+            fn: 函数
+            turn: 轮次记录，默认为当前上下文中的轮次
+
+        Returns:
+            包装后的函数，关闭追踪时返回 fn 本身
+        """
+        if not self.enabled:
+            return fn
+        turn = turn if turn is not None else self._current.get()
+        if turn is None:
+            return fn
+        current = self._current
+
+        def bound(*args, **kwargs):
+            token = current.set(turn)
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                current.reset(token)
+
+        return bound
+
+    def mark(self, name: str):
+        """记录距本轮开始的时间点，同名的只记录第一次"""
+        turn = self.current()
+        if turn is not None:
+            turn.mark(name)
+
+    def annotate(self, **attrs):
+        """添加本轮的属性（如响应来源、回答的模型层级）"""
+        turn = self.current()
+        if turn is not None:
+            turn.annotate(**attrs)
+
+    def add_usage(self, usage: Optional[Dict[str, Any]]):
+        """
+        累加本轮的令牌用量
+
+        Args:
+            usage: 服务端返回的令牌用量
+        """
+        turn = self.current()
+        if turn is not None:
+            turn.add_usage(usage)
+
+    def merge(self, other: Optional[TurnTrace]):
+        """将 detached 的记录并入当前轮次，见 TurnTrace.merge"""
+        turn = self.current()
+        if turn is not None and other is not None:
+            turn.merge(other)
+
+    def end_turn(self, **attrs) -> Optional[Dict[str, Any]]:
+        """
+        结束当前上下文中的轮次并导出记录
+
+        Args:
+            **attrs: 轮次的属性
+
+        Returns:
+            轮次记录，关闭追踪或没有进行中的轮次时返回 None
+        """
+        turn = self.current()
+        if turn is None:
+            return None
+        self._current.set(None)
+        record = turn.close(**attrs)
+        self.exporter.export(record)
+        return record
+
+
+# 进程内共用的追踪器，默认关闭；由游戏主程序按需开启
+tracer = Tracer()
+
+
+def load_records(path: str = DEFAULT_TRACE_PATH) -> List[Dict[str, Any]]:
+    """
+    读取轮次记录，包括轮转出的历史文件（从旧到新）
+
+    Args:
+        path: 记录文件路径
+
+    Returns:
+        轮次记录列表
+    """
+    paths = []
+    index = 1
+    while os.path.exists(f"{path}.{index}"):
+        paths.insert(0, f"{path}.{index}")
+        index += 1
+    if os.path.exists(path):
+        paths.append(path)
+    records = []
+    for file_path in paths:
+        with open(file_path, "r", encoding="utf-8") as f:
+            records.extend(json.loads(line) for line in f if line.strip())
+    return records
+
+
+def _percentiles(samples: List[float]) -> Dict[str, Any]:
+    ordered = sorted(samples)
+
+    def percentile(p):
+        return ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))] * 1000
+
+    return {
+        "count": len(ordered),
+        "p50": percentile(50),
+        "p95": percentile(95),
+        "p99": percentile(99),
+    }
+
+
+def summarize(records: Iterable[Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+    """
+    按阶段统计耗时：整轮、每个时间点（距本轮开始）、每种区间及区间内的时间点（如 llm.chat_stream.ttfb）
+
+    Args:
+        records: 轮次记录
+
+    Returns:
+        阶段名称 -> 样本数和 p50/p95/p99（毫秒）
+    """
+    samples: Dict[str, List[float]] = {}
+    for record in records:
+        samples.setdefault("turn", []).append(record["duration"])
+        for name, offset in record.get("marks", {}).items():
+            samples.setdefault(f"@{name}", []).append(offset)
+        for span in record.get("spans", []):
+            samples.setdefault(span["name"], []).append(span["duration"])
+            for name, offset in span.get("marks", {}).items():
+                samples.setdefault(f"{span['name']}.{name}", []).append(offset)
+    return {name: _percentiles(values) for name, values in samples.items()}
+
+
+def format_summary(summary: Dict[str, Dict[str, Any]]) -> str:
+    """把 summarize 的结果格式化为表格"""
+    width = max((len(name) for name in summary), default=5)
+    lines = [f"{'stage':<{width}}  {'n':>5}  {'p50':>9}  {'p95':>9}  {'p99':>9}"]
+    for name, stats in summary.items():
+        lines.append(
+            f"{name:<{width}}  {stats['count']:>5}  {stats['p50']:>7.1f}ms  {stats['p95']:>7.1f}ms  {stats['p99']:>7.1f}ms"
+        )
+    return "\n".join(lines)
+
+
+def main():
+    """命令行入口：打印轮次记录中各阶段的 p50/p95/p99"""
+    parser = argparse.ArgumentParser(description="统计每轮各阶段的耗时")
+    parser.add_argument("path", nargs="?", default=DEFAULT_TRACE_PATH, help="轮次记录文件")
+    parser.add_argument("--last", type=int, default=0, help="只统计最近的若干轮")
+    args = parser.parse_args()
+
+    records = load_records(args.path)
+    if args.last:
+        records = records[-args.last:]
+    if not records:
+        print(f"{args.path} 中没有轮次记录")
+        return
+    print(format_summary(summarize(records)))
+
+
+if __name__ == "__main__":
+    main()
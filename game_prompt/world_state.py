@@ -0,0 +1,271 @@
+import copy
+import json
+from typing import Any, Callable, Dict, List, Optional
+
+from game_prompt.context_window import ENVIRONMENT_DELTA_PREFIX
+
+
+def _compact(obj: Any) -> str:
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":"))
+
+
+class ActionResult:
+    """一次动作的执行结果"""
+
+    def __init__(
+        self,
+        action: str,
+        target: str,
+        valid: bool = True,
+        error: Optional[str] = None,
+        result: Optional[str] = None,
+        moved_to: Optional[str] = None,
+    ):
+        """
+        Args:
+            action: 动作类型
+            target: 目标物体 ID
+            valid: 动作和目标是否有效
+            error: 无效时的原因
+            result: 交互结果的描述
+            moved_to: 进入的新房间
+        """
+        self.action = action
+        self.target = target
+        self.valid = valid
+        self.error = error
+        self.result = result
+        self.moved_to = moved_to
+
+    def describe(self) -> str:
+        """给玩家看的一行描述"""
+        if not self.valid:
+            return f"无效的动作: {self.error}"
+        if self.action == "move":
+            line = f"医生移动到了 {self.target}"
+            if self.moved_to:
+                line += f"，进入了{self.moved_to}"
+            return line
+        if self.action == "interact":
+            line = f"医生与 {self.target} 交互"
+            if self.result:
+                line += f"\n{self.result}"
+            return line
+        return "医生选择不行动"
+
+
+class WorldState:
+    """
+    结构化的游戏世界：房间图、按房间索引的物体表和动作分发表。
+    在本地校验模型返回的动作和目标，执行结果以增量的方式告诉模型（只列出新增、移除和变化的物体）
+    """
+
+    def __init__(self, scenario: Dict[str, Any], max_deltas: int = 8):
+        """
+        初始化游戏世界
+
+        Args:
+            scenario: 场景数据，格式见 game_prompts.scenario_hospital
+            max_deltas: 连续发送多少次增量后重新发送完整的房间信息
+        """
+        self.rooms: Dict[str, Dict[str, Any]] = copy.deepcopy(scenario["rooms"])
+        self.room: str = scenario["start"]
+        self.max_deltas = max_deltas
+        # 动作分发表：动作类型 -> 处理函数（参数为目标物体 ID，返回 ActionResult）
+        self.handlers: Dict[str, Callable[[str], ActionResult]] = {
+            "move": self._move,
+            "interact": self._interact,
+            "none": self._none,
+        }
+        self.rejected = 0
+        self.version = 0  # 世界每次变化（换房间、物体增删改、恢复存档）加一，用作缓存键的一部分
+        self._seen: Optional[Dict[str, str]] = None  # 模型最近一次看到的当前房间物体
+        self._seen_room: Optional[str] = None
+        self._deltas = 0
+        self._pending_results: List[str] = []
+
+    @property
+    def objects(self) -> Dict[str, str]:
+        """当前房间的物体 ID -> 描述"""
+        return self.rooms[self.room]["objects"]
+
+    def target_ids(self) -> List[str]:
+        """当前房间内可作为目标的物体 ID"""
+        return list(self.objects)
+
+    def validate(self, action: Optional[str], target: Optional[str]) -> Optional[str]:
+        """
+        校验模型返回的动作和目标
+
+        Args:
+            action: 动作类型
+            target: 目标物体 ID
+
+        Returns:
+            无效时返回原因，有效时返回 None
+        """
+        if action not in self.handlers:
+            return f"未知动作: {action}"
+        if action == "none":
+            return None
+        if target not in self.objects:
+            return f"{self.room}中没有 {target}"
+        return None
+
+    def apply(self, response: Dict[str, Any]) -> ActionResult:
+        """
+        执行模型返回的动作。无效的动作不改变世界，原因会随下一次环境更新告诉模型
+
+        Args:
+            response: 模型的响应，包含 action 和 target
+
+        Returns:
+            执行结果
+        """
+        action = response.get("action")
+        target = response.get("target")
+        error = self.validate(action, target)
+        if error is not None:
+            self.rejected += 1
+            self._pending_results.append(f"动作无效（{error}），请只使用当前环境中的物体 ID")
+            return ActionResult(action, target, valid=False, error=error)
+        result = self.handlers[action](target)
+        if result.result:
+            self._pending_results.append(f"你与 \"{target}\" 的交互结果: {result.result}")
+        return result
+
+    def describe(self) -> str:
+        """当前房间的完整环境信息"""
+        room = self.rooms[self.room]
+        data = {
+            "room": self.room,
+            "description": room["description"],
+            "objects": [{"id": object_id, "description": text} for object_id, text in room["objects"].items()],
+        }
+        return f'你当前所处房间为: "{self.room}"\n\n你当前周围的环境信息如下：\n{_compact(data)}'
+
+    def environment_update(self, full: bool = False) -> Optional[str]:
+        """
+        生成发给模型的环境更新：进入新房间、增量次数达到上限或 full 为 True 时为完整的房间信息，
+        否则只包含与模型上次看到的相比新增、移除和变化的物体，以及之后的动作结果
+
+        Args:
+            full: 是否发送完整的房间信息
+
+        Returns:
+            环境更新内容，没有变化时返回 None
+        """
+        objects = self.objects
+        results = self._pending_results
+        self._pending_results = []
+        if full or self._seen is None or self._seen_room != self.room or self._deltas >= self.max_deltas:
+            text = self.describe()
+            if results:
+                text += "\n\n" + "\n".join(results)
+            self._remember()
+            self._deltas = 0
+            return text
+
+        delta = {}
+        added = [{"id": i, "description": d} for i, d in objects.items() if i not in self._seen]
+        removed = [i for i in self._seen if i not in objects]
+        changed = [
+            {"id": i, "description": d}
+            for i, d in objects.items()
+            if i in self._seen and self._seen[i] != d
+        ]
+        if added:
+            delta["added"] = added
+        if removed:
+            delta["removed"] = removed
+        if changed:
+            delta["changed"] = changed
+        if not delta and not results:
+            return None
+
+        lines = [ENVIRONMENT_DELTA_PREFIX]
+        if delta:
+            lines.append(_compact(delta))
+        lines.extend(results)
+        self._remember()
+        self._deltas += 1
+        return "\n".join(lines)
+
+    def sync(self, agent) -> Optional[str]:
+        """
+        将环境变化告诉代理：更新（完整的房间信息或增量）追加到消息历史，两种布局都只发送一次，
+        prefix_cache 布局下成为稳定前缀的一部分，请求末尾的状态消息不再重复完整的房间信息。
+        世界的可变状态同时交给代理，随会话日志保存
+
+        Args:
+            agent: 游戏代理
+
+        Returns:
+            发送的环境更新，没有变化时返回 None
+        """
+        update = self.environment_update()
+        if update is not None:
+            agent.world_state = self.export_state()
+            agent.update_environment(update, append=True)
+        return update
+
+    def export_state(self) -> Dict[str, Any]:
+        """
+        导出世界的可变状态（当前房间和各房间的物体），用于保存
+
+        Returns:
+            可序列化为 JSON 的字典
+        """
+        return {
+            "room": self.room,
+            "objects": {name: dict(room["objects"]) for name, room in self.rooms.items()},
+        }
+
+    def load_state(self, state: Dict[str, Any]):
+        """
+        从 export_state 导出的状态恢复世界，之后的第一次更新发送完整的房间信息
+
+        Args:
+            state: 导出的状态
+        """
+        for name, objects in state.get("objects", {}).items():
+            if name in self.rooms:
+                self.rooms[name]["objects"] = dict(objects)
+        if state.get("room") in self.rooms:
+            self.room = state["room"]
+        self._seen = None
+        self._seen_room = None
+        self._deltas = 0
+        self._pending_results = []
+        self.version += 1
+
+    def _remember(self):
+        self._seen = dict(self.objects)
+        self._seen_room = self.room
+
+    def _move(self, target: str) -> ActionResult:
+        destination = self.rooms[self.room].get("exits", {}).get(target)
+        if destination is not None:
+            self.room = destination
+            self.version += 1
+        return ActionResult("move", target, moved_to=destination)
+
+    def _interact(self, target: str) -> ActionResult:
+        outcome = self.rooms[self.room].get("interactions", {}).get(target)
+        if outcome is None:
+            return ActionResult("interact", target)
+        self.version += 1
+        objects = self.objects
+        for object_id, text in outcome.get("change", {}).items():
+            objects[object_id] = text
+        for object_id, text in outcome.get("add", {}).items():
+            objects[object_id] = text
+        for object_id in outcome.get("remove", ()):
+            objects.pop(object_id, None)
+        destination = outcome.get("move_to")
+        if destination is not None:
+            self.room = destination
+        return ActionResult("interact", target, result=outcome.get("result"), moved_to=destination)
+
+    def _none(self, target: str) -> ActionResult:
+        return ActionResult("none", "none")
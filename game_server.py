@@ -0,0 +1,273 @@
+"""
+多会话游戏服务器：在一个进程中为多个玩家（3D 客户端）托管相互隔离的游戏代理。
+
+HTTP 接口:
+    POST   /sessions                       创建会话，返回 {"session_id": ...}
+    DELETE /sessions/{id}                  关闭会话
+    POST   /sessions/{id}/environment      更新环境信息 {"environment": "..."}
+    POST   /sessions/{id}/input            处理一轮输入 {"text": "..."}，返回完整响应
+    GET    /sessions/{id}/ws               WebSocket 连接（会话不存在时自动创建）
+    GET    /sessions                       每个会话的大小（是否在内存中、估算的内存占用、转存的快照大小）
+    GET    /stats                          服务器统计
+
+WebSocket 协议:
+    客户端发送 JSON 文本消息 {"type": "user_text", "text": ...} 或 {"type": "environment", "environment": ...}，
+    或二进制消息（16kHz 16 位单声道 PCM 音频，识别到句子结束后自动开始一轮对话）。
+    服务器推送 JSON 消息 session、transcript、speak_delta、field、retract（丢弃本轮已推送的台词和语音）、
+    response、audio_start、audio_end、turn_end、busy、error、session_lost（转存的会话无法读回，会话已关闭，连接随后断开），
+    以及二进制消息（audio_start 和 audio_end 之间的 PCM 音频块）。HTTP 接口遇到无法读回的会话时返回 410。
+"""
+import os
+import argparse
+import asyncio
+import json
+from typing import Optional
+
+import dotenv
+
+from game_prompt.context_window import ContextWindow
+from game_prompt.game_prompts import system_prompt_env_update1, system_prompt_init
+from game_prompt.http_transport import AsyncHTTPTransport
+from game_prompt.siliconflow_api import AsyncGameAgent
+from game_prompt.tracing import JSONLExporter, tracer
+from session_manager import AdmissionError, BackpressureError, SessionLostError, SessionManager
+from session_store import SessionStore
+from text2voice.tts_cache import TTSCache
+
+
+def create_app(
+    api_key: str,
+    max_sessions: int = 5000,
+    max_concurrent_turns: int = 64,
+    max_queued_turns: int = 256,
+    tts: bool = True,
+    max_resident_sessions: int = 200,
+    store_dir: Optional[str] = os.path.join(".cache", "sessions"),
+):
+    """
+    创建 aiohttp 应用
+
+    Args:
+        api_key: SiliconFlow API 密钥
+        max_sessions: 最大会话数
+        max_concurrent_turns: 同时进行的对话请求数
+        max_queued_turns: 等待对话请求名额的最大轮次数
+        tts: 是否推送语音
+        max_resident_sessions: 内存中最多保留的会话数，其余闲置会话转存到 store_dir
+        store_dir: 闲置会话的存储目录，为 None 时所有会话常驻内存
+
+    Returns:
+        aiohttp.web.Application
+    """
+    try:
+        from aiohttp import WSMsgType, web
+    except ImportError:
+        raise ImportError("游戏服务器需要安装 aiohttp: pip install aiohttp")
+
+    app = web.Application()
+
+    async def on_startup(app):
+        # 所有会话共用一个连接池，httpx 客户端需要在服务器的事件循环中创建
+        transport = AsyncHTTPTransport(pool_maxsize=max_concurrent_turns * 2)
+        app["transport"] = transport
+
+        def make_agent():
+            agent = AsyncGameAgent(
+                api_key=api_key,
+                transport=transport,
+                context_window=ContextWindow(),
+                layout="prefix_cache",
+            )
+            agent.initialize_game(system_prompt_init)
+            agent.update_environment(system_prompt_env_update1)
+            return agent
+
+        app["sessions"] = SessionManager(
+            make_agent,
+            max_sessions=max_sessions,
+            max_concurrent_turns=max_concurrent_turns,
+            max_queued_turns=max_queued_turns,
+            tts=tts,
+            store=SessionStore(store_dir) if store_dir else None,
+            max_resident_sessions=max_resident_sessions,
+            tts_options={
+                "api_key": api_key,
+                "transport": transport,
+                "cache": TTSCache(cache_dir=os.path.join(".cache", "tts")),
+            },
+        )
+        app["sessions"].start_reaper()
+
+    async def on_cleanup(app):
+        await app["sessions"].stop()
+        await app["transport"].aclose()
+
+    app.on_startup.append(on_startup)
+    app.on_cleanup.append(on_cleanup)
+
+    def get_session(request):
+        try:
+            return request.app["sessions"].get(request.match_info["session_id"])
+        except KeyError:
+            raise web.HTTPNotFound(text="会话不存在")
+
+    async def create_session(request):
+        try:
+            session = await request.app["sessions"].create()
+        except AdmissionError as e:
+            raise web.HTTPServiceUnavailable(text=str(e))
+        return web.json_response({"session_id": session.session_id})
+
+    async def delete_session(request):
+        get_session(request)
+        request.app["sessions"].close(request.match_info["session_id"])
+        return web.json_response({"closed": True})
+
+    async def update_environment(request):
+        session = get_session(request)
+        body = await request.json()
+        try:
+            await request.app["sessions"].update_environment(session, body["environment"])
+        except SessionLostError as e:
+            raise web.HTTPGone(text=str(e))
+        return web.json_response({"updated": True})
+
+    async def user_input(request):
+        session = get_session(request)
+        body = await request.json()
+        try:
+            response = await request.app["sessions"].handle_text(session, body["text"])
+        except AdmissionError as e:
+            raise web.HTTPTooManyRequests(text=str(e))
+        except SessionLostError as e:
+            raise web.HTTPGone(text=str(e))
+        return web.json_response(response, dumps=lambda data: json.dumps(data, ensure_ascii=False))
+
+    async def stats(request):
+        return web.json_response(request.app["sessions"].stats())
+
+    async def session_sizes(request):
+        return web.json_response(request.app["sessions"].session_sizes())
+
+    async def websocket(request):
+        manager: SessionManager = request.app["sessions"]
+        session_id = request.match_info["session_id"]
+        try:
+            session = manager.sessions.get(session_id) or await manager.create(session_id)
+        except AdmissionError as e:
+            raise web.HTTPServiceUnavailable(text=str(e))
+        if session.connected:
+            raise web.HTTPConflict(text="会话已有客户端连接")
+
+        ws = web.WebSocketResponse(heartbeat=30.0)
+        await ws.prepare(request)
+        session.connected = True
+        # 旧连接遗留的事件不再推送
+        while not session.outbox.empty():
+            session.outbox.get_nowait()
+
+        async def pump_outbox():
+            # ws.send_* 会等待网络发送缓冲区，客户端读取慢时这里变慢，队列写满后反压到生成端
+            while True:
+                event = await session.outbox.get()
+                if isinstance(event, bytes):
+                    await ws.send_bytes(event)
+                else:
+                    await ws.send_str(json.dumps(event, ensure_ascii=False))
+
+        async def session_lost(error):
+            # 直接发送后断开，不经过发送队列，避免关闭连接时消息还留在队列中
+            await ws.send_str(json.dumps({"type": "session_lost", "message": str(error)}, ensure_ascii=False))
+            await ws.close(message="会话已丢失".encode("utf-8"))
+
+        async def run_turn(text):
+            try:
+                await manager.handle_text(session, text)
+            except AdmissionError as e:
+                await session.send({"type": "busy", "message": str(e)})
+            except BackpressureError:
+                await ws.close(message="客户端接收过慢".encode("utf-8"))
+            except SessionLostError as e:
+                await session_lost(e)
+            except Exception as e:
+                await session.send({"type": "error", "message": str(e)})
+
+        sender = asyncio.create_task(pump_outbox())
+        turns = set()
+        await session.send({"type": "session", "session_id": session.session_id})
+        try:
+            async for message in ws:
+                if message.type == WSMsgType.BINARY:
+                    await manager.feed_audio(session, message.data)
+                elif message.type == WSMsgType.TEXT:
+                    data = json.loads(message.data)
+                    if data.get("type") == "user_text":
+                        task = asyncio.create_task(run_turn(data["text"]))
+                        turns.add(task)
+                        task.add_done_callback(turns.discard)
+                    elif data.get("type") == "environment":
+                        try:
+                            await manager.update_environment(session, data["environment"])
+                        except SessionLostError as e:
+                            await session_lost(e)
+                    else:
+                        await session.send({"type": "error", "message": f"未知的消息类型: {data.get('type')}"})
+        finally:
+            # 进行中的对话继续完成并写入历史，只是不再推送
+            session.connected = False
+            sender.cancel()
+            session.touch()
+        return ws
+
+    app.router.add_post("/sessions", create_session)
+    app.router.add_get("/sessions", session_sizes)
+    app.router.add_delete("/sessions/{session_id}", delete_session)
+    app.router.add_post("/sessions/{session_id}/environment", update_environment)
+    app.router.add_post("/sessions/{session_id}/input", user_input)
+    app.router.add_get("/sessions/{session_id}/ws", websocket)
+    app.router.add_get("/stats", stats)
+    return app
+
+
+def main():
+    """启动游戏服务器"""
+    dotenv.load_dotenv()
+
+    parser = argparse.ArgumentParser(description="多会话游戏服务器")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--max-sessions", type=int, default=5000, help="最大会话数")
+    parser.add_argument("--max-resident-sessions", type=int, default=200, help="内存中最多保留的会话数")
+    parser.add_argument("--store-dir", default=os.path.join(".cache", "sessions"), help="闲置会话的存储目录")
+    parser.add_argument("--no-store", action="store_true", help="所有会话常驻内存，不转存闲置会话")
+    parser.add_argument("--max-concurrent-turns", type=int, default=64, help="同时进行的对话请求数")
+    parser.add_argument("--max-queued-turns", type=int, default=256, help="排队等待的最大轮次数")
+    parser.add_argument("--no-tts", action="store_true", help="不推送语音")
+    parser.add_argument("--trace", metavar="PATH", help="把每轮各阶段的耗时和令牌用量追加写入 JSONL 文件")
+    args = parser.parse_args()
+
+    api_key = os.environ.get("SILICONFLOW_API_KEY")
+    if not api_key:
+        print("错误: 未设置SILICONFLOW_API_KEY环境变量")
+        print("请设置环境变量: export SILICONFLOW_API_KEY=你的API密钥")
+        return
+
+    if args.trace:
+        tracer.enable(JSONLExporter(args.trace))
+
+    from aiohttp import web
+
+    app = create_app(
+        api_key,
+        max_sessions=args.max_sessions,
+        max_concurrent_turns=args.max_concurrent_turns,
+        max_queued_turns=args.max_queued_turns,
+        tts=not args.no_tts,
+        max_resident_sessions=args.max_resident_sessions,
+        store_dir=None if args.no_store else args.store_dir,
+    )
+    web.run_app(app, host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,568 @@
+import asyncio
+import itertools
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Union
+
+from game_prompt.tracing import tracer
+from session_store import SessionStore, resident_size
+from text2voice.generate_voice import generate_voice_stream_async
+from text2voice.tts_pipeline import DEFAULT_EMOTION_PROMPT, DEFAULT_VOICE, SentenceSplitter
+from turn_pipeline import (
+    STAGE_FIRST_DELTA,
+    STAGE_INPUT,
+    STAGE_LLM_DONE,
+    STAGE_LLM_REQUEST,
+    STAGE_PLAYBACK_DONE,
+    STAGE_SPEAK_DONE,
+)
+
+
+class AdmissionError(Exception):
+    """超出服务器容量（会话数、排队的对话轮次）或会话正忙时拒绝请求"""
+
+
+class BackpressureError(Exception):
+    """客户端接收过慢，发送队列在超时时间内一直是满的"""
+
+
+class SessionLostError(Exception):
+    """转存的会话无法从存储读回（快照缺失或损坏），会话已被关闭"""
+
+
+class GameSession:
+    """
+    一个玩家的会话：独立的游戏代理、有界的发送队列和可选的语音识别。
+    同一会话同时只处理一轮对话。闲置的会话可以被转存到磁盘，此时 agent 为 None
+    """
+
+    def __init__(self, session_id: str, agent, outbox_size: int, send_timeout: float):
+        """
+        Args:
+            session_id: 会话 ID
+            agent: 游戏代理（AsyncGameAgent）
+            outbox_size: 发送队列最多缓存的事件数
+            send_timeout: 发送队列写满时最多等待的秒数
+        """
+        self.session_id = session_id
+        self.agent = agent
+        self.outbox: "asyncio.Queue[Union[Dict[str, Any], bytes]]" = asyncio.Queue(maxsize=outbox_size)
+        self.send_timeout = send_timeout
+        self.created_at = time.monotonic()
+        self.last_active = self.created_at
+        self.turns = 0
+        self.connected = False  # 是否有客户端正在接收推送（WebSocket）
+        self.voice = None  # 语音识别会话（收到第一段音频时创建）
+        self.turn_lock = asyncio.Lock()
+        self.resident_bytes = 0  # 消息历史和状态的估算内存占用（最近一次更新时）
+        self.stored_bytes = 0  # 最近一次转存的快照大小
+        self.spill_task: Optional[asyncio.Task] = None  # 进行中的转存（在线程中写入）
+
+    @property
+    def resident(self) -> bool:
+        """游戏代理是否在内存中"""
+        return self.agent is not None
+
+    async def send(self, event: Union[Dict[str, Any], bytes]):
+        """
+        推送一个事件（字典为 JSON 消息，bytes 为音频块）。没有客户端连接时丢弃；
+        队列已满时等待客户端读取，超过 send_timeout 抛出 BackpressureError
+
+        Args:
+            event: 事件
+        """
+        if not self.connected:
+            return
+        try:
+            await asyncio.wait_for(self.outbox.put(event), self.send_timeout)
+        except asyncio.TimeoutError:
+            raise BackpressureError(f"会话 {self.session_id} 的客户端接收过慢")
+
+    def touch(self):
+        self.last_active = time.monotonic()
+
+
+class SessionManager:
+    """
+    在一个进程中托管多个相互隔离的游戏会话：限制会话总数和同时进行的对话请求数，
+    超出时拒绝而不是无限排队；每个会话的推送队列有界，慢客户端会阻塞自己的生成而不影响其他会话。
+    设置了会话存储时，内存中只保留最近活跃的会话，其余按最近最少使用的顺序转存到磁盘，收到输入时自动读回
+    """
+
+    def __init__(
+        self,
+        agent_factory: Callable[[], Any],
+        max_sessions: int = 500,
+        max_concurrent_turns: int = 64,
+        max_queued_turns: int = 256,
+        outbox_size: int = 256,
+        send_timeout: float = 10.0,
+        idle_timeout: float = 1800.0,
+        tts: bool = True,
+        tts_concurrency: int = 2,
+        tts_options: Optional[Dict[str, Any]] = None,
+        emotion_prompt: str = DEFAULT_EMOTION_PROMPT,
+        store: Optional[SessionStore] = None,
+        max_resident_sessions: int = 200,
+        max_resident_bytes: Optional[int] = None,
+        spill_after: float = 300.0,
+    ):
+        """
+        初始化会话管理器，需在事件循环中创建
+
+        Args:
+            agent_factory: 创建并初始化游戏代理（AsyncGameAgent）的函数
+            max_sessions: 最大会话数
+            max_concurrent_turns: 同时进行的对话请求数
+            max_queued_turns: 等待对话请求名额的最大轮次数，超出时拒绝新的输入
+            outbox_size: 每个会话发送队列最多缓存的事件数
+            send_timeout: 发送队列写满时最多等待的秒数
+            idle_timeout: 没有客户端连接的会话闲置多少秒后关闭
+            tts: 是否为医生说的话合成语音并推送音频块
+            tts_concurrency: 每个会话同时进行的语音合成请求数
+            tts_options: 传给 generate_voice_stream_async 的参数（api_key、voice、sample_rate、transport、cache 等）
+            emotion_prompt: 添加在每段语音前的情感指令
+            store: 会话存储，为 None 时所有会话常驻内存
+            max_resident_sessions: 设置了会话存储时，内存中最多保留的会话数
+            max_resident_bytes: 设置了会话存储时，内存中会话的估算总大小上限（字节），为 None 时不限制
+            spill_after: 设置了会话存储时，没有客户端连接的会话闲置多少秒后转存到磁盘
+        """
+        self.agent_factory = agent_factory
+        self.max_sessions = max_sessions
+        self.max_queued_turns = max_queued_turns
+        self.outbox_size = outbox_size
+        self.send_timeout = send_timeout
+        self.idle_timeout = idle_timeout
+        self.tts = tts
+        self.tts_concurrency = tts_concurrency
+        self.tts_options = {"voice": DEFAULT_VOICE, "sample_rate": 24000, **(tts_options or {})}
+        self.emotion_prompt = emotion_prompt
+        self.store = store
+        self.max_resident_sessions = max_resident_sessions
+        self.max_resident_bytes = max_resident_bytes
+        self.spill_after = spill_after
+        self.sessions: Dict[str, GameSession] = {}
+        # 内存中的会话，按最近使用的顺序排列（最早使用的在前）
+        self._resident: "OrderedDict[str, GameSession]" = OrderedDict()
+        self.evictions = 0
+        self.rehydrations = 0
+        self.rejected_sessions = 0
+        self.rejected_turns = 0
+        self.completed_turns = 0
+        self._turn_slots = asyncio.Semaphore(max_concurrent_turns)
+        self._active = 0
+        self._waiting = 0
+        self._reaper: Optional[asyncio.Task] = None
+
+    async def create(self, session_id: Optional[str] = None) -> GameSession:
+        """
+        创建会话
+
+        Args:
+            session_id: 会话 ID，为 None 时自动生成
+
+        Returns:
+            新会话
+
+        Raises:
+            AdmissionError: 会话数已达上限或 ID 已存在
+        """
+        if len(self.sessions) >= self.max_sessions:
+            self.rejected_sessions += 1
+            raise AdmissionError("会话数已达上限")
+        session_id = session_id or uuid.uuid4().hex
+        if session_id in self.sessions:
+            raise AdmissionError(f"会话已存在: {session_id}")
+        session = GameSession(session_id, self.agent_factory(), self.outbox_size, self.send_timeout)
+        self.sessions[session_id] = session
+        await self._mark_used(session)
+        return session
+
+    def get(self, session_id: str) -> GameSession:
+        """
+        获取会话
+
+        Raises:
+            KeyError: 会话不存在
+        """
+        session = self.sessions[session_id]
+        session.touch()
+        return session
+
+    def close(self, session_id: str):
+        """关闭会话，释放语音识别连接并删除转存的快照"""
+        session = self.sessions.pop(session_id, None)
+        self._resident.pop(session_id, None)
+        if session is not None and session.voice is not None:
+            session.voice.stop()
+        if session is not None and self.store is not None:
+            self.store.delete(session_id)
+
+    async def update_environment(self, session: GameSession, environment: str):
+        """
+        更新会话的环境信息（由游戏引擎推送），进行中的对话结束后再更新
+
+        Raises:
+            SessionLostError: 转存的会话无法读回
+        """
+        session.touch()
+        async with session.turn_lock:
+            await self._ensure_resident(session)
+            session.agent.update_environment(environment)
+            session.resident_bytes = resident_size(session.agent)
+
+    async def handle_text(self, session: GameSession, text: str) -> Dict[str, Any]:
+        """
+        处理一轮玩家输入：流式推送医生说的话、各字段和音频块，返回完整响应
+
+        Args:
+            session: 会话
+            text: 玩家输入
+
+        Returns:
+            游戏响应
+
+        Raises:
+            AdmissionError: 会话正在处理上一轮，或排队的轮次已达上限
+            SessionLostError: 转存的会话无法读回
+        """
+        session.touch()
+        if session.turn_lock.locked():
+            self.rejected_turns += 1
+            raise AdmissionError("上一轮对话尚未结束")
+        if self._waiting >= self.max_queued_turns:
+            self.rejected_turns += 1
+            raise AdmissionError("服务器繁忙，请稍后再试")
+
+        async with session.turn_lock:
+            # 持有锁期间会话不会被转存
+            await self._ensure_resident(session)
+            self._waiting += 1
+            try:
+                await self._turn_slots.acquire()
+            finally:
+                self._waiting -= 1
+            self._active += 1
+            try:
+                if session.voice is not None:
+                    session.voice.pause()
+                response = await self._run_turn(session, text)
+                self.completed_turns += 1
+                session.resident_bytes = resident_size(session.agent)
+                return response
+            finally:
+                self._active -= 1
+                self._turn_slots.release()
+                if session.voice is not None:
+                    session.voice.resume()
+                session.touch()
+
+    async def feed_audio(self, session: GameSession, data: bytes):
+        """
+        输入客户端的音频块（16kHz 16 位单声道 PCM），识别到句子结束后自动开始一轮对话
+
+        Args:
+            session: 会话
+            data: PCM 数据
+        """
+        session.touch()
+        if session.voice is None:
+            from voice2text.audio_recorder import VoiceSession
+
+            loop = asyncio.get_running_loop()
+            session.voice = VoiceSession(
+                lambda text: loop.call_soon_threadsafe(self._on_transcript, session, text),
+                capture=False,
+            )
+            session.voice.start()
+        # 发送识别数据是阻塞的网络调用，放到线程中执行
+        await asyncio.to_thread(session.voice.feed, data)
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        获取服务器统计
+
+        Returns:
+            会话数（其中在内存中的会话数和估算大小）、进行中和排队的对话轮次、完成和被拒绝的次数、
+            转存和读回的次数
+        """
+        return {
+            "sessions": len(self.sessions),
+            "resident_sessions": len(self._resident),
+            "resident_bytes": sum(session.resident_bytes for session in self._resident.values()),
+            "evictions": self.evictions,
+            "rehydrations": self.rehydrations,
+            "connected": sum(1 for session in self.sessions.values() if session.connected),
+            "active_turns": self._active,
+            "queued_turns": self._waiting,
+            "completed_turns": self.completed_turns,
+            "rejected_sessions": self.rejected_sessions,
+            "rejected_turns": self.rejected_turns,
+        }
+
+    def session_sizes(self) -> List[Dict[str, Any]]:
+        """
+        获取每个会话的大小
+
+        Returns:
+            每个会话的 ID、是否在内存中、估算的内存占用、转存的快照大小和对话轮数，按内存占用从大到小排列
+        """
+        sizes = [
+            {
+                "session_id": session.session_id,
+                "resident": session.resident,
+                "resident_bytes": session.resident_bytes if session.resident else 0,
+                "stored_bytes": session.stored_bytes,
+                "turns": session.turns,
+            }
+            for session in self.sessions.values()
+        ]
+        sizes.sort(key=lambda item: item["resident_bytes"], reverse=True)
+        return sizes
+
+    def start_reaper(self, interval: float = 60.0):
+        """启动后台任务，定期关闭闲置的会话，并将闲置较久的会话转存到磁盘"""
+        if self._reaper is None:
+            self._reaper = asyncio.create_task(self._reap_loop(interval))
+
+    async def stop(self):
+        """停止后台任务并关闭所有会话"""
+        if self._reaper is not None:
+            self._reaper.cancel()
+            self._reaper = None
+        for session_id in list(self.sessions):
+            self.close(session_id)
+
+    async def _reap_loop(self, interval: float):
+        while True:
+            await asyncio.sleep(interval)
+            now = time.monotonic()
+            for session_id, session in list(self.sessions.items()):
+                if session.connected or session.turn_lock.locked() or session.spill_task is not None:
+                    continue
+                if now - session.last_active > self.idle_timeout:
+                    self.close(session_id)
+                elif self.store is not None and session.resident and now - session.last_active > self.spill_after:
+                    await self._spill(session)
+
+    async def _ensure_resident(self, session: GameSession):
+        """会话已被转存时从磁盘读回（正在转存时先等待写入完成），并标记为最近使用"""
+        if session.spill_task is not None:
+            await asyncio.shield(session.spill_task)
+        if not session.resident:
+            agent = self.agent_factory()
+            try:
+                found = await asyncio.to_thread(self.store.load, session.session_id, agent)
+            except Exception as e:
+                print(f"读回会话 {session.session_id} 失败: {e}")
+                found = False
+            if not found:
+                # 不能当作新游戏继续：玩家的历史已经丢失，关闭会话并告诉客户端
+                self.close(session.session_id)
+                raise SessionLostError("会话的存档缺失或已损坏，请重新创建会话")
+            session.agent = agent
+            session.resident_bytes = resident_size(agent)
+            self.rehydrations += 1
+        await self._mark_used(session)
+
+    async def _mark_used(self, session: GameSession):
+        self._resident[session.session_id] = session
+        self._resident.move_to_end(session.session_id)
+        if session.resident_bytes == 0:
+            session.resident_bytes = resident_size(session.agent)
+        await self._evict(keep=session)
+
+    async def _evict(self, keep: GameSession):
+        """超出内存上限时，按最近最少使用的顺序转存没有客户端连接、没有进行中对话的会话"""
+        if self.store is None:
+            return
+        candidates = iter(list(self._resident.values()))
+        while self._over_limit():
+            session = next(candidates, None)
+            if session is None:
+                return
+            if session is keep or session.connected or session.turn_lock.locked() or session.spill_task is not None:
+                continue
+            await self._spill(session)
+
+    def _over_limit(self) -> bool:
+        if len(self._resident) > self.max_resident_sessions:
+            return True
+        if self.max_resident_bytes is None:
+            return False
+        return sum(session.resident_bytes for session in self._resident.values()) > self.max_resident_bytes
+
+    async def _spill(self, session: GameSession):
+        """
+        将会话的消息历史和状态写入存储并释放游戏代理和语音识别连接。
+        压缩和落盘在线程中进行，不阻塞其他会话；写入期间会话的请求等待写入完成后再读回
+        """
+        # 先移出常驻列表，写入期间不再计入内存占用，也不会被再次选中
+        self._resident.pop(session.session_id, None)
+        session.spill_task = asyncio.create_task(
+            asyncio.to_thread(self.store.save, session.session_id, session.agent)
+        )
+        try:
+            session.stored_bytes = await session.spill_task
+        except Exception as e:
+            print(f"转存会话 {session.session_id} 失败: {e}")
+            self._resident[session.session_id] = session
+            return
+        finally:
+            session.spill_task = None
+        session.agent = None
+        if session.voice is not None:
+            session.voice.stop()
+            session.voice = None
+        self.evictions += 1
+        if session.session_id not in self.sessions:
+            # 写入期间会话已被关闭
+            self.store.delete(session.session_id)
+
+    def _on_transcript(self, session: GameSession, text: str):
+        """语音识别到句子结束（在事件循环线程中调用）"""
+        if session.session_id not in self.sessions:
+            return
+        asyncio.create_task(self._voice_turn(session, text))
+
+    async def _voice_turn(self, session: GameSession, text: str):
+        try:
+            await session.send({"type": "transcript", "text": text})
+            await self.handle_text(session, text)
+        except AdmissionError as e:
+            await session.send({"type": "busy", "message": str(e)})
+        except BackpressureError:
+            session.connected = False
+        except SessionLostError as e:
+            await session.send({"type": "session_lost", "message": str(e)})
+        except Exception as e:
+            await session.send({"type": "error", "message": str(e)})
+
+    async def _run_turn(self, session: GameSession, text: str) -> Dict[str, Any]:
+        # 轮次记录保存在当前任务的上下文中，并发的会话互不干扰；语音合成任务创建时继承同一轮次
+        tracer.begin_turn(session=session.session_id, input_chars=len(text))
+        tracer.mark(STAGE_INPUT)
+        splitter = SentenceSplitter()
+        speech = _SpeechStreamer(self, session) if self.tts and session.connected else None
+        speak_started = False
+        speak_done = False
+
+        async def on_speak_delta(delta):
+            nonlocal speak_started
+            if not speak_started:
+                speak_started = True
+                tracer.mark(STAGE_FIRST_DELTA)
+            await session.send({"type": "speak_delta", "text": delta})
+            if speech is not None:
+                for sentence in splitter.feed(delta):
+                    speech.submit(sentence)
+
+        async def on_field(key, value):
+            nonlocal speak_done
+            await session.send({"type": "field", "key": key, "value": value})
+            if key == "speak":
+                speak_done = True
+                tracer.mark(STAGE_SPEAK_DONE)
+                if speech is not None:
+                    for sentence in splitter.flush():
+                        speech.submit(sentence)
+
+        async def on_retract():
+            nonlocal splitter, speech, speak_done
+            # 返回不合格被替换：停止推送已收到台词的语音，客户端丢弃之前的 speak_delta，随后按最终响应重新推送
+            if speech is not None:
+                speech.cancel()
+                speech = _SpeechStreamer(self, session)
+            splitter = SentenceSplitter()
+            speak_done = False
+            await session.send({"type": "retract"})
+
+        try:
+            tracer.mark(STAGE_LLM_REQUEST)
+            response = await session.agent.process_user_input_stream(
+                text, on_speak_delta=on_speak_delta, on_field=on_field, on_retract=on_retract
+            )
+            tracer.mark(STAGE_LLM_DONE)
+            # 流式解析未能读到完整的 "speak" 字段时（如返回了默认响应），按完整响应推送
+            if not speak_done and "speak" in response:
+                await on_speak_delta(response["speak"])
+                await on_field("speak", response["speak"])
+            session.turns += 1
+            await session.send({"type": "response", "response": response})
+            if speech is not None:
+                await speech.finish()
+            tracer.mark(STAGE_PLAYBACK_DONE)
+            await session.send({"type": "turn_end"})
+            return response
+        finally:
+            if speech is not None:
+                speech.cancel()
+            tracer.end_turn()
+
+
+class _SpeechStreamer:
+    """一轮对话的语音推送：各句并发合成（每个会话有上限），音频块按句子顺序推送"""
+
+    def __init__(self, manager: SessionManager, session: GameSession):
+        self.manager = manager
+        self.session = session
+        self._order: asyncio.Queue = asyncio.Queue()
+        self._slots = asyncio.Semaphore(manager.tts_concurrency)
+        self._tasks = []
+        self._index = itertools.count()
+        self._forwarder = asyncio.create_task(self._forward_loop())
+
+    def submit(self, sentence: str):
+        chunks: asyncio.Queue = asyncio.Queue(maxsize=self.session.outbox.maxsize)
+        task = asyncio.create_task(self._synthesize(sentence, chunks))
+        self._tasks.append(task)
+        self._order.put_nowait((next(self._index), sentence, chunks))
+
+    async def finish(self):
+        """等待所有音频推送完毕"""
+        self._order.put_nowait(None)
+        await self._forwarder
+
+    def cancel(self):
+        self._forwarder.cancel()
+        for task in self._tasks:
+            task.cancel()
+
+    async def _synthesize(self, sentence: str, chunks: asyncio.Queue):
+        try:
+            async with self._slots:
+                async for chunk in generate_voice_stream_async(
+                    f"{self.manager.emotion_prompt}{sentence}",
+                    response_format="pcm",
+                    **self.manager.tts_options,
+                ):
+                    await chunks.put(chunk)
+            await chunks.put(None)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            await chunks.put(e)
+
+    async def _forward_loop(self):
+        while True:
+            item = await self._order.get()
+            if item is None:
+                return
+            index, sentence, chunks = item
+            await self.session.send({
+                "type": "audio_start",
+                "index": index,
+                "text": sentence,
+                "format": "pcm",
+                "sample_rate": self.manager.tts_options["sample_rate"],
+            })
+            while True:
+                chunk = await chunks.get()
+                if chunk is None:
+                    break
+                if isinstance(chunk, Exception):
+                    await self.session.send({"type": "error", "message": f"语音合成失败: {chunk}"})
+                    break
+                await self.session.send(chunk)
+            await self.session.send({"type": "audio_end", "index": index})
@@ -0,0 +1,101 @@
+import hashlib
+import os
+import re
+import sys
+from typing import Any, Set
+
+from game_prompt.interning import shared_prompts
+from game_prompt.session_journal import SessionJournal, apply_state
+
+SAFE_NAME = re.compile(r"[A-Za-z0-9_-]{1,64}")
+
+
+def resident_size(agent) -> int:
+    """
+    估算游戏代理的消息历史和状态占用的内存（字节）。多个位置引用的同一对象只计算一次，
+    所有代理共享的静态提示不计入（环境信息每个代理各自保存，计入）
+
+    Args:
+        agent: 游戏代理
+
+    Returns:
+        估算的字节数
+    """
+    seen: Set[int] = set()
+
+    def size(obj: Any) -> int:
+        if obj is None or id(obj) in seen or shared_prompts.is_shared(obj):
+            return 0
+        seen.add(id(obj))
+        total = sys.getsizeof(obj)
+        if isinstance(obj, dict):
+            total += sum(size(key) + size(value) for key, value in obj.items())
+        elif isinstance(obj, (list, tuple)):
+            total += sum(size(item) for item in obj)
+        return total
+
+    return size(agent.messages) + size(agent.environment) + size(agent.mood)
+
+
+class SessionStore:
+    """
+    闲置会话的本地存储：每个会话的消息历史和状态压缩成一个快照文件，重新活跃时读回
+    """
+
+    def __init__(self, directory: str, compress: bool = True):
+        """
+        初始化会话存储
+
+        Args:
+            directory: 存放快照的目录
+            compress: 是否使用 gzip 压缩
+        """
+        self.directory = directory
+        self.compress = compress
+        self.saves = 0
+        self.loads = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def save(self, session_id: str, agent) -> int:
+        """
+        保存代理的消息历史和状态
+
+        Args:
+            session_id: 会话 ID
+            agent: 游戏代理
+
+        Returns:
+            快照文件的字节数
+        """
+        journal = self._journal(session_id)
+        journal.snapshot(agent)
+        journal.close()
+        self.saves += 1
+        return os.path.getsize(journal.snapshot_path)
+
+    def load(self, session_id: str, agent) -> bool:
+        """
+        将保存的消息历史和状态写回代理
+
+        Args:
+            session_id: 会话 ID
+            agent: 游戏代理（通常是新创建的）
+
+        Returns:
+            是否找到了保存的会话
+        """
+        data = self._journal(session_id).load()
+        if data is None:
+            return False
+        apply_state(agent, data)
+        self.loads += 1
+        return True
+
+    def delete(self, session_id: str):
+        """删除会话的快照"""
+        self._journal(session_id).reset()
+
+    def _journal(self, session_id: str) -> SessionJournal:
+        # 会话 ID 可能来自客户端，不能直接作为文件名时使用其哈希
+        name = session_id if SAFE_NAME.fullmatch(session_id) else hashlib.sha1(session_id.encode("utf-8")).hexdigest()
+        return SessionJournal(os.path.join(self.directory, name), compress=self.compress)
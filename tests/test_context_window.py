@@ -0,0 +1,106 @@
+import json
+
+from game_prompt.context_window import (
+    ENVIRONMENT_DELTA_PREFIX,
+    MOOD_UPDATE_PREFIX,
+    SUMMARY_HEADER,
+    ContextWindow,
+    estimate_tokens,
+)
+from game_prompt.game_prompts import action_prompt
+
+
+def system(content):
+    return {"role": "system", "content": content}
+
+
+def environment(room):
+    return system(json.dumps({"room": room, "objects": {"门": "一扇门"}}, ensure_ascii=False))
+
+
+def dialogue(turns):
+    messages = []
+    for i in range(turns):
+        messages.append({"role": "user", "content": f"第{i}轮：你现在在哪里，周围有什么东西？"})
+        messages.append({"role": "assistant", "content": json.dumps(
+            {"action": "none", "target": "none", "speak": f"第{i}轮的回答，我在房间里，很害怕", "mood": "平静"},
+            ensure_ascii=False,
+        )})
+    return messages
+
+
+def summary_line(message):
+    if message["role"] == "user":
+        return "警方: " + message["content"]
+    return "你: [none none] " + json.loads(message["content"])["speak"]
+
+
+def history(turns):
+    return (
+        [system("你是被困在医院里的病人。"), system(action_prompt), environment("病房")]
+        + [system(MOOD_UPDATE_PREFIX + "轻微紧张")]
+        + dialogue(turns // 2)
+        + [environment("走廊"), system(ENVIRONMENT_DELTA_PREFIX + "新增: 钥匙"), system(MOOD_UPDATE_PREFIX + "平静")]
+        + dialogue(turns - turns // 2)
+    )
+
+
+def test_estimate_tokens():
+    assert estimate_tokens("") == 0
+    assert estimate_tokens("你好") == 2
+    assert estimate_tokens("abcd") == 1
+    assert estimate_tokens("你好abcde") == 4
+
+
+def test_under_budget_returned_unchanged():
+    window = ContextWindow(max_tokens=100000)
+    messages = history(10)
+
+    assert window.compact(messages) is messages
+
+
+def test_superseded_state_dropped_and_old_dialogue_folded():
+    window = ContextWindow(max_tokens=2000, min_recent_messages=4, max_summary_tokens=300)
+    messages = history(30)
+
+    compacted = window.compact(messages)
+
+    # 固定的系统提示保持在最前，摘要紧跟其后
+    assert compacted[:2] == messages[:2]
+    assert compacted[2]["content"].startswith(SUMMARY_HEADER)
+    # 只保留最新的环境信息、其后的环境增量和最新的心情
+    contents = [m["content"] for m in compacted]
+    assert environment("走廊")["content"] in contents
+    assert environment("病房")["content"] not in contents
+    assert ENVIRONMENT_DELTA_PREFIX + "新增: 钥匙" in contents
+    assert [c for c in contents if c.startswith(MOOD_UPDATE_PREFIX)] == [MOOD_UPDATE_PREFIX + "平静"]
+    # 最近的对话原样保留，较早的折叠成摘要行
+    assert compacted[-4:] == messages[-4:]
+    recent = [m for m in compacted if m["role"] != "system"]
+    older = [m for m in messages[:messages.index(recent[0])] if m["role"] != "system"]
+    summary = compacted[2]["content"].split("\n")[1:]
+    assert summary[-2:] == [summary_line(m) for m in older[-2:]]
+    assert window.count(compacted) <= window.target_tokens
+
+
+def test_folding_keeps_minimum_recent_messages():
+    window = ContextWindow(max_tokens=50, min_recent_messages=6)
+    messages = history(10)
+
+    compacted = window.compact(messages)
+
+    dialogue_messages = [m for m in compacted if m["role"] != "system"]
+    assert dialogue_messages == [m for m in messages if m["role"] != "system"][-6:]
+
+
+def test_existing_summary_merged_and_trimmed():
+    window = ContextWindow(max_tokens=400, min_recent_messages=2, max_summary_tokens=40, summary_line_chars=20)
+    messages = history(20)
+    once = window.compact(messages)
+    twice = window.compact(once + dialogue(20))
+
+    summaries = [m for m in twice if m["content"].startswith(SUMMARY_HEADER)]
+    assert len(summaries) == 1
+    lines = summaries[0]["content"].split("\n")[1:]
+    assert all(len(line) <= 21 for line in lines)
+    assert len(lines) == 1 or sum(estimate_tokens(line) for line in lines) <= 40
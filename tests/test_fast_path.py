@@ -0,0 +1,96 @@
+from game_prompt.fast_path import SOURCE_CACHE, SOURCE_LLM, FastPath
+from game_prompt.world_state import WorldState
+
+SCENARIO = {
+    "start": "病房",
+    "rooms": {
+        "病房": {
+            "objects": {"门": "一扇锁着的门", "钥匙": "床头柜上的钥匙"},
+            "exits": {"门": "走廊"},
+            "interactions": {
+                "钥匙": {"result": "你拿起了钥匙", "remove": ["钥匙"], "change": {"门": "一扇没锁的门"}},
+                "门": {"result": "门锁着"},
+            },
+        },
+        "走廊": {"objects": {}},
+    },
+}
+
+
+class FakeAgent:
+    """只记录调用的游戏代理：环境信息和心情不随世界变化（增量更新写在消息历史中）"""
+
+    def __init__(self, responses):
+        self.environment = "病房"
+        self.mood = "平静"
+        self.turns = []
+        self.calls = 0
+        self._responses = list(responses)
+
+    def record_turn(self, user_input, content):
+        self.turns.append((user_input, content))
+
+    def process_user_input_stream(self, user_input, on_speak_delta=None, on_field=None, on_retract=None):
+        self.calls += 1
+        return self._responses.pop(0)
+
+
+def response(action, target, speak):
+    return {"action": action, "target": target, "speak": speak, "mood": "平静"}
+
+
+def make_fast_path(agent, world):
+    return FastPath(
+        agent,
+        validator=lambda r: world.validate(r["action"], r["target"]) is None,
+        duplicate_window=None,
+        state_version=lambda: world.version,
+    )
+
+
+def test_cached_response_replayed_while_world_unchanged():
+    world = WorldState(SCENARIO)
+    agent = FakeAgent([response("none", "none", "这里好安静")])
+    fast_path = make_fast_path(agent, world)
+
+    first = fast_path.run("看看四周")
+    world.apply(first)
+    second = fast_path.run("看看四周")
+
+    assert second == first
+    assert fast_path.last_source == SOURCE_CACHE
+    assert agent.calls == 1
+
+
+def test_cached_response_not_replayed_after_world_changes():
+    world = WorldState(SCENARIO)
+    agent = FakeAgent([
+        response("interact", "门", "门好像锁着"),
+        response("interact", "钥匙", "我拿起钥匙"),
+        response("move", "门", "门开了，我出去看看"),
+    ])
+    fast_path = make_fast_path(agent, world)
+
+    fast_path.run("开门")
+    world.apply(fast_path.run("拿钥匙"))  # 钥匙打开了门锁，环境信息和心情不变
+    third = fast_path.run("开门")
+
+    assert fast_path.last_source == SOURCE_LLM
+    assert third["action"] == "move"
+    assert agent.calls == 3
+
+
+def test_cached_response_revalidated_before_replay():
+    world = WorldState(SCENARIO)
+    agent = FakeAgent([response("interact", "钥匙", "我拿起钥匙"), response("none", "none", "钥匙已经在我手里了")])
+    # 不提供世界版本时，重放前的校验仍会丢弃目标已不存在的缓存
+    fast_path = FastPath(
+        agent, validator=lambda r: world.validate(r["action"], r["target"]) is None, duplicate_window=None
+    )
+
+    world.apply(fast_path.run("拿钥匙"))
+    second = fast_path.run("拿钥匙")
+
+    assert second["action"] == "none"
+    assert fast_path.last_source == SOURCE_LLM
+    assert agent.calls == 2
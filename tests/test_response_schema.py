@@ -0,0 +1,62 @@
+from game_prompt.response_schema import extract_json, parse_response, repair_response, validate_response
+
+VALID = {"action": "move", "target": "门", "speak": "我出去看看", "mood": "平静"}
+
+
+def test_extract_plain_json():
+    assert extract_json('{"action": "move", "target": "门", "speak": "我出去看看", "mood": "平静"}') == VALID
+
+
+def test_extract_fenced_json_with_surrounding_text():
+    text = '好的，这是我的回应：\n```json\n{"action": "move", "target": "门", "speak": "我出去看看", "mood": "平静"}\n```\n希望可以。'
+    assert extract_json(text) == VALID
+
+
+def test_extract_repairs_trailing_commas():
+    text = '```\n{"action": "move", "target": "门", "speak": "我出去看看", "mood": "平静", "extra": [1, 2,],}\n```'
+    assert extract_json(text) == dict(VALID, extra=[1, 2])
+
+
+def test_extract_repairs_smart_quotes():
+    text = '{“action”: “move”, “target”: “门”, “speak”: “我出去看看”, “mood”: “平静”,}'
+    assert extract_json(text) == VALID
+
+
+def test_extract_truncated_keeps_complete_fields():
+    assert extract_json('{"action": "move", "target": "门", "speak": "我出') == {"action": "move", "target": "门"}
+
+
+def test_extract_rejects_non_objects():
+    assert extract_json("") is None
+    assert extract_json("[1, 2]") is None
+    assert extract_json("我不知道") is None
+
+
+def test_repair_response_fixes_only_certain_problems():
+    data = {"action": " NONE ", "speak": "……", "mood": "开心"}
+
+    repaired = repair_response(data, "轻微紧张")
+
+    assert repaired == {"action": "none", "target": "none", "speak": "……", "mood": "轻微紧张"}
+    assert data["action"] == " NONE "  # 不修改传入的字典
+    assert validate_response(repaired) == []
+
+
+def test_repair_keeps_missing_target_for_move():
+    repaired = repair_response({"action": "Move", "speak": "走", "mood": "平静"}, "平静")
+
+    assert "target" not in repaired
+    assert validate_response(repaired) == ["缺少 target"]
+
+
+def test_validate_response_reports_each_problem():
+    errors = validate_response({"action": "jump", "target": "none", "speak": " ", "mood": "平静"})
+
+    assert errors == ["action 只能是 move、interact、none", "缺少 speak"]
+    assert validate_response(dict(VALID, action="interact", target="none")) == ["interact 需要目标"]
+    assert validate_response("text") == ["返回的不是 JSON 对象"]
+
+
+def test_parse_response_extracts_repairs_and_validates():
+    assert parse_response('```json\n{"action": "MOVE", "target": "门", "speak": "我出去看看", "mood": "?",}\n```', "平静") == (VALID, [])
+    assert parse_response("没有 JSON", "平静") == (None, ["返回的不是 JSON 对象"])
@@ -0,0 +1,148 @@
+import os
+
+from game_prompt.session_journal import STATE_FIELDS, SessionJournal
+
+
+class FakeAgent:
+    def __init__(self):
+        self.messages = [{"role": "system", "content": "系统提示"}]
+        self.mood = "平静"
+        self.environment = "病房"
+        self.action_prompt_sent = False
+        self.environment_in_history = False
+        self.world_state = None
+
+
+def say(agent, text):
+    agent.messages.append({"role": "user", "content": text})
+    agent.messages.append({"role": "assistant", "content": f"回答: {text}"})
+
+
+def restored(path, compress=False):
+    agent = FakeAgent()
+    agent.messages = []
+    assert SessionJournal(path, compress=compress).restore(agent)
+    return agent
+
+
+def test_journal_replayed_after_snapshot(tmp_path):
+    path = str(tmp_path / "save")
+    agent = FakeAgent()
+    journal = SessionJournal(path)
+    journal.snapshot(agent)
+    say(agent, "你好")
+    agent.mood = "轻微紧张"
+    agent.world_state = {"room": "走廊", "objects": {}}
+    journal.record(agent)
+    journal.close()
+
+    loaded = restored(path)
+
+    assert loaded.messages == agent.messages
+    assert all(getattr(loaded, field) == getattr(agent, field) for field in STATE_FIELDS)
+
+
+def test_partial_last_record_ignored(tmp_path):
+    path = str(tmp_path / "save")
+    agent = FakeAgent()
+    journal = SessionJournal(path)
+    journal.snapshot(agent)
+    say(agent, "第一句")
+    journal.record(agent)
+    journal.close()
+    # 写到一半崩溃：最后一条记录不完整
+    with open(journal.journal_path, "ab") as f:
+        f.write(b'{"seq": 9, "op": "append", "message": {"role": "user", "con')
+
+    loaded = restored(path)
+
+    assert loaded.messages == agent.messages
+
+    # 恢复后压缩成新的快照，不完整的记录不会留在日志里，之后的记录照常追加
+    journal = SessionJournal(path)
+    journal.restore(loaded)
+    say(loaded, "第二句")
+    journal.record(loaded)
+    journal.close()
+    assert restored(path).messages == loaded.messages
+
+
+def test_partial_compressed_journal_ignored(tmp_path):
+    path = str(tmp_path / "save")
+    agent = FakeAgent()
+    journal = SessionJournal(path, compress=True)
+    journal.snapshot(agent)
+    say(agent, "你好")
+    journal.record(agent)
+    journal.close()
+    with open(journal.journal_path, "r+b") as f:
+        f.truncate(os.path.getsize(journal.journal_path) - 5)
+
+    loaded = restored(path, compress=True)
+
+    # 截断的 gzip 流读到哪里算哪里，已读出的消息与原来一致
+    assert loaded.messages == agent.messages[:len(loaded.messages)]
+    assert loaded.messages[0] == agent.messages[0]
+
+
+def test_interrupted_snapshot_keeps_previous_one(tmp_path):
+    path = str(tmp_path / "save")
+    agent = FakeAgent()
+    journal = SessionJournal(path)
+    say(agent, "你好")
+    journal.snapshot(agent)
+    journal.close()
+    # 写临时文件时崩溃：已有的快照不受影响
+    with open(f"{journal.snapshot_path}.tmp", "wb") as f:
+        f.write(b'{"seq": 0, "messages": [')
+
+    assert restored(path).messages == agent.messages
+
+
+def test_records_already_in_snapshot_skipped(tmp_path):
+    path = str(tmp_path / "save")
+    agent = FakeAgent()
+    journal = SessionJournal(path)
+    journal.snapshot(agent)
+    say(agent, "你好")
+    journal.record(agent)
+    journal.sync()
+    with open(journal.journal_path, "rb") as f:
+        stale = f.read()
+    # 快照写入后、清空日志前崩溃：日志中的记录已包含在快照中
+    journal.snapshot(agent)
+    journal.close()
+    with open(journal.journal_path, "wb") as f:
+        f.write(stale)
+
+    assert restored(path).messages == agent.messages
+
+
+def test_replaced_history_written_as_snapshot(tmp_path):
+    path = str(tmp_path / "save")
+    agent = FakeAgent()
+    journal = SessionJournal(path)
+    journal.snapshot(agent)
+    say(agent, "你好")
+    journal.record(agent)
+    # 上下文压缩等替换了消息历史
+    agent.messages = agent.messages[:1] + [{"role": "system", "content": "摘要"}]
+    journal.record(agent)
+    journal.close()
+
+    assert journal.records == 0
+    assert restored(path).messages == agent.messages
+
+
+def test_archive_and_missing_save(tmp_path):
+    path = str(tmp_path / "save")
+    agent = FakeAgent()
+    journal = SessionJournal(path)
+
+    assert journal.load() is None
+    assert not journal.archive()
+
+    journal.snapshot(agent)
+    assert journal.archive()
+    assert not journal.exists()
+    assert os.path.exists(journal.snapshot_path + ".bak")
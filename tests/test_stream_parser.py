@@ -0,0 +1,85 @@
+import json
+
+from game_prompt.stream_parser import IncrementalJSONReader, get_stream_delta, get_stream_tool_call, iter_sse_data
+
+RESPONSE = {"action": "interact", "target": "门", "speak": "门\"锁\"着\n😀，怎么办", "mood": "轻微紧张"}
+
+
+def feed_all(reader, chunks):
+    events = []
+    for chunk in chunks:
+        events.extend(reader.feed(chunk))
+    return events
+
+
+def speak_deltas(events):
+    return "".join(text for kind, key, text in events if kind == "delta" and key == "speak")
+
+
+def test_fragmented_json_read_char_by_char():
+    # ensure_ascii 输出 \uXXXX 转义（包括 emoji 的代理对），逐字输入时转义序列被拆散
+    text = json.dumps(RESPONSE)
+    reader = IncrementalJSONReader()
+    events = feed_all(reader, text)
+
+    assert reader.done
+    assert reader.fields == RESPONSE
+    assert speak_deltas(events) == RESPONSE["speak"]
+    assert [key for kind, key, _ in events if kind == "field"] == list(RESPONSE)
+
+
+def test_fields_reported_when_complete_across_chunks():
+    reader = IncrementalJSONReader()
+    assert reader.feed('```json\n{"act') == []
+    assert reader.feed('ion": "mo') == [("delta", "action", "mo")]
+    assert reader.feed('ve", "speak": "你') == [
+        ("delta", "action", "ve"),
+        ("field", "action", "move"),
+        ("delta", "speak", "你"),
+    ]
+    assert reader.feed('好"}\n```') == [("delta", "speak", "好"), ("field", "speak", "你好")]
+    assert reader.done
+
+
+def test_truncated_json_keeps_completed_fields():
+    reader = IncrementalJSONReader()
+    events = reader.feed('{"action": "none", "target": "none", "speak": "我不知道该')
+
+    assert not reader.done
+    assert reader.fields == {"action": "none", "target": "none"}
+    assert speak_deltas(events) == "我不知道该"
+
+
+def test_nested_and_non_string_values_ignored():
+    reader = IncrementalJSONReader()
+    feed_all(reader, ['{"extra": {"speak": "x"}, "count": 3, "list": ["a", ', '"b"], "speak": "好"}'])
+
+    assert reader.fields == {"speak": "好"}
+    assert reader.done
+
+
+def test_iter_sse_data_decodes_utf8_and_stops_at_done():
+    chunk = {"choices": [{"delta": {"content": "你好"}}]}
+    lines = [
+        b": keep-alive",
+        b"",
+        ("data: " + json.dumps(chunk, ensure_ascii=False)).encode("utf-8"),
+        b"data: [DONE]",
+        b'data: {"late": true}',
+    ]
+
+    chunks = list(iter_sse_data(lines))
+
+    assert chunks == [chunk]
+    assert get_stream_delta(chunks[0]) == "你好"
+    assert get_stream_delta({"choices": []}) == ""
+
+
+def test_get_stream_tool_call_reads_first_call():
+    chunk = {"choices": [{"delta": {"tool_calls": [
+        {"index": 1, "function": {"arguments": "ignored"}},
+        {"index": 0, "function": {"name": "move", "arguments": '{"tar'}},
+    ]}}]}
+
+    assert get_stream_tool_call(chunk) == ("move", '{"tar')
+    assert get_stream_tool_call({"choices": [{"delta": {"content": "x"}}]}) is None
@@ -0,0 +1,75 @@
+import json
+
+import pytest
+
+from game_prompt.stream_parser import IncrementalJSONReader
+from game_prompt.tool_protocol import ToolCallStream, first_tool_call, tool_call_text
+
+
+def run_stream(deltas):
+    stream = ToolCallStream()
+    text = "".join(stream.feed(name, fragment) for name, fragment in deltas)
+    return text + stream.finish()
+
+
+def test_arguments_split_across_chunks():
+    deltas = [
+        ("interact", ""),
+        (None, " "),
+        (None, "{"),
+        (None, ' "tar'),
+        (None, 'get": "门", "spe'),
+        (None, 'ak": "我试试'),
+        (None, '开门", "mood": "平静"'),
+        (None, "}"),
+    ]
+
+    text = run_stream(deltas)
+
+    assert json.loads(text) == {"action": "interact", "target": "门", "speak": "我试试开门", "mood": "平静"}
+
+
+def test_speak_streams_through_reader():
+    stream = ToolCallStream()
+    reader = IncrementalJSONReader()
+    speak = []
+    for name, fragment in [("none", '{"speak": "别'), (None, "过来"), (None, '", "mood": "极度恐慌"}')]:
+        for kind, key, text in reader.feed(stream.feed(name, fragment)):
+            if kind == "delta" and key == "speak":
+                speak.append(text)
+    reader.feed(stream.finish())
+
+    assert speak == ["别", "过来"]
+    assert reader.done
+    assert reader.fields == {"action": "none", "speak": "别过来", "mood": "极度恐慌"}
+
+
+@pytest.mark.parametrize("deltas", [
+    [("none", "")],
+    [("none", "{")],
+    [("none", "{"), (None, " }")],
+])
+def test_empty_arguments(deltas):
+    assert json.loads(run_stream(deltas)) == {"action": "none"}
+
+
+def test_fragments_before_name_are_dropped():
+    stream = ToolCallStream()
+
+    assert stream.feed(None, '{"speak": "x"}') == ""
+    assert stream.finish() == ""
+
+
+def test_tool_call_text_fills_target_only_for_none():
+    assert json.loads(tool_call_text("none", '{"speak": "好", "mood": "平静"}')) == {
+        "action": "none", "target": "none", "speak": "好", "mood": "平静",
+    }
+    assert json.loads(tool_call_text("move", '{"speak": "走"}')) == {"action": "move", "speak": "走"}
+    assert json.loads(tool_call_text("move", "{broken")) == {"action": "move"}
+
+
+def test_first_tool_call_accepts_dicts():
+    calls = [{"function": {"name": "move", "arguments": '{"target": "门"}'}}]
+
+    assert first_tool_call(calls) == ("move", '{"target": "门"}')
+    assert first_tool_call([]) is None
@@ -0,0 +1,115 @@
+import threading
+
+import pytest
+
+from game_prompt.tracing import JSONLExporter, Tracer, _percentiles, load_records, summarize
+
+
+def test_percentiles_nearest_rank_in_milliseconds():
+    # 101 个样本：第 p 百分位正好是排序后下标为 p 的样本
+    samples = [i / 1000 for i in range(101)]
+    samples.reverse()
+
+    result = _percentiles(samples)
+
+    assert result["count"] == 101
+    assert result["p50"] == pytest.approx(50.0)
+    assert result["p95"] == pytest.approx(95.0)
+    assert result["p99"] == pytest.approx(99.0)
+
+
+def test_percentiles_small_samples():
+    assert _percentiles([0.2]) == {"count": 1, "p50": 200.0, "p95": 200.0, "p99": 200.0}
+    # 下标按 p / 100 * (n - 1) 四舍五入：4 个样本时 p50 取下标 2（round(1.5)）
+    result = _percentiles([0.004, 0.001, 0.003, 0.002])
+    assert result["p50"] == pytest.approx(3.0)
+    assert result["p95"] == pytest.approx(4.0)
+    assert result["p99"] == pytest.approx(4.0)
+
+
+def test_summarize_groups_turns_marks_and_spans():
+    records = [
+        {
+            "duration": 1.0,
+            "marks": {"first_audio": 0.5},
+            "spans": [{"name": "llm.chat_stream", "duration": 0.8, "marks": {"ttfb": 0.2}}],
+        },
+        {
+            "duration": 2.0,
+            "marks": {"first_audio": 0.7},
+            "spans": [
+                {"name": "llm.chat_stream", "duration": 1.2, "marks": {"ttfb": 0.4}},
+                {"name": "tts.synthesize", "duration": 0.3},
+            ],
+        },
+        {"duration": 3.0},
+    ]
+
+    summary = summarize(records)
+
+    assert set(summary) == {"turn", "@first_audio", "llm.chat_stream", "llm.chat_stream.ttfb", "tts.synthesize"}
+    assert summary["turn"]["count"] == 3
+    assert summary["turn"]["p50"] == pytest.approx(2000.0)
+    assert summary["turn"]["p99"] == pytest.approx(3000.0)
+    assert summary["@first_audio"]["count"] == 2
+    assert summary["llm.chat_stream"]["p95"] == pytest.approx(1200.0)
+    # 2 个样本时 p50 取下标 round(0.5) = 0
+    assert summary["llm.chat_stream.ttfb"]["p50"] == pytest.approx(200.0)
+    assert summary["llm.chat_stream.ttfb"]["p95"] == pytest.approx(400.0)
+    assert summary["tts.synthesize"] == {"count": 1, "p50": 300.0, "p95": 300.0, "p99": 300.0}
+
+
+def test_turn_records_exported_and_summarized(tmp_path):
+    path = str(tmp_path / "turns.jsonl")
+    tracer = Tracer(JSONLExporter(path))
+
+    tracer.begin_turn(mode="text")
+    with tracer.span("llm.chat", model="small") as span:
+        span.mark("ttfb")
+    tracer.add_usage({"prompt_tokens": 10, "completion_tokens": 5})
+    tracer.add_usage({"prompt_tokens": 3})
+    tracer.mark("response")
+    tracer.end_turn(source="llm")
+
+    records = load_records(path)
+    assert len(records) == 1
+    record = records[0]
+    assert record["attrs"] == {"mode": "text", "source": "llm"}
+    assert record["usage"] == {"prompt_tokens": 13, "completion_tokens": 5}
+    assert [span["name"] for span in record["spans"]] == ["llm.chat"]
+    assert set(summarize(records)) == {"turn", "@response", "llm.chat", "llm.chat.ttfb"}
+
+
+def test_bound_threads_and_detached_merge(tmp_path):
+    tracer = Tracer(JSONLExporter(str(tmp_path / "turns.jsonl")))
+    speculation = tracer.detached(speculative=True)
+
+    def speculate():
+        with tracer.span("llm.speculative"):
+            pass
+
+    thread = threading.Thread(target=tracer.bind(speculate, speculation))
+    thread.start()
+    thread.join()
+
+    turn = tracer.begin_turn()
+    worker = threading.Thread(target=tracer.bind(lambda: tracer.mark("worker")))
+    worker.start()
+    worker.join()
+    tracer.merge(speculation)
+    record = tracer.end_turn()
+
+    assert record["turn"] == turn.record["turn"]
+    assert "worker" in record["marks"]
+    assert [span["name"] for span in record["spans"]] == ["llm.speculative"]
+    assert record["attrs"] == {"speculative": True}
+    assert speculation.closed
+
+
+def test_disabled_tracer_is_inert():
+    tracer = Tracer()
+
+    assert tracer.begin_turn() is None
+    with tracer.span("llm.chat") as span:
+        span.mark("ttfb")
+    assert tracer.end_turn() is None
@@ -0,0 +1,121 @@
+import queue
+import threading
+from typing import Iterable, Optional
+
+
+class AudioChunkStream:
+    """合成线程与播放线程之间的有界音频块队列，限制每段语音占用的内存"""
+
+    def __init__(self, max_chunks: int = 64):
+        """
+        Args:
+            max_chunks: 队列中最多缓存的音频块数量，写满后合成线程会等待播放
+        """
+        self._queue: "queue.Queue" = queue.Queue(maxsize=max_chunks)
+        self._cancelled = threading.Event()
+
+    def put(self, chunk: bytes):
+        """写入一个音频块，已取消时直接丢弃"""
+        while not self._cancelled.is_set():
+            try:
+                self._queue.put(chunk, timeout=0.5)
+                return
+            except queue.Full:
+                continue
+
+    def close(self, error: Optional[Exception] = None):
+        """
+        标记写入结束
+
+        Args:
+            error: 合成过程中出现的异常，会在播放端迭代时抛出
+        """
+        self.put(error if error is not None else _END_OF_STREAM)
+
+    def cancel(self):
+        """取消：丢弃后续写入，结束迭代"""
+        self._cancelled.set()
+        try:
+            self._queue.put_nowait(_END_OF_STREAM)
+        except queue.Full:
+            pass
+
+    def __iter__(self):
+        while True:
+            item = self._queue.get()
+            if item is _END_OF_STREAM or self._cancelled.is_set():
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+
+
+class StreamingAudioPlayer:
+    """常驻的 PCM 音频输出流，收到音频块后立即播放，不经过临时文件"""
+
+    def __init__(self, sample_rate: int = 24000, channels: int = 1, sample_width: int = 2):
+        """
+        初始化播放器并打开输出流
+
+        Args:
+            sample_rate: 采样率，需与合成时的 sample_rate 一致
+            channels: 声道数
+            sample_width: 每个采样的字节数（16 位 PCM 为 2）
+        """
+        try:
+            import pyaudio
+        except ImportError:
+            raise ImportError("流式播放需要安装 PyAudio: pip install pyaudio")
+
+        self.sample_rate = sample_rate
+        self.channels = channels
+        self.frame_size = channels * sample_width
+        self._audio = pyaudio.PyAudio()
+        try:
+            self._stream = self._audio.open(
+                format=self._audio.get_format_from_width(sample_width),
+                channels=channels,
+                rate=sample_rate,
+                output=True,
+            )
+        except Exception:
+            # 没有可用的输出设备
+            self._audio.terminate()
+            raise
+        self._remainder = b""
+        self._lock = threading.Lock()
+
+    def write(self, chunk: bytes):
+        """
+        写入一段 PCM 数据，网络分块不一定按采样对齐，不完整的采样留到下一块
+
+        Args:
+            chunk: PCM 数据
+        """
+        data = self._remainder + chunk
+        usable = len(data) - len(data) % self.frame_size
+        self._remainder = data[usable:]
+        if usable:
+            self._stream.write(data[:usable])
+
+    def play(self, chunks: Iterable[bytes]):
+        """
+        依次播放音频块，阻塞直到全部写入输出流
+
+        Args:
+            chunks: 音频块的迭代器（如 generate_voice_stream 的返回值或 AudioChunkStream）
+        """
+        with self._lock:
+            for chunk in chunks:
+                self.write(chunk)
+            self._remainder = b""
+
+    def close(self):
+        """关闭输出流"""
+        self._stream.stop_stream()
+        self._stream.close()
+        self._audio.terminate()
+
+
+# 音频流结束标记
+_END_OF_STREAM = object()
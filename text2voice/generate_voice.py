@@ -1,8 +1,22 @@
-import requests
 import os
+import sys
+
+# 将项目根目录添加到Python路径
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 import json
-from typing import Optional, Dict, Any, Union, BinaryIO, Literal
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Dict, Any, Union, BinaryIO, Literal, Iterator, AsyncIterator, List
 import dotenv
+from game_prompt.http_transport import (
+    HTTPTransport,
+    AsyncHTTPTransport,
+    get_default_transport,
+    get_default_async_transport,
+)
+from game_prompt.siliconflow_api import siliconflow_base_url
+from game_prompt.tracing import tracer
+from text2voice.tts_cache import TTSCache
 
 dotenv.load_dotenv()
 
@@ -25,7 +39,9 @@ def generate_voice(
     speed: float = 1.0,
     gain: float = 0.0,
     api_key: Optional[str] = None,
-    output_file: Optional[str] = None
+    output_file: Optional[str] = None,
+    transport: Optional[HTTPTransport] = None,
+    cache: Optional[TTSCache] = None
 ) -> Union[str, BinaryIO]:
     """
     将文本转换为语音
@@ -61,9 +77,175 @@ def generate_voice(
         
         output_file (str, optional): 输出文件路径，如果为None则返回响应内容。
         
+        transport (HTTPTransport, optional): 共享的HTTP传输层，如果为None则使用进程内默认的连接池。
+        
+        cache (TTSCache, optional): 语音缓存，命中时不发送网络请求。
+        
     返回:
         如果output_file为None，返回响应内容；否则返回文件对象。
     """
+    url, payload, headers = _build_tts_request(
+        text, model, voice, response_format, sample_rate, stream, speed, gain, api_key
+    )
+    
+    content = None
+    if cache is not None:
+        cache_key = TTSCache.make_key(payload)
+        content = cache.get(cache_key)
+    
+    if content is None:
+        transport = transport or get_default_transport()
+        with tracer.span("tts.synthesize", chars=len(text)) as span:
+            response = transport.post(url, json=payload, headers=headers)
+            
+            # 检查响应状态
+            if response.status_code != 200:
+                raise Exception(_format_tts_error(response.status_code, response.content))
+            
+            content = response.content
+            span.set(bytes=len(content))
+        if cache is not None:
+            cache.put(cache_key, content)
+    
+    # 如果指定了输出文件，将响应内容写入文件
+    if output_file:
+        with tracer.span("tts.write", bytes=len(content)):
+            with open(output_file, 'wb') as f:
+                f.write(content)
+        return open(output_file, 'rb')
+    
+    # 否则返回响应内容
+    return content
+
+
+def generate_voice_stream(
+    text: str,
+    model: str = "FunAudioLLM/CosyVoice2-0.5B",
+    voice: str = "FunAudioLLM/CosyVoice2-0.5B:alex",
+    response_format: Literal["mp3", "opus", "wav", "pcm"] = "pcm",
+    sample_rate: Optional[int] = 24000,
+    speed: float = 1.0,
+    gain: float = 0.0,
+    api_key: Optional[str] = None,
+    transport: Optional[HTTPTransport] = None,
+    chunk_size: int = 4096,
+    cache: Optional[TTSCache] = None
+) -> Iterator[bytes]:
+    """
+    以流式方式合成语音，边接收边返回音频数据，不缓存完整的响应体
+    
+    参数:
+        text, model, voice, speed, gain, api_key, transport: 与 generate_voice 相同。
+        
+        response_format (str): 输出格式，默认为"pcm"（16位单声道），可直接写入音频输出流。
+        
+        sample_rate (int, optional): 输出采样率，默认为24000 Hz。
+        
+        chunk_size (int): 每次读取的字节数。
+        
+        cache (TTSCache, optional): 语音缓存。命中时直接分块返回缓存内容；未命中时在完整接收后写入缓存。
+        
+    返回:
+        音频数据块的迭代器
+    """
+    url, payload, headers = _build_tts_request(
+        text, model, voice, response_format, sample_rate, True, speed, gain, api_key
+    )
+    
+    if cache is not None:
+        cache_key = TTSCache.make_key(payload)
+        content = cache.get(cache_key)
+        if content is not None:
+            for start in range(0, len(content), chunk_size):
+                yield content[start:start + chunk_size]
+            return
+    
+    received = []
+    transport = transport or get_default_transport()
+    # first_chunk 为收到第一个音频块
+    span = tracer.span("tts.stream", chars=len(text))
+    with span, transport.post(url, json=payload, headers=headers, stream=True) as response:
+        # 检查响应状态
+        if response.status_code != 200:
+            raise Exception(_format_tts_error(response.status_code, response.content))
+        
+        for chunk in response.iter_content(chunk_size):
+            if chunk:
+                span.mark("first_chunk")
+                if cache is not None:
+                    received.append(chunk)
+                yield chunk
+    
+    # 只缓存完整接收的音频
+    if cache is not None:
+        cache.put(cache_key, b"".join(received))
+
+
+def prewarm_voice_cache(
+    cache: TTSCache,
+    lines: List[str],
+    max_workers: int = 4,
+    **voice_options
+) -> int:
+    """
+    预先合成一组固定台词并写入缓存（如默认回复和常见的出错提示），应在启动时调用
+    
+    参数:
+        cache (TTSCache): 语音缓存。
+        
+        lines (List[str]): 要预先合成的完整输入文本（包括情感指令前缀）。
+        
+        max_workers (int): 并发合成的数量。
+        
+        voice_options: 传给 generate_voice 的其他参数（voice、response_format、sample_rate、api_key、transport 等），
+                       需要与实际播放时使用的参数一致才能命中。
+        
+    返回:
+        新合成的台词数量
+    """
+    pending = []
+    for line in lines:
+        url, payload, headers = _build_tts_request(
+            line,
+            voice_options.get("model", "FunAudioLLM/CosyVoice2-0.5B"),
+            voice_options.get("voice", "FunAudioLLM/CosyVoice2-0.5B:alex"),
+            voice_options.get("response_format", "mp3"),
+            voice_options.get("sample_rate"),
+            True,
+            voice_options.get("speed", 1.0),
+            voice_options.get("gain", 0.0),
+            voice_options.get("api_key"),
+        )
+        if not cache.contains(TTSCache.make_key(payload)):
+            pending.append(line)
+    
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = [
+            executor.submit(generate_voice, text=line, cache=cache, **voice_options)
+            for line in pending
+        ]
+        for future in futures:
+            future.result()
+    return len(pending)
+
+
+def _build_tts_request(
+    text: str,
+    model: str,
+    voice: str,
+    response_format: str,
+    sample_rate: Optional[int],
+    stream: bool,
+    speed: float,
+    gain: float,
+    api_key: Optional[str],
+):
+    """
+    验证参数并构造语音合成请求，同步和异步接口共用
+
+    返回:
+        (url, payload, headers)
+    """
     # 参数验证
     if not 1 <= len(text) <= 128000:
         raise ValueError("文本长度必须在1-128000字符之间")
@@ -91,7 +273,7 @@ def generate_voice(
     elif response_format == "mp3" and sample_rate not in [32000, 44100]:
         raise ValueError("mp3格式仅支持32000, 44100 Hz采样率")
     
-    url = "https://api.siliconflow.cn/v1/audio/speech"
+    url = f"{siliconflow_base_url()}/audio/speech"
     
     # 如果没有提供API密钥，尝试从环境变量获取
     if api_key is None:
@@ -115,26 +297,126 @@ def generate_voice(
         "Content-Type": "application/json"
     }
     
-    response = requests.post(url, json=payload, headers=headers)
+    return url, payload, headers
+
+
+def _format_tts_error(status_code: int, content: bytes) -> str:
+    """根据错误响应构造异常信息"""
+    error_message = f"API请求失败，状态码: {status_code}"
+    try:
+        error_details = json.loads(content)
+        error_message += f", 详情: {json.dumps(error_details, ensure_ascii=False)}"
+    except:
+        error_message += f", 响应内容: {content.decode('utf-8', errors='replace')}"
+    return error_message
+
+
+async def generate_voice_async(
+    text: str,
+    model: str = "FunAudioLLM/CosyVoice2-0.5B",
+    voice: str = "FunAudioLLM/CosyVoice2-0.5B:alex",
+    response_format: Literal["mp3", "opus", "wav", "pcm"] = "mp3",
+    sample_rate: Optional[int] = None,
+    stream: bool = True,
+    speed: float = 1.0,
+    gain: float = 0.0,
+    api_key: Optional[str] = None,
+    output_file: Optional[str] = None,
+    transport: Optional[AsyncHTTPTransport] = None,
+    cache: Optional[TTSCache] = None
+) -> Union[bytes, BinaryIO]:
+    """
+    generate_voice 的异步版本，参数和返回值与 generate_voice 相同
+    
+    参数:
+        transport (AsyncHTTPTransport, optional): 异步HTTP传输层，如果为None则使用默认的异步连接池。
+        
+        cache (TTSCache, optional): 语音缓存，命中时不发送网络请求。
+    """
+    url, payload, headers = _build_tts_request(
+        text, model, voice, response_format, sample_rate, stream, speed, gain, api_key
+    )
+    
+    content = None
+    if cache is not None:
+        cache_key = TTSCache.make_key(payload)
+        content = await asyncio.to_thread(cache.get, cache_key)
     
-    # 检查响应状态
-    if response.status_code != 200:
-        error_message = f"API请求失败，状态码: {response.status_code}"
-        try:
-            error_details = response.json()
-            error_message += f", 详情: {json.dumps(error_details, ensure_ascii=False)}"
-        except:
-            error_message += f", 响应内容: {response.text}"
-        raise Exception(error_message)
+    if content is None:
+        transport = transport or get_default_async_transport()
+        response = await transport.post(url, json=payload, headers=headers)
+        content = await response.read()
+        
+        # 检查响应状态
+        if response.status_code != 200:
+            raise Exception(_format_tts_error(response.status_code, content))
+        
+        if cache is not None:
+            await asyncio.to_thread(cache.put, cache_key, content)
     
-    # 如果指定了输出文件，将响应内容写入文件
+    # 如果指定了输出文件，在线程池中写文件，避免阻塞事件循环
     if output_file:
-        with open(output_file, 'wb') as f:
-            f.write(response.content)
+        await asyncio.to_thread(_write_file, output_file, content)
         return open(output_file, 'rb')
     
-    # 否则返回响应内容
-    return response.content
+    return content
+
+
+async def generate_voice_stream_async(
+    text: str,
+    model: str = "FunAudioLLM/CosyVoice2-0.5B",
+    voice: str = "FunAudioLLM/CosyVoice2-0.5B:alex",
+    response_format: Literal["mp3", "opus", "wav", "pcm"] = "pcm",
+    sample_rate: Optional[int] = 24000,
+    speed: float = 1.0,
+    gain: float = 0.0,
+    api_key: Optional[str] = None,
+    transport: Optional[AsyncHTTPTransport] = None,
+    chunk_size: int = 4096,
+    cache: Optional[TTSCache] = None
+) -> AsyncIterator[bytes]:
+    """
+    generate_voice_stream 的异步版本，参数和返回值与 generate_voice_stream 相同
+    
+    参数:
+        transport (AsyncHTTPTransport, optional): 异步HTTP传输层，如果为None则使用默认的异步连接池。
+    """
+    url, payload, headers = _build_tts_request(
+        text, model, voice, response_format, sample_rate, True, speed, gain, api_key
+    )
+    
+    if cache is not None:
+        cache_key = TTSCache.make_key(payload)
+        content = await asyncio.to_thread(cache.get, cache_key)
+        if content is not None:
+            for start in range(0, len(content), chunk_size):
+                yield content[start:start + chunk_size]
+            return
+    
+    received = []
+    transport = transport or get_default_async_transport()
+    span = tracer.span("tts.stream", chars=len(text))
+    with span:
+        async with await transport.post(url, json=payload, headers=headers, stream=True) as response:
+            # 检查响应状态
+            if response.status_code != 200:
+                raise Exception(_format_tts_error(response.status_code, await response.read()))
+            
+            async for chunk in response.iter_content(chunk_size):
+                if chunk:
+                    span.mark("first_chunk")
+                    if cache is not None:
+                        received.append(chunk)
+                    yield chunk
+    
+    # 只缓存完整接收的音频
+    if cache is not None:
+        await asyncio.to_thread(cache.put, cache_key, b"".join(received))
+
+
+def _write_file(path: str, content: bytes):
+    with open(path, 'wb') as f:
+        f.write(content)
 
 # 使用示例
 if __name__ == "__main__":
@@ -0,0 +1,199 @@
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+# 参与缓存键计算的请求字段，任何一个不同都会得到不同的音频
+CACHE_KEY_FIELDS = ("model", "voice", "input", "speed", "gain", "response_format", "sample_rate")
+# 写入中的临时文件后缀，不计入缓存大小，也不参与淘汰
+TEMP_SUFFIX = ".tmp"
+
+
+class TTSCache:
+    """
+    按内容寻址的语音合成缓存：内存层和限制总大小的磁盘层，均按最近最少使用（LRU）淘汰。
+    命中时完全跳过网络请求
+    """
+
+    def __init__(
+        self,
+        cache_dir: Optional[str] = None,
+        max_memory_bytes: int = 16 * 1024 * 1024,
+        max_disk_bytes: int = 256 * 1024 * 1024,
+    ):
+        """
+        初始化缓存
+
+        Args:
+            cache_dir: 磁盘缓存目录，为 None 时只使用内存缓存
+            max_memory_bytes: 内存缓存的最大字节数
+            max_disk_bytes: 磁盘缓存的最大字节数
+        """
+        self.cache_dir = cache_dir
+        self.max_memory_bytes = max_memory_bytes
+        self.max_disk_bytes = max_disk_bytes
+        self.hits = 0
+        self.misses = 0
+        self._memory: "OrderedDict[str, bytes]" = OrderedDict()
+        self._memory_bytes = 0
+        self._disk_bytes = 0
+        self._lock = threading.Lock()
+
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+            self._disk_bytes = sum(entry.stat().st_size for entry in self._disk_entries())
+
+    @staticmethod
+    def make_key(payload: Dict[str, Any]) -> str:
+        """
+        根据请求参数计算缓存键
+
+        Args:
+            payload: 语音合成请求体（sample_rate 等默认值已经填充）
+
+        Returns:
+            缓存键（SHA-256 十六进制字符串）
+        """
+        fields = {name: payload.get(name) for name in CACHE_KEY_FIELDS}
+        encoded = json.dumps(fields, ensure_ascii=False, sort_keys=True).encode("utf-8")
+        return hashlib.sha256(encoded).hexdigest()
+
+    def get(self, key: str) -> Optional[bytes]:
+        """
+        查询缓存，先查内存，再查磁盘；磁盘命中会提升到内存
+
+        Args:
+            key: 缓存键
+
+        Returns:
+            音频数据，未命中时返回 None
+        """
+        with self._lock:
+            data = self._memory.get(key)
+            if data is not None:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                return data
+
+        data = self._read_disk(key)
+        with self._lock:
+            if data is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._put_memory(key, data)
+        return data
+
+    def put(self, key: str, data: bytes):
+        """
+        写入缓存
+
+        Args:
+            key: 缓存键
+            data: 音频数据
+        """
+        with self._lock:
+            self._put_memory(key, data)
+        self._write_disk(key, data)
+
+    def contains(self, key: str) -> bool:
+        """判断是否已缓存（不更新命中统计和 LRU 顺序）"""
+        with self._lock:
+            if key in self._memory:
+                return True
+        return self.cache_dir is not None and os.path.exists(self._disk_path(key))
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        获取缓存统计
+
+        Returns:
+            命中次数、未命中次数、命中率以及两层缓存的占用字节数
+        """
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / total if total else 0.0,
+            "memory_bytes": self._memory_bytes,
+            "disk_bytes": self._disk_bytes,
+        }
+
+    def _put_memory(self, key: str, data: bytes):
+        """写入内存层并按 LRU 淘汰，调用方需持有锁"""
+        if len(data) > self.max_memory_bytes:
+            return
+        previous = self._memory.pop(key, None)
+        if previous is not None:
+            self._memory_bytes -= len(previous)
+        self._memory[key] = data
+        self._memory_bytes += len(data)
+        while self._memory_bytes > self.max_memory_bytes:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_bytes -= len(evicted)
+
+    def _disk_path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key)
+
+    def _disk_entries(self):
+        """磁盘层的缓存文件，不包括写入中的临时文件"""
+        return [
+            entry for entry in os.scandir(self.cache_dir)
+            if entry.is_file() and not entry.name.endswith(TEMP_SUFFIX)
+        ]
+
+    def _read_disk(self, key: str) -> Optional[bytes]:
+        if not self.cache_dir:
+            return None
+        path = self._disk_path(key)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+            # 更新修改时间，作为磁盘层的 LRU 顺序
+            os.utime(path)
+            return data
+        except OSError:
+            return None
+
+    def _write_disk(self, key: str, data: bytes):
+        if not self.cache_dir or len(data) > self.max_disk_bytes:
+            return
+        path = self._disk_path(key)
+        if os.path.exists(path):
+            return
+        # 先写临时文件再改名，避免并发读取到不完整的文件；每次写入使用唯一的临时文件，
+        # 多个线程或进程同时写入同一个键时不会互相覆盖
+        with tempfile.NamedTemporaryFile(
+            dir=self.cache_dir, prefix=f"{key}.", suffix=TEMP_SUFFIX, delete=False
+        ) as f:
+            temp_path = f.name
+            try:
+                f.write(data)
+            except BaseException:
+                f.close()
+                os.remove(temp_path)
+                raise
+        with self._lock:
+            # 同一个键被并发写入时只计入一次
+            existed = os.path.exists(path)
+            os.replace(temp_path, path)
+            if not existed:
+                self._disk_bytes += len(data)
+            if self._disk_bytes > self.max_disk_bytes:
+                self._evict_disk()
+
+    def _evict_disk(self):
+        """按修改时间淘汰最久未使用的文件，直到低于上限，调用方需持有锁"""
+        entries = sorted(self._disk_entries(), key=lambda entry: entry.stat().st_mtime)
+        for entry in entries:
+            if self._disk_bytes <= self.max_disk_bytes:
+                break
+            try:
+                size = entry.stat().st_size
+                os.remove(entry.path)
+                self._disk_bytes -= size
+            except OSError:
+                continue
@@ -0,0 +1,340 @@
+import os
+import sys
+
+# 将项目根目录添加到Python路径
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import itertools
+import queue
+import re
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, List, Optional
+
+from text2voice.generate_voice import generate_voice, generate_voice_stream
+from text2voice.audio_player import AudioChunkStream
+from game_prompt.tracing import tracer
+
+# 句子结束标记：中文句末/句中标点、英文标点，以及提示词中常见的 "..." 和 "…" 停顿
+_SENTENCE_END = re.compile(r"(\.{2,}|…+|[。！？；，、!?;,~～])")
+
+DEFAULT_VOICE = "FunAudioLLM/CosyVoice2-0.5B:alex"
+DEFAULT_EMOTION_PROMPT = "用非常紧张的情绪 说: <|endofprompt|>"
+
+
+def split_sentences(text: str, min_chars: int = 6) -> List[str]:
+    """
+    按中文标点和 "..." 停顿切分文本，过短的片段会与后一段合并，避免产生大量很短的合成请求
+
+    Args:
+        text: 要切分的文本
+        min_chars: 每段的最少字符数
+
+    Returns:
+        切分后的片段列表，拼接后与原文一致
+    """
+    splitter = SentenceSplitter(min_chars)
+    sentences = splitter.feed(text)
+    sentences.extend(splitter.flush())
+    return sentences
+
+
+class SentenceSplitter:
+    """增量切分器，可直接接收流式生成的 "speak" 文本"""
+
+    def __init__(self, min_chars: int = 6):
+        """
+        Args:
+            min_chars: 每段的最少字符数
+        """
+        self.min_chars = min_chars
+        self._buffer = ""
+
+    def feed(self, text: str) -> List[str]:
+        """
+        输入新增文本
+
+        Args:
+            text: 新增文本
+
+        Returns:
+            已经完整的片段
+        """
+        self._buffer += text
+        sentences = []
+        start = 0
+        for match in _SENTENCE_END.finditer(self._buffer):
+            end = match.end()
+            # 停顿标记可能还没有生成完（如 ".." 后面还会有 "."），留到下次再判断
+            if end == len(self._buffer) and match.group(0)[0] in ".…":
+                break
+            if len(self._buffer[start:end].strip()) >= self.min_chars:
+                sentences.append(self._buffer[start:end])
+                start = end
+        self._buffer = self._buffer[start:]
+        return sentences
+
+    def flush(self) -> List[str]:
+        """
+        取出剩余的文本
+
+        Returns:
+            剩余的片段（没有剩余内容时为空列表）
+        """
+        rest, self._buffer = self._buffer, ""
+        return [rest] if rest.strip() else []
+
+
+class SpeechPipeline:
+    """
+    句子级语音流水线：片段一完整就提交到有界线程池并发合成，播放线程按顺序依次播放，
+    首段音频只需等待一个短句合成完成
+    """
+
+    def __init__(
+        self,
+        synthesize: Callable[[str], Any],
+        play: Callable[[Any], None],
+        max_workers: int = 3,
+        min_chars: int = 6,
+        executor: Optional[ThreadPoolExecutor] = None,
+        on_error: Optional[Callable[[Exception], None]] = None,
+        streaming: bool = False,
+        max_buffered_chunks: int = 64,
+        discard: Optional[Callable[[Any], None]] = None,
+    ):
+        """
+        初始化流水线
+
+        Args:
+            synthesize: 合成函数。非流式模式下参数为一段文本，返回可交给 play 播放的对象（如音频文件路径）；
+                        流式模式下参数为文本和写入函数，每收到一个音频块就调用写入函数
+            play: 播放函数，阻塞直到播放结束；流式模式下参数为音频块的迭代器
+            max_workers: 同时进行的合成请求数量
+            min_chars: 每段的最少字符数
+            executor: 共享的线程池，为 None 时由流水线自行创建
+            on_error: 合成或播放出错时的回调，默认打印错误
+            streaming: 是否流式播放，开启后每段语音的第一个音频块到达即开始播放
+            max_buffered_chunks: 流式模式下每段语音最多缓存的音频块数量
+            discard: 非流式模式下取消后丢弃已合成、不再播放的结果（如 remove_audio_file 删除临时文件）
+        """
+        self.synthesize = synthesize
+        self.play = play
+        self.streaming = streaming
+        self.max_buffered_chunks = max_buffered_chunks
+        self.discard = discard
+        self.splitter = SentenceSplitter(min_chars)
+        self.on_error = on_error or (lambda e: print(f"生成或播放语音时出错: {e}"))
+        self._own_executor = executor is None
+        self._executor = executor or ThreadPoolExecutor(max_workers=max_workers)
+        self._queue: "queue.Queue[Optional[Future]]" = queue.Queue()
+        self._player: Optional[threading.Thread] = None
+        self._finished = False
+        self._cancelled = threading.Event()
+        # feed 可能在其他线程（如推测执行）中调用，合成和播放的记录归入创建流水线时所在的轮次
+        self._trace = tracer.current()
+
+    def feed(self, text: str):
+        """
+        输入新增的文本，完整的片段立即提交合成
+
+        Args:
+            text: 新增文本
+        """
+        for sentence in self.splitter.feed(text):
+            self._submit(sentence)
+
+    def finish(self):
+        """输入结束，提交剩余文本"""
+        if self._finished:
+            return
+        for sentence in self.splitter.flush():
+            self._submit(sentence)
+        self._finished = True
+        self._queue.put(None)
+
+    def speak(self, text: str):
+        """
+        一次性输入完整文本并等待播放结束
+
+        Args:
+            text: 要播放的文本
+        """
+        self.feed(text)
+        self.finish()
+        self.wait()
+
+    def wait(self):
+        """等待所有片段播放完毕"""
+        self.finish()
+        if self._player is not None:
+            self._player.join()
+        if self._own_executor:
+            self._executor.shutdown(wait=False)
+
+    def cancel(self):
+        """停止播放后续片段，尚未凑成完整片段的文本直接丢弃，不再提交合成"""
+        self._cancelled.set()
+        self.splitter.flush()
+        if not self._finished:
+            self._finished = True
+            self._queue.put(None)
+
+    def _submit(self, sentence: str):
+        if self.streaming:
+            stream = AudioChunkStream(self.max_buffered_chunks)
+            self._executor.submit(tracer.bind(self._synthesize_into, self._trace), sentence, stream)
+            self._queue.put(stream)
+        else:
+            self._queue.put(self._executor.submit(tracer.bind(self.synthesize, self._trace), sentence))
+        if self._player is None:
+            self._player = threading.Thread(target=tracer.bind(self._play_loop, self._trace), daemon=True)
+            self._player.start()
+
+    def _drop(self, item):
+        """丢弃不再播放的片段：未开始的合成直接取消，已经（或稍后）合成完的结果交给 discard"""
+        if self.streaming:
+            item.cancel()
+            return
+        if item.cancel() or self.discard is None:
+            return
+
+        def discard(future: Future):
+            if not future.cancelled() and future.exception() is None:
+                try:
+                    self.discard(future.result())
+                except Exception as e:
+                    self.on_error(e)
+
+        item.add_done_callback(discard)
+
+    def _synthesize_into(self, sentence: str, stream: AudioChunkStream):
+        """流式模式下在线程池中合成，音频块写入有界队列"""
+        try:
+            self.synthesize(sentence, stream.put)
+            stream.close()
+        except Exception as e:
+            stream.close(e)
+
+    def _play_loop(self):
+        """按提交顺序播放合成结果"""
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            if self._cancelled.is_set():
+                self._drop(item)
+                continue
+            try:
+                audio = item if self.streaming else item.result()
+                # 流式播放时包含等待后续音频块的时间
+                with tracer.span("playback", streaming=self.streaming):
+                    self.play(audio)
+            except Exception as e:
+                self.on_error(e)
+
+
+def make_file_synthesizer(
+    output_dir: str,
+    api_key: Optional[str] = None,
+    voice: str = DEFAULT_VOICE,
+    emotion_prompt: str = DEFAULT_EMOTION_PROMPT,
+    transport=None,
+    prefix: str = "doctor_speech",
+    cache=None,
+) -> Callable[[str], str]:
+    """
+    创建将片段合成为临时音频文件的合成函数
+
+    Args:
+        output_dir: 临时文件目录
+        api_key: SiliconFlow API 密钥
+        voice: 使用的语音
+        emotion_prompt: 添加在每个片段前的情感指令
+        transport: 共享的 HTTP 传输层
+        prefix: 临时文件名前缀
+        cache: 语音缓存（TTSCache），命中时不发送网络请求
+
+    Returns:
+        合成函数，返回音频文件路径
+    """
+    counter = itertools.count()
+
+    def synthesize(text: str) -> str:
+        output_file = os.path.join(output_dir, f"{prefix}_{next(counter)}.mp3")
+        generate_voice(
+            text=f"{emotion_prompt}{text}",
+            voice=voice,
+            api_key=api_key,
+            output_file=output_file,
+            transport=transport,
+            cache=cache,
+        ).close()
+        return output_file
+
+    return synthesize
+
+
+def make_stream_synthesizer(
+    api_key: Optional[str] = None,
+    voice: str = DEFAULT_VOICE,
+    emotion_prompt: str = DEFAULT_EMOTION_PROMPT,
+    transport=None,
+    sample_rate: int = 24000,
+    cache=None,
+) -> Callable[[str, Callable[[bytes], None]], None]:
+    """
+    创建流式合成函数，用于 SpeechPipeline(streaming=True)
+
+    Args:
+        api_key: SiliconFlow API 密钥
+        voice: 使用的语音
+        emotion_prompt: 添加在每个片段前的情感指令
+        transport: 共享的 HTTP 传输层
+        sample_rate: PCM 采样率，需与播放器一致
+        cache: 语音缓存（TTSCache），命中时不发送网络请求
+
+    Returns:
+        合成函数，参数为文本和音频块写入函数
+    """
+
+    def synthesize(text: str, write: Callable[[bytes], None]):
+        for chunk in generate_voice_stream(
+            text=f"{emotion_prompt}{text}",
+            voice=voice,
+            response_format="pcm",
+            sample_rate=sample_rate,
+            api_key=api_key,
+            transport=transport,
+            cache=cache,
+        ):
+            write(chunk)
+
+    return synthesize
+
+
+def play_and_remove(audio_file: str):
+    """
+    播放音频文件，播放后删除
+
+    Args:
+        audio_file: 音频文件路径
+    """
+    from playsound import playsound
+
+    try:
+        playsound(audio_file)
+    finally:
+        remove_audio_file(audio_file)
+
+
+def remove_audio_file(audio_file: str):
+    """
+    删除临时音频文件（如取消后不再播放的片段），用作 SpeechPipeline 的 discard
+
+    Args:
+        audio_file: 音频文件路径
+    """
+    try:
+        os.remove(audio_file)
+    except OSError as e:
+        print(f"删除临时音频文件时出错: {e}")
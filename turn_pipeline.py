@@ -0,0 +1,193 @@
+import queue
+import time
+from typing import Any, Callable, Dict, Optional
+
+from game_prompt.fast_path import SOURCE_LLM
+from game_prompt.tracing import tracer
+from text2voice.tts_pipeline import SpeechPipeline
+
+# 各阶段的名称，按一轮对话中出现的先后顺序排列
+STAGE_INPUT = "input"  # 收到玩家输入（语音识别的句子结束）
+STAGE_LLM_REQUEST = "llm_request"  # 发出对话请求
+STAGE_FIRST_DELTA = "llm_first_delta"  # 收到第一段医生说的话
+STAGE_SPEAK_DONE = "speak_done"  # "speak" 字段生成完毕，剩余文本已提交合成
+STAGE_LLM_DONE = "llm_done"  # 完整响应已解析
+STAGE_PLAYBACK_START = "playback_start"  # 开始播放第一段语音
+STAGE_PLAYBACK_DONE = "playback_done"  # 语音全部播放完毕，本轮结束
+
+
+class TurnPipeline:
+    """
+    事件驱动的对话轮次：语音识别线程把句子放入阻塞队列，主线程被立即唤醒并发出对话请求，
+    医生说的话边生成边交给 SpeechPipeline 合成和播放。各阶段之间通过队列和回调交接，不轮询、不休眠
+    """
+
+    def __init__(
+        self,
+        agent,
+        synthesize: Callable,
+        play: Callable,
+        executor=None,
+        streaming: bool = False,
+        on_stage: Optional[Callable[[str, int, float], None]] = None,
+        speculator=None,
+        fast_path=None,
+        discard: Optional[Callable] = None,
+    ):
+        """
+        初始化流水线
+
+        Args:
+            agent: 游戏代理（GameAgent）
+            synthesize: 语音合成函数，见 SpeechPipeline
+            play: 播放函数，见 SpeechPipeline
+            executor: 语音合成共用的线程池
+            streaming: 是否流式播放
+            on_stage: 每个阶段开始时调用的钩子，参数为阶段名称、轮次编号和距收到输入经过的秒数
+            speculator: 推测执行（SpeculativeTurns），设置后由它处理输入，可能直接采用提前发起的请求
+            fast_path: 本地快速通道（FastPath），设置后先由规则和缓存尝试直接给出响应
+            discard: 丢弃取消后不再播放的合成结果，见 SpeechPipeline
+        """
+        self.agent = agent
+        self.synthesize = synthesize
+        self.play = play
+        self.executor = executor
+        self.streaming = streaming
+        self.on_stage = on_stage
+        self.speculator = speculator
+        self.fast_path = fast_path
+        self.discard = discard
+        self.turn = 0
+        self._inputs: "queue.Queue[Optional[str]]" = queue.Queue()
+        self._started_at = time.perf_counter()
+        # 推测执行命中时回调在推测线程中执行，阶段直接记入本轮的记录
+        self._trace = None
+
+    def submit(self, text: str):
+        """
+        提交玩家输入，可在任意线程（如语音识别回调）中调用
+
+        Args:
+            text: 玩家输入
+        """
+        self._inputs.put(text)
+
+    def close(self):
+        """结束输入，正在等待的 next_input 返回 None"""
+        self._inputs.put(None)
+
+    def next_input(self) -> Optional[str]:
+        """
+        阻塞等待下一条玩家输入
+
+        Returns:
+            玩家输入，调用 close 后返回 None
+        """
+        text = self._inputs.get()
+        if text is not None:
+            self.turn += 1
+            self._started_at = time.perf_counter()
+            self._trace = tracer.begin_turn(input_chars=len(text))
+            self._emit(STAGE_INPUT)
+        return text
+
+    def run_turn(
+        self,
+        user_input: str,
+        on_response: Optional[Callable[[Dict[str, Any]], None]] = None,
+    ) -> Dict[str, Any]:
+        """
+        处理一轮对话：流式请求、按句合成播放，等待播放结束后返回
+
+        Args:
+            user_input: 玩家输入
+            on_response: 完整响应解析后、等待播放结束前调用，用于处理动作和心情等
+
+        Returns:
+            游戏响应
+        """
+        first_audio = True
+
+        def play(item):
+            nonlocal first_audio
+            if first_audio:
+                first_audio = False
+                self._emit(STAGE_PLAYBACK_START)
+            self.play(item)
+
+        speech = SpeechPipeline(
+            self.synthesize, play, executor=self.executor, streaming=self.streaming, discard=self.discard
+        )
+        speak_started = False
+        speak_done = False
+
+        def on_speak_delta(text):
+            nonlocal speak_started
+            if not speak_started:
+                self._emit(STAGE_FIRST_DELTA)
+                print("医生: ", end="", flush=True)
+                speak_started = True
+            print(text, end="", flush=True)
+            speech.feed(text)
+
+        def on_field(key, value):
+            nonlocal speak_done
+            if key == "speak":
+                print()
+                speak_done = True
+                speech.finish()
+                self._emit(STAGE_SPEAK_DONE)
+
+        def on_retract():
+            nonlocal speech, speak_started, speak_done
+            # 返回不合格被替换：停止播放已收到的台词（当前句播完），随后按最终响应重新播放
+            speech.cancel()
+            speech.wait()
+            if speak_started and not speak_done:
+                print()
+            print("（回复不符合格式，已重新生成）")
+            speech = SpeechPipeline(
+                self.synthesize, play, executor=self.executor, streaming=self.streaming,
+                discard=self.discard,
+            )
+            speak_started = speak_done = False
+
+        self._emit(STAGE_LLM_REQUEST)
+        process = self.speculator.run if self.speculator is not None else self.agent.process_user_input_stream
+        if self.fast_path is not None:
+            response = self.fast_path.run(
+                user_input, on_speak_delta=on_speak_delta, on_field=on_field, process=process,
+                on_retract=on_retract,
+            )
+            # 本地给出了响应，提前发起的推测请求不再需要
+            if self.fast_path.last_source != SOURCE_LLM and self.speculator is not None:
+                self.speculator.discard()
+        else:
+            response = process(user_input, on_speak_delta=on_speak_delta, on_field=on_field, on_retract=on_retract)
+        self._emit(STAGE_LLM_DONE)
+
+        # 流式解析未能读到完整的 "speak" 字段时（如返回了默认响应），按完整响应播放
+        if not speak_done and "speak" in response:
+            doctor_speech = response["speak"]
+            if speak_started:
+                print()
+            print(f"医生: {doctor_speech}")
+            speech.feed(doctor_speech)
+        speech.finish()
+
+        if on_response is not None:
+            on_response(response)
+
+        # 等待语音播放结束后再接收下一条输入
+        speech.wait()
+        self._emit(STAGE_PLAYBACK_DONE)
+        if self.fast_path is not None:
+            tracer.annotate(source=self.fast_path.last_source)
+        tracer.end_turn()
+        return response
+
+    def _emit(self, stage: str):
+        if self._trace is not None:
+            self._trace.mark(stage)
+        if self.on_stage is not None:
+            self.on_stage(stage, self.turn, time.perf_counter() - self._started_at)
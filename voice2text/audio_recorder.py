@@ -1,11 +1,17 @@
 import os
 import signal  # for keyboard events handling (press "Ctrl+C" to terminate recording and translation)
 import sys
+import threading
+import time
 
 import dashscope
 import pyaudio
 from dashscope.audio.asr import *
 
+# 将项目根目录添加到Python路径
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from voice2text.vad import EnergyVAD
+
 mic = None
 stream = None
 
@@ -32,12 +38,14 @@ def init_dashscope_api_key():
 
 # Real-time speech recognition callback
 class Callback(RecognitionCallback):
-    def __init__(self, on_sentence_end_callback=None):
+    def __init__(self, on_sentence_end_callback=None, on_partial_callback=None):
         """
         初始化回调类
         :param on_sentence_end_callback: 当句子结束时调用的回调函数，接收识别文本作为参数
+        :param on_partial_callback: 收到句子的中间识别结果时调用的回调函数，接收识别文本作为参数
         """
         self.on_sentence_end_callback = on_sentence_end_callback
+        self.on_partial_callback = on_partial_callback
         super().__init__()
 
     def on_open(self) -> None:
@@ -85,6 +93,8 @@ class Callback(RecognitionCallback):
                 # 如果设置了回调函数，则调用它
                 if self.on_sentence_end_callback:
                     self.on_sentence_end_callback(sentence['text'])
+            elif self.on_partial_callback:
+                self.on_partial_callback(sentence['text'])
 
 
 def signal_handler(sig, frame):
@@ -104,6 +114,188 @@ def signal_handler(sig, frame):
     sys.exit(0)
 
 
+class SessionCallback(Callback):
+    """常驻会话使用的回调：麦克风由 VoiceSession 管理，连接关闭或出错时只通知会话，由会话按需重建连接"""
+
+    def __init__(self, session, on_sentence_end_callback=None, on_partial_callback=None):
+        """
+        :param session: 所属的 VoiceSession
+        :param on_sentence_end_callback: 当句子结束时调用的回调函数，接收识别文本作为参数
+        :param on_partial_callback: 收到句子的中间识别结果时调用的回调函数，接收识别文本作为参数
+        """
+        super().__init__(on_sentence_end_callback, on_partial_callback)
+        self.session = session
+
+    def on_open(self) -> None:
+        print('RecognitionCallback open.')
+
+    def on_close(self) -> None:
+        print('RecognitionCallback close.')
+        self.session._recognition_closed()
+
+    def on_error(self, message) -> None:
+        print('RecognitionCallback task_id: ', message.request_id)
+        print('RecognitionCallback error: ', message.message)
+        self.session._recognition_closed()
+
+
+class VoiceSession:
+    """
+    常驻的语音识别会话：整个游戏只打开一次麦克风输入流、建立一个识别连接，
+    由本地语音活动检测决定哪些音频块发送给识别服务，静音不再上传
+    """
+
+    def __init__(self, on_sentence_end_callback=None, vad=None,
+                 model='paraformer-realtime-v2', keepalive_interval=15.0, on_partial_callback=None,
+                 capture=True):
+        """
+        初始化会话
+        :param on_sentence_end_callback: 当句子结束时调用的回调函数，接收识别文本作为参数
+        :param vad: 语音活动检测器，默认使用 EnergyVAD
+        :param model: 识别模型
+        :param keepalive_interval: 长时间没有语音时，每隔多少秒发送一个静音块，避免服务端因空闲断开连接；为 None 时不发送
+        :param on_partial_callback: 收到句子的中间识别结果时调用的回调函数，接收识别文本作为参数
+        :param capture: 是否从本机麦克风采集；为 False 时由调用方通过 feed 输入音频（如服务端收到的客户端音频）
+        """
+        self.on_sentence_end_callback = on_sentence_end_callback
+        self.on_partial_callback = on_partial_callback
+        self.capture = capture
+        self.vad = vad or EnergyVAD()
+        self.model = model
+        self.keepalive_interval = keepalive_interval
+        self.reconnects = 0
+        self._mic = None
+        self._stream = None
+        self._recognition = None
+        self._lock = threading.Lock()
+        self._listening = threading.Event()
+        self._running = False
+        self._thread = None
+        self._last_sent = time.monotonic()
+
+    def start(self):
+        """打开麦克风并开始采集，识别连接在第一次需要发送音频时建立"""
+        if self._running:
+            return
+        init_dashscope_api_key()
+        self._running = True
+        self._listening.set()
+        if not self.capture:
+            return
+        self._mic = pyaudio.PyAudio()
+        self._stream = self._mic.open(format=pyaudio.paInt16,
+                                      channels=channels,
+                                      rate=sample_rate,
+                                      input=True,
+                                      frames_per_buffer=block_size)
+        self._thread = threading.Thread(target=self._capture_loop, daemon=True)
+        self._thread.start()
+
+    def pause(self):
+        """暂停发送音频（如医生说话时），麦克风继续读取并丢弃数据，恢复时不会收到积压的旧音频"""
+        self._listening.clear()
+
+    def resume(self):
+        """恢复发送音频"""
+        self.vad.reset()
+        self._listening.set()
+
+    def stop(self):
+        """停止采集，关闭识别连接和麦克风"""
+        self._running = False
+        if self._thread is not None:
+            self._thread.join(timeout=1.0)
+            self._thread = None
+        with self._lock:
+            recognition, self._recognition = self._recognition, None
+        if recognition is not None:
+            try:
+                recognition.stop()
+            except Exception as e:
+                print(f"停止语音识别时出错: {e}")
+        if self._stream is not None:
+            self._stream.stop_stream()
+            self._stream.close()
+            self._mic.terminate()
+            self._stream = None
+            self._mic = None
+
+    def stats(self):
+        """
+        获取会话统计
+        :return: 发送和丢弃的音频块数量，以及重建连接的次数
+        """
+        return {
+            "sent_blocks": self.vad.sent_blocks,
+            "dropped_blocks": self.vad.dropped_blocks,
+            "reconnects": self.reconnects,
+        }
+
+    def feed(self, data):
+        """
+        输入一个音频块（16kHz 16 位单声道 PCM），经过语音活动检测后发送；暂停时直接丢弃
+        :param data: PCM 数据
+        """
+        if not self._running or not self._listening.is_set():
+            return
+        frames = self.vad.process(data)
+        if not frames and self._keepalive_due():
+            frames = [bytes(len(data))]
+        for frame in frames:
+            self._send(frame)
+
+    def _capture_loop(self):
+        """采集线程：读取音频块，经过语音活动检测后发送"""
+        while self._running:
+            try:
+                data = self._stream.read(block_size, exception_on_overflow=False)
+            except Exception as e:
+                print(f"音频处理错误: {e}")
+                break
+            self.feed(data)
+
+    def _keepalive_due(self):
+        return (self.keepalive_interval is not None and self._recognition is not None
+                and time.monotonic() - self._last_sent >= self.keepalive_interval)
+
+    def _send(self, frame):
+        """发送一个音频块；连接已关闭时重新建立连接后重发一次"""
+        for attempt in range(2):
+            recognition = self._ensure_recognition()
+            try:
+                recognition.send_audio_frame(frame)
+                self._last_sent = time.monotonic()
+                return
+            except Exception as e:
+                if attempt:
+                    print(f"发送音频数据时出错: {e}")
+                self._recognition_closed(recognition)
+
+    def _ensure_recognition(self):
+        """获取识别连接，不存在时建立"""
+        with self._lock:
+            if self._recognition is None:
+                recognition = Recognition(
+                    model=self.model,
+                    format=format_pcm,
+                    sample_rate=sample_rate,
+                    semantic_punctuation_enabled=False,
+                    callback=SessionCallback(self, self.on_sentence_end_callback, self.on_partial_callback))
+                recognition.start()
+                self._recognition = recognition
+                self._last_sent = time.monotonic()
+            return self._recognition
+
+    def _recognition_closed(self, recognition=None):
+        """识别连接已关闭，下次发送音频时重新建立"""
+        with self._lock:
+            if self._recognition is None or (recognition is not None and recognition is not self._recognition):
+                return
+            self._recognition = None
+            if self._running:
+                self.reconnects += 1
+
+
 # 启动语音识别的函数
 def start_voice_recognition(on_sentence_end_callback=None):
     """
@@ -0,0 +1,93 @@
+from collections import deque
+from typing import List
+
+import numpy as np
+
+
+class EnergyVAD:
+    """
+    基于能量的语音活动检测：根据每个音频块的 RMS 与自适应噪声底的比值判断是否有人说话，
+    只把说话片段（含前后缓冲）交给识别服务
+    """
+
+    def __init__(
+        self,
+        threshold_ratio: float = 3.0,
+        min_rms: float = 300.0,
+        hangover_blocks: int = 5,
+        preroll_blocks: int = 2,
+        noise_adapt_rate: float = 0.05,
+    ):
+        """
+        初始化检测器
+
+        Args:
+            threshold_ratio: RMS 超过噪声底的倍数时判定为语音
+            min_rms: 判定为语音的最低 RMS（16 位采样），避免安静环境下噪声底过低导致误触发
+            hangover_blocks: 语音结束后继续发送的块数，保证句尾不被截断、识别服务能检测到句子结束
+            preroll_blocks: 语音开始前补发的块数，保证句首不被截断
+            noise_adapt_rate: 非语音时噪声底的更新速率
+        """
+        self.threshold_ratio = threshold_ratio
+        self.min_rms = min_rms
+        self.hangover_blocks = hangover_blocks
+        self.noise_adapt_rate = noise_adapt_rate
+        self.noise_floor = min_rms / threshold_ratio
+        self.speaking = False
+        self.sent_blocks = 0
+        self.dropped_blocks = 0
+        self._hangover = 0
+        self._preroll: deque = deque(maxlen=preroll_blocks)
+
+    def is_speech(self, block: bytes) -> bool:
+        """
+        判断一个音频块是否为语音，并在非语音时更新噪声底
+
+        Args:
+            block: 16 位单声道 PCM 数据
+
+        Returns:
+            是否为语音
+        """
+        samples = np.frombuffer(block, dtype=np.int16).astype(np.float32)
+        rms = float(np.sqrt(np.mean(samples * samples))) if samples.size else 0.0
+        speech = rms > max(self.min_rms, self.noise_floor * self.threshold_ratio)
+        if not speech:
+            self.noise_floor += self.noise_adapt_rate * (rms - self.noise_floor)
+        return speech
+
+    def process(self, block: bytes) -> List[bytes]:
+        """
+        输入一个音频块
+
+        Args:
+            block: 16 位单声道 PCM 数据
+
+        Returns:
+            需要发送给识别服务的音频块（可能为空，也可能包含补发的前置缓冲）
+        """
+        if self.is_speech(block):
+            frames = list(self._preroll) if not self.speaking else []
+            self._preroll.clear()
+            frames.append(block)
+            self.speaking = True
+            self._hangover = self.hangover_blocks
+        elif self.speaking and self._hangover > 0:
+            self._hangover -= 1
+            frames = [block]
+            if self._hangover == 0:
+                self.speaking = False
+        else:
+            self.speaking = False
+            self._preroll.append(block)
+            self.dropped_blocks += 1
+            return []
+
+        self.sent_blocks += len(frames)
+        return frames
+
+    def reset(self):
+        """清除当前的语音状态（如暂停识别后重新开始时）"""
+        self.speaking = False
+        self._hangover = 0
+        self._preroll.clear()